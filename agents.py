@@ -1,3 +1,5 @@
+import time
+
 from data import CUSTOMERS
 from sanction import create_sanction_letter
 from verification_agent import (
@@ -12,6 +14,7 @@ from verification_agent import (
 from sales_agent import (
     greet_start,
     ask_loan_amount,
+    pre_approved_offer,
     ask_tenure,
     confirmation_message,
     ask_guest_name,
@@ -19,253 +22,409 @@ from sales_agent import (
     ask_guest_credit_score,
 )
 from underwriting_agent import assess
-from storage import add_customer
-from llm import is_configured, generate_chat_reply
+import offers
+from offers import counter_offer, offer_message
+from amortization import MAX_TENURE_MONTHS, schedule
+from customers import add_customer
+from llm import is_configured, agenerate_chat_reply, astream_chat_reply
+from executors import run_io, run_pdf
+import eventlog
+import metrics
+import ratelimit
+import sanction_queue
+from state_machine import StateMachine, goto, stay, parse_int
+
+
+def schedule_summary(principal, tenure, annual_rate, rows=3):
+    """Short text payment schedule: the first and last few instalments plus totals."""
+    plan = schedule(principal, tenure, annual_rate)
+    months = len(plan["month"])
+    shown = sorted(set(range(min(rows, months))) | set(range(max(0, months - rows), months)))
+    lines = [f"Payment schedule for ₹{principal:,} over {tenure} months at {annual_rate}% p.a. (EMI ₹{plan['emi']:,.0f}):"]
+    for prev, i in zip([-1] + shown, shown):
+        if i != prev + 1:
+            lines.append("  ...")
+        lines.append(
+            f"  Month {int(plan['month'][i])}: interest ₹{plan['interest'][i]:,.0f}, "
+            f"principal ₹{plan['principal'][i]:,.0f}, balance ₹{plan['balance'][i]:,.0f}"
+        )
+    lines.append(f"Total interest: ₹{plan['total_interest']:,.0f}; total payable: ₹{principal + plan['total_interest']:,.0f}.")
+    return "\n".join(lines)
 
 
-def master_agent(message, session):
+async def master_agent(message, session):
     """Master orchestrator that delegates to worker agents.
 
+    Blocking worker calls (storage, PDF rendering) are awaited on bounded executors
+    and the LLM is called through its async client, so a turn never blocks the event loop.
+
     session is a dict holding conversation state. Steps:
       START -> PHONE -> LOAN_AMOUNT -> TENURE -> UNDERWRITE -> END
+    Each step is a handler registered on `MACHINE` below.
     """
-    step = session.get("step", "START")
-
-    # If user asks for an explanation (why), return last stored reason when available
-    if message and message.strip().lower() in ("why", "why?", "explain", "reason", "what happened"):
-        if session.get("last_reason"):
-            return f"Reason: {session.get('last_reason')}"
-        return "Could you clarify which part you'd like explained?"
-
-    # START: greet and ask for phone
-    if step == "START":
-        session["step"] = "PHONE"
-        return greet_start()
-
-    # PHONE: verify customer exists, accept guest-id, or start guest flow
-    if step == "PHONE":
-        entry = message.strip()
-        if entry.lower() == "guest":
-            # start guest onboarding
-            session["step"] = "GUEST_NAME"
-            return ask_guest_name()
-
-        # if user provided a guest id, load guest and ask to associate a phone
-        if entry.startswith("guest-"):
-            guest = get_guest(entry)
-            if not guest:
-                return "Guest id not found. Please re-enter a registered phone number or type 'guest' to create a new guest."
-            session["guest_id"] = entry
-            session["customer"] = guest
-            session["step"] = "ASSOC_PHONE"
-            return "Please enter your phone number to associate with this guest id."
-
-        # treat entry as phone number
-        phone = entry
-
-        # check if phone is already associated with an approved guest
-        other_id, other = find_guest_by_phone(phone)
-        if other and other.get("approved"):
-            return "This phone number has already been used for an approved loan. Please contact support if this is your number."
-
-        # check registered customers
-        customer = verify_phone(phone)
-        if customer:
-            session["phone"] = phone
-            session["customer"] = customer
-            session["step"] = "LOAN_AMOUNT"
-            return ask_loan_amount(customer.get("name"))
-
-        # if phone belongs to an unapproved guest, load that guest
-        if other:
-            session["phone"] = phone
-            session["customer"] = other
-            session["guest_id"] = other_id
-            session["step"] = "LOAN_AMOUNT"
-            return ask_loan_amount(other.get("name"))
-
-        # unknown phone
-        return "Customer not found. Please re-enter a registered phone number or type 'guest' to continue as guest."
-
-    # ASSOC_PHONE: associate provided phone to an existing guest id
-    if step == "ASSOC_PHONE":
-        phone = message.strip()
-        # ensure phone not already associated with an approved guest
-        other_id, other = find_guest_by_phone(phone)
-        if other and other.get("approved"):
-            return "This phone number has already been used for an approved loan. Please provide a different phone number."
-
-        gid = session.get("guest_id")
-        if not gid:
-            session["step"] = "PHONE"
-            return "Guest id missing. Please enter your phone number or guest id."
-
-        ok = associate_guest_phone(gid, phone)
-        if not ok:
-            return "Unable to associate phone with guest id (it may be used). Please enter a different phone."
+    return await MACHINE.dispatch(message, session)
+
+
+MACHINE = StateMachine(initial="START", fallback="Thank you.")
+
+STEP_SECONDS = metrics.histogram("loanbot_step_seconds", "Time spent handling one turn, by conversation step.", ("step",))
+DECISIONS = metrics.counter("loanbot_decisions_total", "Underwriting decisions.", ("decision",))
+APPROVALS = metrics.counter("loanbot_approvals_total", "Approved loans by customer type.", ("customer_type",))
+APPROVED_AMOUNT = metrics.counter("loanbot_approved_amount_total", "Sum of approved loan amounts (INR).", ("customer_type",))
+MACHINE.observe(lambda step, seconds: STEP_SECONDS.observe(seconds, step))
+MACHINE.listen(eventlog.record)
+
+_WHY = frozenset(("why", "why?", "explain", "reason", "what happened"))
+
+
+def _is_why(message):
+    return bool(message) and message.strip().lower() in _WHY
+
+
+parse_salary = parse_int("Please enter your monthly salary as a number, e.g. 40000", strip_commas=True)
+parse_credit_score = parse_int("Please enter an approximate numeric credit score, e.g. 650")
+parse_amount = parse_int("Please enter the loan amount as a number, e.g. 300000", strip_commas=True)
+parse_tenure = parse_int("Please enter loan tenure in months as a number, e.g. 24", minimum=1, maximum=MAX_TENURE_MONTHS)
+
+
+# If user asks for an explanation (why), return last stored reason when available
+@MACHINE.intercept("WHY", _is_why)
+async def explain(session, message):
+    if session.get("last_reason"):
+        trace = (session.get("last_details") or {}).get("trace")
+        if trace:
+            checks = "\n".join(f"- {check}" for check in trace)
+            return stay(f"Reason: {session.get('last_reason')}\n\nRule checks:\n{checks}")
+        return stay(f"Reason: {session.get('last_reason')}")
+    return stay("Could you clarify which part you'd like explained?")
 
+
+# START: greet and ask for phone
+@MACHINE.step("START", to=("PHONE",))
+async def start(session, message):
+    return goto("PHONE", greet_start())
+
+
+def _backoff_message(wait):
+    return f"Too many attempts. Please wait {wait} seconds and try again."
+
+
+# PHONE: verify customer exists, accept guest-id, or start guest flow
+@MACHINE.step("PHONE", to=("GUEST_NAME", "ASSOC_PHONE", "LOAN_AMOUNT"))
+async def phone_step(session, message):
+    entry = message.strip()
+    if entry.lower() == "guest":
+        # start guest onboarding
+        return goto("GUEST_NAME", ask_guest_name())
+
+    # every phone / guest id costs a lookup token for this session and client
+    wait = await ratelimit.lookup_backoff()
+    if wait:
+        return stay(_backoff_message(wait) + " You can also type 'guest' to continue as guest.")
+
+    # if user provided a guest id, load guest and ask to associate a phone
+    if entry.startswith("guest-"):
+        guest = await run_io(get_guest, entry)
+        if not guest:
+            return stay("Guest id not found. Please re-enter a registered phone number or type 'guest' to create a new guest.")
+        session["guest_id"] = entry
+        session["customer"] = guest
+        return goto("ASSOC_PHONE", "Please enter your phone number to associate with this guest id.")
+
+    # treat entry as phone number
+    phone = entry
+
+    # check if phone is already associated with an approved guest
+    other_id, other = await run_io(find_guest_by_phone, phone)
+    if other and other.get("approved"):
+        return stay("This phone number has already been used for an approved loan. Please contact support if this is your number.")
+
+    # check registered customers
+    customer = await run_io(verify_phone, phone)
+    if customer:
         session["phone"] = phone
-        # update in-memory customer too
-        customer = session.get("customer", {})
-        customer["associated_phone"] = phone
         session["customer"] = customer
-        session["step"] = "LOAN_AMOUNT"
-        return ask_loan_amount(customer.get("name"))
-
-    # GUEST_NAME: collect name
-    if step == "GUEST_NAME":
-        name = message.strip()
-        if not name:
-            return ask_guest_name()
-        session.setdefault("customer", {})["name"] = name
-        session["step"] = "GUEST_SALARY"
-        return ask_guest_salary()
-
-    # GUEST_SALARY: collect salary
-    if step == "GUEST_SALARY":
-        try:
-            salary = int(message.replace(",", ""))
-        except Exception:
-            return "Please enter your monthly salary as a number, e.g. 40000"
-        session.setdefault("customer", {})["salary"] = salary
-        session["step"] = "GUEST_CREDIT_SCORE"
-        return ask_guest_credit_score()
-
-    # GUEST_CREDIT_SCORE: collect credit score and continue
-    if step == "GUEST_CREDIT_SCORE":
-        try:
-            credit = int(message)
-        except Exception:
-            return "Please enter an approximate numeric credit score, e.g. 650"
-        # set defaults for guest preapproved limit based on salary so guests can get offers
-        session.setdefault("customer", {})["credit_score"] = credit
-        salary = session.setdefault("customer", {}).get("salary")
-        if salary:
-            # assign a demo pre-approved limit proportional to salary (e.g., 6x monthly salary)
-            preapproved = int(salary * 6)
+        # precomputed in the background at startup, so this is a dict probe
+        envelope = offers.envelope(phone)
+        best = envelope.best() if envelope else None
+        offer = pre_approved_offer(customer.get("preapproved_limit") or 0, best) if best else None
+        return goto("LOAN_AMOUNT", ask_loan_amount(customer.get("name"), offer))
+
+    # if phone belongs to an unapproved guest, load that guest
+    if other:
+        session["phone"] = phone
+        session["customer"] = other
+        session["guest_id"] = other_id
+        return goto("LOAN_AMOUNT", ask_loan_amount(other.get("name")))
+
+    # unknown phone
+    return stay("Customer not found. Please re-enter a registered phone number or type 'guest' to continue as guest.")
+
+
+# ASSOC_PHONE: associate provided phone to an existing guest id
+@MACHINE.step("ASSOC_PHONE", to=("PHONE", "LOAN_AMOUNT"))
+async def assoc_phone(session, message):
+    phone = message.strip()
+    wait = await ratelimit.lookup_backoff()
+    if wait:
+        return stay(_backoff_message(wait))
+    # ensure phone not already associated with an approved guest
+    other_id, other = await run_io(find_guest_by_phone, phone)
+    if other and other.get("approved"):
+        return stay("This phone number has already been used for an approved loan. Please provide a different phone number.")
+
+    gid = session.get("guest_id")
+    if not gid:
+        return goto("PHONE", "Guest id missing. Please enter your phone number or guest id.")
+
+    ok = await run_io(associate_guest_phone, gid, phone)
+    if not ok:
+        return stay("Unable to associate phone with guest id (it may be used). Please enter a different phone.")
+
+    session["phone"] = phone
+    # update in-memory customer too
+    customer = session.get("customer", {})
+    customer["associated_phone"] = phone
+    session["customer"] = customer
+    return goto("LOAN_AMOUNT", ask_loan_amount(customer.get("name")))
+
+
+# GUEST_NAME: collect name
+@MACHINE.step("GUEST_NAME", to=("GUEST_SALARY",))
+async def guest_name(session, message):
+    name = message.strip()
+    if not name:
+        return stay(ask_guest_name())
+    session.setdefault("customer", {})["name"] = name
+    return goto("GUEST_SALARY", ask_guest_salary())
+
+
+# GUEST_SALARY: collect salary
+@MACHINE.step("GUEST_SALARY", parse=parse_salary, to=("GUEST_CREDIT_SCORE",))
+async def guest_salary(session, salary):
+    session.setdefault("customer", {})["salary"] = salary
+    return goto("GUEST_CREDIT_SCORE", ask_guest_credit_score())
+
+
+# GUEST_CREDIT_SCORE: collect credit score and continue
+@MACHINE.step("GUEST_CREDIT_SCORE", parse=parse_credit_score, to=("LOAN_AMOUNT",))
+async def guest_credit_score(session, credit):
+    # set defaults for guest preapproved limit based on salary so guests can get offers
+    customer = session.setdefault("customer", {})
+    customer["credit_score"] = credit
+    salary = customer.get("salary")
+    # assign a demo pre-approved limit proportional to salary (e.g., 6x monthly salary)
+    preapproved = int(salary * 6) if salary else 0
+    customer["preapproved_limit"] = preapproved
+
+    # persist guest and store guest id in session
+    guest_id = await run_io(persist_guest, customer.copy())
+    if guest_id is None:
+        return stay("Sorry, we could not save your details right now. Please enter your credit score again to retry.")
+    session["guest_id"] = guest_id
+
+    return goto(
+        "LOAN_AMOUNT",
+        ask_loan_amount(customer.get("name"))
+        + f"\n\nNote: your details were saved as guest id {guest_id}. Your demo pre-approved limit is ₹{preapproved:,}.",
+    )
+
+
+# LOAN_AMOUNT: capture loan amount
+@MACHINE.step("LOAN_AMOUNT", parse=parse_amount, to=("TENURE",))
+async def loan_amount(session, amount):
+    session["loan_amount"] = amount
+    return goto("TENURE", ask_tenure())
+
+
+# TENURE: capture tenure and run underwriting
+@MACHINE.step("TENURE", parse=parse_tenure, to=("POST", "END"))
+async def tenure_step(session, tenure):
+    session["tenure"] = tenure
+
+    # Prepare underwriting inputs
+    customer = session.get("customer")
+    if not customer:
+        return goto("END", "Customer data missing. Cannot proceed.")
+
+    # assess returns (decision, reason, details)
+    decision, reason, details = assess(
+        customer.get("credit_score", 0),
+        session.get("loan_amount", 0),
+        customer.get("preapproved_limit", 0),
+        customer.get("salary", 0),
+        tenure,
+    )
+
+    # store last decision, reason and details for later explanation
+    session["last_decision"] = decision
+    session["last_reason"] = reason
+    session["last_details"] = details
+    DECISIONS.inc(decision)
+
+    if decision != "APPROVED":
+        # include brief reason in rejection message and keep reason in session for follow-up;
+        # offer the largest amounts the rules would approve instead of leaving the customer to guess
+        envelope = offers.envelope(session["phone"]) if session.get("phone") and not session.get("guest_id") else None
+        if envelope:
+            offer = envelope.counter_offer(session.get("loan_amount", 0), tenure)
         else:
-            preapproved = 0
-        session.setdefault("customer", {})["preapproved_limit"] = preapproved
-
-        # persist guest to guests.json and store guest id in session
-        guest_profile = session.get("customer", {}).copy()
-        guest_id = persist_guest(guest_profile)
-        session["guest_id"] = guest_id
-
-        session["step"] = "LOAN_AMOUNT"
-        return (
-            ask_loan_amount(session["customer"].get("name"))
-            + f"\n\nNote: your details were saved as guest id {guest_id}. Your demo pre-approved limit is ₹{preapproved:,}."
+            offer = counter_offer(
+                customer.get("credit_score", 0),
+                session.get("loan_amount", 0),
+                customer.get("preapproved_limit", 0),
+                customer.get("salary", 0),
+                tenure,
+            )
+        alternatives = ""
+        if offer:
+            details["counter_offer"] = offer
+            alternatives = "\n\n" + offer_message(offer, session.get("loan_amount", 0))
+        return goto(
+            "POST",
+            f"Sorry, based on underwriting rules your loan cannot be approved at this time.\n\n{reason}{alternatives}\n\nIs there anything else I can help you with? (type 'restart' to apply again)",
         )
 
-    # LOAN_AMOUNT: capture loan amount
-    if step == "LOAN_AMOUNT":
+    # queue the sanction letter for background rendering; main.chat adds the
+    # file link to the response once the job is done
+    letter = dict(
+        name=customer.get("name"),
+        amount=session["loan_amount"],
+        tenure=tenure,
+        salary=customer.get("salary"),
+        preapproved_limit=customer.get("preapproved_limit"),
+        credit_score=customer.get("credit_score"),
+        guest_id=session.get("guest_id"),
+        annual_rate=details.get("annual_rate", 12.0),
+    )
+    customer_type = "guest" if session.get("guest_id") else "registered"
+    APPROVALS.inc(customer_type)
+    APPROVED_AMOUNT.inc(customer_type, amount=session["loan_amount"])
+    try:
+        session["sanction_job"] = await sanction_queue.submit(**letter)
+    except sanction_queue.QueueFull:
+        # renderer backlog is full: render inline rather than drop the letter
+        session["last_file"] = await run_pdf(create_sanction_letter, **letter)
+    # if guest, mark guest as approved and associate phone
+    if session.get("guest_id"):
         try:
-            amount = int(message.replace(",", ""))
+            await run_io(mark_guest_approved, session.get("guest_id"), session.get("phone"))
         except Exception:
-            return "Please enter the loan amount as a number, e.g. 300000"
-
-        session["loan_amount"] = amount
-        session["step"] = "TENURE"
-        return ask_tenure()
-
-    # TENURE: capture tenure and run underwriting
-    if step == "TENURE":
+            pass
+    # persist approved customer so phone cannot be reused and for future lookups
+    try:
+        if session.get("phone"):
+            await run_io(add_customer, session.get("phone"), {
+                "name": customer.get("name"),
+                "salary": customer.get("salary"),
+                "preapproved_limit": customer.get("preapproved_limit"),
+                "credit_score": customer.get("credit_score"),
+            })
+    except Exception:
+        pass
+
+    return goto(
+        "POST",
+        confirmation_message(customer.get("name"), session["loan_amount"], tenure)
+        + "\n\nCongratulations! Your loan is approved and your sanction letter is being generated.\n\nIs there anything else I can help you with? (type 'restart' to apply again)",
+    )
+
+
+# POST: after a flow completes, a lightweight chat mode
+@MACHINE.step("POST", to=("PHONE",))
+async def post_chat(session, message):
+    text = (message or "").strip()
+    command = _post_command(text, session)
+    if command is not None:
+        return command
+    # If OpenAI is configured, prefer using it for a richer reply.
+    if is_configured():
         try:
-            tenure = int(message)
+            reply = await agenerate_chat_reply(text, _llm_context(session))
+            if reply:
+                return stay(reply)
         except Exception:
-            return "Please enter loan tenure in months as a number, e.g. 24"
-
-        session["tenure"] = tenure
-
-        # Prepare underwriting inputs
-        customer = session.get("customer")
-        if not customer:
-            session["step"] = "END"
-            return "Customer data missing. Cannot proceed."
-
-        # assess returns (decision, reason, details)
-        decision, reason, details = assess(
-            customer.get("credit_score", 0),
-            session.get("loan_amount", 0),
-            customer.get("preapproved_limit", 0),
-            customer.get("salary", 0),
-        )
+            pass
+    return stay(_post_fallback(message, session))
 
-        # store last decision, reason and details for later explanation
-        session["last_decision"] = decision
-        session["last_reason"] = reason
-        session["last_details"] = details
 
-        if decision == "APPROVED":
-            # generate sanction letter and store filename in session
-            file_name = create_sanction_letter(
-                customer.get("name"),
-                session["loan_amount"],
-                tenure,
-                salary=customer.get("salary"),
-                preapproved_limit=customer.get("preapproved_limit"),
-                credit_score=customer.get("credit_score"),
-                guest_id=session.get("guest_id"),
-            )
-            session["last_file"] = file_name
-            # if guest, mark guest as approved and associate phone
-            if session.get("guest_id"):
-                try:
-                    mark_guest_approved(session.get("guest_id"), session.get("phone"))
-                except Exception:
-                    pass
-            # persist approved customer so phone cannot be reused and for future lookups
-            try:
-                if session.get("phone"):
-                    add_customer(session.get("phone"), {
-                        "name": customer.get("name"),
-                        "salary": customer.get("salary"),
-                        "preapproved_limit": customer.get("preapproved_limit"),
-                        "credit_score": customer.get("credit_score"),
-                    })
-            except Exception:
-                pass
-
-            session["step"] = "POST"
-            return (
-                confirmation_message(customer.get("name"), session["loan_amount"], tenure)
-                + "\n\nCongratulations! Your loan is approved and a sanction letter has been generated.\n\nIs there anything else I can help you with? (type 'restart' to apply again)"
-            )
+@MACHINE.step("END")
+async def end(session, message):
+    return stay("Thank you.")
 
-        session["step"] = "POST"
-        # include brief reason in rejection message and keep reason in session for follow-up
-        return f"Sorry, based on underwriting rules your loan cannot be approved at this time.\n\n{reason}\n\nIs there anything else I can help you with? (type 'restart' to apply again)"
-
-    # POST: after a flow completes, a lightweight chat mode
-    if step == "POST":
-        text = (message or "").strip()
-        if not text:
-            return "Is there anything else I can help you with? Type 'restart' to start a new loan application."
-        if text.lower() in ("restart", "new", "apply"):
-            session.clear()
-            session["step"] = "PHONE"
-            return "Sure — let's start again. Please enter your phone number or type 'guest' to continue as guest."
-        # If OpenAI is configured, prefer using it for a richer reply.
-        if is_configured():
-            try:
-                reply = generate_chat_reply(text, {"last_reason": session.get("last_reason"), "last_details": session.get("last_details")})
-                if reply:
-                    return reply
-            except Exception:
-                pass
-
-        # Basic helpful responses (demo fallback)
-        low = text.lower()
-        if "interest" in low or "emi" in low:
-            details = session.get("last_details") or {}
-            emi = details.get("emi")
-            if emi:
-                return f"Your estimated EMI was ₹{int(emi):,} per month. I can show a payment schedule if you want."
-            return "EMI depends on principal, tenure and interest rate. Provide those and I can estimate."
-        if "help" in low or "support" in low:
-            return "I can help with loan applications, explain decisions, or generate sanction letters. Type 'restart' to start a new loan application."
-        # fallback echo-like response
-        return f"You asked: '{message}'. I can help with loan applications — type 'restart' to begin a new one."
-
-    return "Thank you."
+
+MACHINE.compile()
+
+
+def _llm_context(session):
+    return {"last_reason": session.get("last_reason"), "last_details": session.get("last_details")}
+
+
+def _post_command(text, session):
+    """POST-mode turns that never go to the LLM (empty input, restart, schedule), else None."""
+    if not text:
+        return stay("Is there anything else I can help you with? Type 'restart' to start a new loan application.")
+    if text.lower() in ("restart", "new", "apply"):
+        session.clear()
+        return goto("PHONE", "Sure — let's start again. Please enter your phone number or type 'guest' to continue as guest.")
+    # Payment schedules come from the amortization engine, not the LLM
+    if "schedule" in text.lower():
+        details = session.get("last_details") or {}
+        if details.get("loan_amount") and details.get("tenure"):
+            return stay(schedule_summary(details["loan_amount"], details["tenure"], details.get("annual_rate", 12.0)))
+        return stay("Apply for a loan first and I can show its payment schedule. Type 'restart' to begin.")
+    return None
+
+
+def _post_fallback(message, session):
+    """Rule-based POST replies, used when the LLM is not configured or unavailable."""
+    # Basic helpful responses (demo fallback)
+    low = (message or "").strip().lower()
+    if "interest" in low or "emi" in low:
+        details = session.get("last_details") or {}
+        emi = details.get("emi")
+        if emi:
+            return f"Your estimated EMI was ₹{int(emi):,} per month. I can show a payment schedule if you want."
+        return "EMI depends on principal, tenure and interest rate. Provide those and I can estimate."
+    if "help" in low or "support" in low:
+        return "I can help with loan applications, explain decisions, or generate sanction letters. Type 'restart' to start a new loan application."
+    # fallback echo-like response
+    return f"You asked: '{message}'. I can help with loan applications — type 'restart' to begin a new one."
+
+
+async def stream_master_agent(message, session):
+    """Like `master_agent`, but yields the reply in chunks.
+
+    Free-form questions in POST mode are streamed token by token from the LLM;
+    if it is not configured or fails before producing anything, the rule-based
+    POST reply is yielded instead. Every other turn yields `master_agent`'s reply
+    as a single chunk.
+    """
+    if session.get("step") == "POST" and not _is_why(message):
+        started = time.perf_counter()
+        try:
+            async for chunk in _stream_post(message, session):
+                yield chunk
+        finally:
+            MACHINE.record("POST", time.perf_counter() - started)
+        to = session.get("step")
+        MACHINE.notify(session, "POST", message, to if to != "POST" else None)
+        return
+    yield await master_agent(message, session)
+
+
+async def _stream_post(message, session):
+    text = (message or "").strip()
+    command = _post_command(text, session)
+    if command is not None:
+        if command.to:
+            session["step"] = command.to
+        yield command.reply
+        return
+    streamed = False
+    if is_configured():
+        async for chunk in astream_chat_reply(text, _llm_context(session)):
+            streamed = True
+            yield chunk
+    if not streamed:
+        yield _post_fallback(message, session)
@@ -0,0 +1,168 @@
+"""Loan amortization: EMI, repayment schedules, prepayment and total interest.
+
+Shared by underwriting (`rules`), the sanction letter and the `/schedule` endpoint
+so every EMI shown to a customer comes from the same formula:
+
+    EMI = P * r * (1+r)^n / ((1+r)^n - 1),  r = annual_rate / 12 / 100
+
+The rate factor is computed as the equivalent `r / (1 - (1+r)^-n)`, which cannot
+overflow for long tenures; it depends only on (rate, tenure), which take few
+distinct values, so scalar lookups are memoized. Schedules are computed
+in closed form with NumPy instead of a month-by-month loop.
+"""
+from functools import lru_cache
+
+import numpy as np
+
+# longest tenure accepted from customers and `/schedule` (40 years); schedules hold one row per month
+MAX_TENURE_MONTHS = 480
+# largest rate (percent per year) and principal `/schedule` accepts; schedule totals stay finite below them
+MAX_ANNUAL_RATE = 100.0
+MAX_PRINCIPAL = 1e12
+
+
+@lru_cache(maxsize=4096)
+def rate_factor(annual_rate: float, months: int) -> float:
+    """EMI per unit of principal for `months` at `annual_rate` percent (0 if months <= 0)."""
+    if months <= 0:
+        return 0.0
+    r = annual_rate / 12.0 / 100.0
+    if r == 0:
+        return 1.0 / months
+    return r / (1 - (1 + r) ** -months)
+
+
+def emi(principal, months, annual_rate):
+    """Monthly instalment for a loan of `principal` over `months` at `annual_rate` percent."""
+    return principal * rate_factor(float(annual_rate), int(months))
+
+
+def emi_array(principal, months, annual_rate):
+    """Vectorized `emi`: any argument may be an array; the result broadcasts like NumPy arithmetic."""
+    principal = np.asarray(principal, dtype=float)
+    months = np.asarray(months, dtype=float)
+    r = np.asarray(annual_rate, dtype=float) / 12.0 / 100.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        factor = np.where(r == 0, 1.0 / months, r / (1 - (1 + r) ** -months))
+        return np.where(months > 0, principal * factor, 0.0)
+
+
+def total_interest(principal, months, annual_rate):
+    return emi(principal, months, annual_rate) * months - principal
+
+
+def _balances(principal, payment, r, k):
+    """Outstanding balance after k payments (k may be an array)."""
+    if r == 0:
+        return principal - payment * k
+    growth = (1 + r) ** k
+    return principal * growth - payment * (growth - 1) / r
+
+
+def schedule(principal, months, annual_rate, prepayments=None):
+    """Month-by-month repayment schedule as NumPy arrays.
+
+    `prepayments` maps month number (1-based) to an extra lump sum paid with that
+    month's instalment; the EMI stays the same and the tenure shortens. Returns a
+    dict with `month`, `payment`, `interest`, `principal`, `prepayment` and
+    `balance` arrays plus `emi` and `total_interest`.
+    """
+    months = int(months)
+    payment = emi(principal, months, annual_rate)
+    r = annual_rate / 12.0 / 100.0
+    prepayments = {m: a for m, a in (prepayments or {}).items() if 0 < m <= months and a > 0}
+    if not prepayments and months > 0:
+        return _plain_schedule(float(principal), months, payment, r)
+
+    columns = {k: [] for k in ("month", "payment", "interest", "principal", "prepayment", "balance")}
+    balance = float(principal)
+    start = 0
+    # closed form between prepayments: each segment is a plain annuity on the opening balance
+    for stop in sorted(prepayments) + [months]:
+        if balance <= 0 or stop <= start:
+            continue
+        k = np.arange(1, stop - start + 1)
+        closing = _balances(balance, payment, r, k)
+        opening = np.concatenate(([balance], closing[:-1]))
+        interest = opening * r
+        paid = np.full(len(k), payment)
+        # the final instalment only needs to clear what is left
+        last = np.flatnonzero(closing <= 1e-6)
+        if len(last):
+            end = last[0] + 1
+            k, opening, interest, paid = k[:end], opening[:end], interest[:end], paid[:end]
+            paid[-1] = opening[-1] + interest[-1]
+            closing = np.zeros(end)
+            closing[:-1] = _balances(balance, payment, r, k[:-1])
+        extra = np.zeros(len(k))
+        if stop in prepayments and len(k) == stop - start:
+            extra[-1] = min(prepayments[stop], max(closing[-1], 0.0))
+            closing[-1] -= extra[-1]
+        columns["month"].append(k + start)
+        columns["payment"].append(paid)
+        columns["interest"].append(interest)
+        columns["principal"].append(paid - interest)
+        columns["prepayment"].append(extra)
+        columns["balance"].append(np.maximum(closing, 0.0))
+        balance = float(closing[-1])
+        start = stop
+
+    result = {name: np.concatenate(parts) if parts else np.zeros(0) for name, parts in columns.items()}
+    result["emi"] = payment
+    result["total_interest"] = float(result["interest"].sum())
+    return result
+
+
+def _plain_schedule(principal, months, payment, r):
+    """`schedule` without prepayments: one closed-form pass, no segment bookkeeping."""
+    k = np.arange(1, months + 1)
+    closing = _balances(principal, payment, r, k)
+    closing[-1] = 0.0
+    opening = np.empty(months)
+    opening[0] = principal
+    opening[1:] = closing[:-1]
+    interest = opening * r
+    paid = np.full(months, payment)
+    # the final instalment clears the remaining balance exactly
+    paid[-1] = opening[-1] + interest[-1]
+    return {
+        "month": k,
+        "payment": paid,
+        "interest": interest,
+        "principal": paid - interest,
+        "prepayment": np.zeros(months),
+        "balance": np.maximum(closing, 0.0),
+        "emi": payment,
+        "total_interest": float(interest.sum()),
+    }
+
+
+def schedules(principals, months, annual_rate):
+    """Balances for many loans sharing one tenure and rate, as a (loans x months) array.
+
+    Returns (emi, interest, balance) where `emi` has one entry per loan and
+    `interest` / `balance` have one row per loan.
+    """
+    principals = np.asarray(principals, dtype=float)
+    months = int(months)
+    r = annual_rate / 12.0 / 100.0
+    payments = principals * rate_factor(float(annual_rate), months)
+    k = np.arange(1, months + 1)
+    if r == 0:
+        closing = principals[:, None] - payments[:, None] * k
+    else:
+        growth = (1 + r) ** k
+        closing = principals[:, None] * growth - payments[:, None] * ((growth - 1) / r)
+    opening = np.concatenate((principals[:, None], closing[:, :-1]), axis=1)
+    return payments, opening * r, np.maximum(closing, 0.0)
+
+
+def prepayment_savings(principal, months, annual_rate, amount, at_month):
+    """Interest saved and months cut by prepaying `amount` with instalment `at_month`."""
+    base = schedule(principal, months, annual_rate)
+    with_prepay = schedule(principal, months, annual_rate, {at_month: amount})
+    return {
+        "interest_saved": base["total_interest"] - with_prepay["total_interest"],
+        "months_saved": len(base["month"]) - len(with_prepay["month"]),
+        "new_tenure": len(with_prepay["month"]),
+    }
@@ -0,0 +1,222 @@
+"""Customer directory: every known customer in memory, keyed by phone.
+
+The static `data.CUSTOMERS` and the customers persisted in storage are merged
+into one dict at startup (`load`), each record a slotted `Customer`, so a
+lookup is a dict probe. A phone that is not in the directory is checked in
+storage once (another worker may have added it since we loaded) and then
+remembered as a miss for `CUSTOMER_MISS_TTL` seconds in a bounded LRU of
+`CUSTOMER_MISS_MAX` phones; repeated typos and probing never reach the database.
+`add_customer` writes through to storage and clears the phone's miss entry.
+The demo customers take precedence over stored records for the same phone in
+every path (`load`, `refresh`, `add_customer`, `update`).
+
+Records other processes write (another worker's `add_customer`, an import) are
+picked up by `refresh`, which reads the rows changed since the last one it saw
+(storage numbers every customer write); the app runs it every
+`CUSTOMER_REFRESH_SECONDS` (default 5), so a directory is at most that stale.
+Callbacks registered with `on_change` hear about every phone whose record
+changed (None after a full reload), e.g. to drop derived caches.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import metrics
+import storage
+
+MISS_TTL = float(os.environ.get("CUSTOMER_MISS_TTL", "60"))
+MISS_MAX = int(os.environ.get("CUSTOMER_MISS_MAX", "100000"))
+REFRESH_SECONDS = float(os.environ.get("CUSTOMER_REFRESH_SECONDS", "5"))
+
+_FIELDS = frozenset(("name", "salary", "preapproved_limit", "credit_score"))
+
+
+@dataclass(slots=True)
+class Customer:
+    name: str = None
+    salary: int = None
+    preapproved_limit: int = None
+    credit_score: int = None
+    # any other stored keys, kept so nothing is dropped on the way back out
+    extra: dict = None
+
+    @classmethod
+    def from_dict(cls, record: dict):
+        get = record.get
+        extra = None if record.keys() <= _FIELDS else {k: v for k, v in record.items() if k not in _FIELDS}
+        return cls(get("name"), get("salary"), get("preapproved_limit"), get("credit_score"), extra)
+
+    def to_dict(self) -> dict:
+        record = {
+            "name": self.name,
+            "salary": self.salary,
+            "preapproved_limit": self.preapproved_limit,
+            "credit_score": self.credit_score,
+        }
+        if self.extra:
+            record.update(self.extra)
+        return record
+
+
+_customers = {}
+# phone -> expiry (monotonic); oldest first
+_misses = OrderedDict()
+_lock = threading.Lock()
+_loaded = False
+# position in storage's customer changes the directory is current with (see storage.customers_changed_since)
+_position = (0, None)
+_stats = {"hits": 0, "misses": 0, "negative_hits": 0, "storage_lookups": 0, "refreshed": 0}
+_listeners = []
+
+
+def on_change(callback):
+    """Call `callback(phones)` after customers change; `phones` is None when all may have."""
+    _listeners.append(callback)
+    return callback
+
+
+def _changed(phones):
+    for callback in _listeners:
+        callback(phones)
+
+
+def load():
+    """(Re)build the directory from storage and `data.CUSTOMERS`; returns the customer count."""
+    global _customers, _loaded, _position
+    from data import CUSTOMERS
+
+    # read first: rows written while we load are picked up (again) by the next refresh
+    version = storage.customers_version()
+    customers = {phone: Customer.from_dict(rec) for phone, rec in storage.iter_customers()}
+    # the built-in demo customers take precedence, as they always have
+    customers.update((phone, Customer.from_dict(rec)) for phone, rec in CUSTOMERS.items())
+    with _lock:
+        _customers = customers
+        _misses.clear()
+        _loaded = True
+        _position = (version, None)
+    _changed(None)
+    return len(customers)
+
+
+def _cached_miss(phone, now):
+    with _lock:
+        expires = _misses.get(phone)
+        if expires is None:
+            return False
+        if expires <= now:
+            del _misses[phone]
+            return False
+        return True
+
+
+def _remember_miss(phone, now):
+    with _lock:
+        _misses[phone] = now + MISS_TTL
+        _misses.move_to_end(phone)
+        while len(_misses) > MISS_MAX:
+            _misses.popitem(last=False)
+
+
+def lookup(phone: str):
+    """The `Customer` for `phone`, or None if no such customer exists."""
+    if not _loaded:
+        load()
+    customer = _customers.get(phone)
+    if customer is not None:
+        _stats["hits"] += 1
+        return customer
+    now = time.monotonic()
+    if _cached_miss(phone, now):
+        _stats["negative_hits"] += 1
+        return None
+    _stats["storage_lookups"] += 1
+    record = storage.get_customer(phone)
+    if record is None:
+        _stats["misses"] += 1
+        _remember_miss(phone, now)
+        return None
+    customer = _customers[phone] = Customer.from_dict(record)
+    _stats["hits"] += 1
+    return customer
+
+
+def add_customer(phone: str, record: dict):
+    """Persist a customer and make it visible to lookups right away (unless it is a demo customer)."""
+    storage.add_customer(phone, record)
+    update(((phone, record),))
+    return True
+
+
+def update(items):
+    """Make customers already written to storage ((phone, record) pairs) visible to lookups.
+
+    The built-in demo customers keep precedence, as in load() and refresh(): every
+    worker shows the same record for a phone, whichever one did the write.
+    """
+    from data import CUSTOMERS
+
+    phones = []
+    with _lock:
+        for phone, record in items:
+            if phone in CUSTOMERS:
+                continue
+            if _loaded:
+                _customers[phone] = Customer.from_dict(record)
+            _misses.pop(phone, None)
+            phones.append(phone)
+    if phones:
+        _changed(phones)
+
+
+def refresh() -> int:
+    """Apply customers written to storage since the last load/refresh (by any process); returns how many."""
+    global _position
+    from data import CUSTOMERS
+
+    if not _loaded:
+        load()
+        return 0
+    refreshed = 0
+    while True:
+        position, rows = storage.customers_changed_since(_position)
+        if not rows:
+            return refreshed
+        # the built-in demo customers keep precedence, as in load()
+        rows = [(phone, record) for phone, record in rows if phone not in CUSTOMERS]
+        with _lock:
+            for phone, record in rows:
+                _customers[phone] = Customer.from_dict(record)
+                _misses.pop(phone, None)
+            _position = position
+        _stats["refreshed"] += len(rows)
+        refreshed += len(rows)
+        if rows:
+            _changed([phone for phone, _ in rows])
+
+
+def items():
+    """(phone, Customer) pairs for every customer in the directory."""
+    if not _loaded:
+        load()
+    with _lock:
+        return list(_customers.items())
+
+
+def stats() -> dict:
+    return {"customers": len(_customers), "cached_misses": len(_misses), **_stats}
+
+
+@metrics.collector
+def _directory_metrics():
+    s = stats()
+    return [
+        ("loanbot_customers", "gauge", "Customers in the in-memory directory.", {(): s["customers"]}),
+        ("loanbot_customer_lookups_total", "counter", "Customer directory lookups by result.", {
+            (("result", "hit"),): s["hits"],
+            (("result", "miss"),): s["misses"],
+            (("result", "cached_miss"),): s["negative_hits"],
+        }),
+    ]
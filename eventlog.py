@@ -0,0 +1,420 @@
+"""Append-only log of conversation turns, for crash recovery and analytics.
+
+Every turn the state machine handles for a `/chat` request becomes one JSON line:
+
+    {"t": 1718000000123, "s": "<session id>", "step": "TENURE", "in": 24, "to": "POST",
+     "decision": "APPROVED", "set": {"step": "POST", "tenure": 24, ...}, "unset": [...]}
+
+`in` is the parsed input, `to` the step moved to (absent if it stayed), `ok: 0`
+marks input the step rejected, `decision` is set on underwriting turns, and
+`set` / `unset` hold the session fields the turn changed (`full: 1` when `set`
+is the whole session, on the first event for a session in a process).
+
+- Group commit: `record` only queues the turn; a writer thread writes whatever
+  has queued every `EVENT_LOG_FLUSH_MS` in one write (and one fsync with
+  `EVENT_LOG_FSYNC`). A crash loses at most that window.
+- Workers: each process writing the log locks a slot directory of its own,
+  `<EVENT_LOG_DIR>/worker-<k>/` (the lowest free k), so `uvicorn --workers N`
+  processes never share a file; a restarted worker takes a free slot again.
+- Segments: `events-<n>.log` in the slot, rolled over at `EVENT_LOG_SEGMENT_MB`
+  and gzipped once closed. Each process start opens a new segment, so a torn
+  last line can only end a segment.
+- Snapshots: every `EVENT_LOG_SNAPSHOT_EVERY` events the writer stores all live
+  sessions with the log position (`snapshot-<n>-<offset>.json.gz`, the newest
+  two are kept). `recover()` loads each slot's newest one, replays only its
+  tail, and keeps the latest state of every session across slots.
+
+`python tools/funnel_stats.py events/` streams a log (all slots, merged by
+time) into funnel statistics.
+"""
+import contextvars
+import gzip
+import heapq
+import json
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import metrics
+from sessions import decode, encode
+
+ENABLED = os.environ.get("EVENT_LOG", "on").lower() not in ("0", "off", "false", "no")
+LOG_DIR = os.environ.get("EVENT_LOG_DIR", "events")
+FLUSH_MS = float(os.environ.get("EVENT_LOG_FLUSH_MS", "20"))
+FSYNC = os.environ.get("EVENT_LOG_FSYNC", "1").lower() not in ("0", "off", "false", "no")
+SEGMENT_BYTES = int(float(os.environ.get("EVENT_LOG_SEGMENT_MB", "64")) * 1024 * 1024)
+SNAPSHOT_EVERY = int(os.environ.get("EVENT_LOG_SNAPSHOT_EVERY", "10000"))
+# sessions idle longer than this are left out of snapshots and recovery
+SESSION_TTL = float(os.environ.get("SESSION_TTL", "1800"))
+MAX_INPUT = 200
+
+EVENTS = metrics.counter("loanbot_events_total", "Conversation events written to the event log.")
+GROUP_SECONDS = metrics.histogram("loanbot_event_commit_seconds", "Time to write (and fsync) one group of events.")
+
+logger = logging.getLogger(__name__)
+
+_SEGMENT = re.compile(r"^events-(\d+)\.log(\.gz)?$")
+_SNAPSHOT = re.compile(r"^snapshot-(\d+)-(\d+)\.json\.gz$")
+_SLOT = re.compile(r"^worker-(\d+)$")
+
+# session id of the request being handled
+_conversation = contextvars.ContextVar("event_log_session", default=None)
+
+
+@contextmanager
+def conversation(session_id):
+    """Log the turns handled inside the block under `session_id`."""
+    token = _conversation.set(session_id)
+    try:
+        yield
+    finally:
+        _conversation.reset(token)
+
+
+def record(session, step, value, to, valid=True):
+    """State machine listener: queue one turn of the current conversation."""
+    session_id = _conversation.get()
+    if session_id is None or not ENABLED:
+        return
+    if isinstance(value, str) and len(value) > MAX_INPUT:
+        value = value[:MAX_INPUT]
+    decision = session.get("last_decision") if step == "TENURE" and valid and to else None
+    # the session is mutable, so its state is captured now; diffing happens on the writer thread
+    _writer().put((int(time.time() * 1000), session_id, step, value, to, valid, decision, encode(session)))
+
+
+def _try_lock(f) -> bool:
+    """Take an exclusive, non-blocking lock on open file `f`; held until it is closed (or the process exits)."""
+    try:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def _claim_slot(root):
+    """(slot directory, open lock file) for the lowest `worker-<k>` under `root` no other process holds."""
+    k = 0
+    while True:
+        slot = os.path.join(root, f"worker-{k}")
+        os.makedirs(slot, exist_ok=True)
+        lock = open(os.path.join(slot, ".lock"), "a+b")
+        if _try_lock(lock):
+            return slot, lock
+        lock.close()
+        k += 1
+
+
+class _Writer:
+    def __init__(self, root, live=None):
+        self.dir, self._lock_file = _claim_slot(root)
+        self._pending = []
+        self._cond = threading.Condition()
+        self._closed = False
+        # events queued / handled so far, for flush()
+        self._queued = self._done = 0
+        # session id -> (last event ms, session dict) as of the last written event
+        self.live = dict(live or {})
+        self.since_snapshot = 0
+        for name in os.listdir(self.dir):
+            if name.endswith(".tmp"):
+                # a snapshot or gzip cut short by a crash
+                os.remove(os.path.join(self.dir, name))
+        segments = [n for n, _ in _segments(self.dir)]
+        self.segment = (max(segments) + 1) if segments else 1
+        self._open()
+        if self.live:
+            # recovered sessions (possibly from other slots) become this slot's base for its diffs
+            self.snapshot()
+        self._thread = threading.Thread(target=self._run, name="eventlog", daemon=True)
+        self._thread.start()
+
+    def _path(self, n):
+        return os.path.join(self.dir, f"events-{n:06d}.log")
+
+    def _open(self):
+        self.file = open(self._path(self.segment), "ab")
+        self.offset = self.file.tell()
+
+    def put(self, event):
+        with self._cond:
+            self._pending.append(event)
+            self._queued += 1
+            if len(self._pending) == 1:
+                self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending and self._closed:
+                    return
+            # let a group build up behind the first event
+            time.sleep(FLUSH_MS / 1000)
+            with self._cond:
+                batch, self._pending = self._pending, []
+            try:
+                self._commit(batch)
+            except Exception:
+                logger.exception("event log write failed; %d events dropped", len(batch))
+            with self._cond:
+                self._done += len(batch)
+
+    def _commit(self, batch):
+        started = time.perf_counter()
+        lines = [self._line(event) for event in batch]
+        data = b"".join(lines)
+        self.file.write(data)
+        self.file.flush()
+        if FSYNC:
+            os.fsync(self.file.fileno())
+        self.offset += len(data)
+        EVENTS.inc(amount=len(batch))
+        GROUP_SECONDS.observe(time.perf_counter() - started)
+        self.since_snapshot += len(batch)
+        if self.offset >= SEGMENT_BYTES:
+            self._roll()
+        if self.since_snapshot >= SNAPSHOT_EVERY:
+            self.snapshot()
+
+    def _line(self, event):
+        t, session_id, step, value, to, valid, decision, state = event
+        session = decode(state)
+        previous = self.live.get(session_id)
+        out = {"t": t, "s": session_id, "step": step, "in": value}
+        if to:
+            out["to"] = to
+        if not valid:
+            out["ok"] = 0
+        if decision:
+            out["decision"] = decision
+        if previous is None:
+            out["full"] = 1
+            out["set"] = session
+        else:
+            before = previous[1]
+            changed = {k: v for k, v in session.items() if before.get(k, _MISSING) != v}
+            removed = [k for k in before if k not in session]
+            if changed:
+                out["set"] = changed
+            if removed:
+                out["unset"] = removed
+        self.live[session_id] = (t, session)
+        return (json.dumps(out, ensure_ascii=False, separators=(",", ":"), default=str) + "\n").encode("utf-8")
+
+    def _roll(self):
+        self.file.close()
+        closed = self._path(self.segment)
+        self.segment += 1
+        self._open()
+        _gzip_file(closed)
+
+    def snapshot(self):
+        """Write the live sessions with the current log position; drops idle sessions first."""
+        cutoff = time.time() * 1000 - SESSION_TTL * 1000
+        self.live = {sid: entry for sid, entry in self.live.items() if entry[0] >= cutoff}
+        name = f"snapshot-{self.segment:06d}-{self.offset:012d}.json.gz"
+        path = os.path.join(self.dir, name)
+        with gzip.open(path + ".tmp", "wt", encoding="utf-8") as f:
+            json.dump({"segment": self.segment, "offset": self.offset,
+                       "sessions": {sid: [t, s] for sid, (t, s) in self.live.items()}}, f, default=str)
+        os.replace(path + ".tmp", path)
+        for old in _snapshots(self.dir)[:-2]:
+            os.remove(os.path.join(self.dir, old[2]))
+        self.since_snapshot = 0
+
+    def flush(self, timeout=5.0):
+        """Wait until everything queued so far is written."""
+        with self._cond:
+            target = self._queued
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._cond:
+                if self._done >= target:
+                    break
+            time.sleep(FLUSH_MS / 1000)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout=5)
+        self.file.close()
+        if self.offset == 0:
+            # nothing was logged this run
+            os.remove(self._path(self.segment))
+        elif self.since_snapshot:
+            # a clean shutdown leaves nothing to replay
+            self.snapshot()
+        self._lock_file.close()
+
+
+_MISSING = object()
+_instance = None
+_instance_lock = threading.Lock()
+
+
+def _writer(live=None):
+    global _instance
+    if _instance is None:
+        with _instance_lock:
+            if _instance is None:
+                _instance = _Writer(LOG_DIR, live)
+    return _instance
+
+
+def _gzip_file(path):
+    with open(path, "rb") as src, gzip.open(path + ".gz.tmp", "wb") as dst:
+        while True:
+            chunk = src.read(1 << 20)
+            if not chunk:
+                break
+            dst.write(chunk)
+    os.replace(path + ".gz.tmp", path + ".gz")
+    os.remove(path)
+
+
+def _segments(log_dir):
+    """[(number, file name)] of the log segments in `log_dir`, oldest first."""
+    found = []
+    for name in os.listdir(log_dir) if os.path.isdir(log_dir) else ():
+        m = _SEGMENT.match(name)
+        if m:
+            found.append((int(m.group(1)), name))
+    return sorted(found)
+
+
+def _snapshots(log_dir):
+    found = []
+    for name in os.listdir(log_dir) if os.path.isdir(log_dir) else ():
+        m = _SNAPSHOT.match(name)
+        if m:
+            found.append((int(m.group(1)), int(m.group(2)), name))
+    return sorted(found)
+
+
+def _log_dirs(root):
+    """Directories under `root` holding segments: the slots, and `root` itself (single-writer layout)."""
+    if not os.path.isdir(root):
+        return []
+    slots = sorted((int(m.group(1)), name) for name in os.listdir(root) if (m := _SLOT.match(name)))
+    return [root] + [os.path.join(root, name) for _, name in slots]
+
+
+def _read_files(files, start=None):
+    """Events of [(segment number, path)], oldest first; `start` = (segment, offset) skips what is before it."""
+    for n, path in files:
+        if start and n < start[0]:
+            continue
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rb") as f:
+            if start and n == start[0]:
+                f.seek(start[1])
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    break
+
+
+def _dir_files(log_dir):
+    return [(n, os.path.join(log_dir, name)) for n, name in _segments(log_dir)]
+
+
+def read_events(paths, start=None):
+    """Stream events from log directories or segment files.
+
+    A directory's slots are merged by event time; files are read in the order
+    given. `start` = (segment number, byte offset) skips everything before that
+    position (only meaningful for a single slot directory). A torn last line ends
+    its segment.
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            streams = [_read_files(_dir_files(d), start) for d in _log_dirs(path)]
+            yield from heapq.merge(*streams, key=lambda event: event["t"])
+        else:
+            m = _SEGMENT.match(os.path.basename(path))
+            yield from _read_files([(int(m.group(1)) if m else 0, path)])
+
+
+def apply(sessions, event):
+    """Apply one event's session changes to `sessions` ({id: [last event ms, session]})."""
+    sid = event["s"]
+    entry = sessions.get(sid)
+    if entry is None or event.get("full"):
+        entry = sessions[sid] = [event["t"], {}]
+        if event.get("full"):
+            entry[1] = dict(event.get("set") or {})
+    else:
+        entry[1].update(event.get("set") or {})
+    for key in event.get("unset") or ():
+        entry[1].pop(key, None)
+    entry[0] = event["t"]
+
+
+def _recover_dir(log_dir):
+    """{session id: [last event ms, session]} from one directory: its newest snapshot plus the events after it."""
+    sessions, start = {}, None
+    snaps = _snapshots(log_dir)
+    if snaps:
+        segment, offset, name = snaps[-1]
+        with gzip.open(os.path.join(log_dir, name), "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        sessions = {sid: [t, s] for sid, (t, s) in data["sessions"].items()}
+        start = (segment, offset)
+    for event in _read_files(_dir_files(log_dir), start):
+        apply(sessions, event)
+    return sessions
+
+
+def recover(log_dir=None, max_idle=None):
+    """Sessions as of the end of the log, over all slots (the latest state of each session wins).
+
+    Returns {session id: session} for sessions active within `max_idle` seconds
+    (default SESSION_TTL). When this process writes the log, they also become its
+    live set, so its snapshots keep them.
+    """
+    log_dir = log_dir or LOG_DIR
+    max_idle = SESSION_TTL if max_idle is None else max_idle
+    sessions = {}
+    for d in _log_dirs(log_dir):
+        for sid, entry in _recover_dir(d).items():
+            if sid not in sessions or entry[0] > sessions[sid][0]:
+                sessions[sid] = entry
+    cutoff = time.time() * 1000 - max_idle * 1000
+    live = {sid: (t, s) for sid, (t, s) in sessions.items() if t >= cutoff}
+    if ENABLED and log_dir == LOG_DIR:
+        if _instance is None:
+            _writer(live)
+        else:
+            for sid, entry in live.items():
+                _instance.live.setdefault(sid, entry)
+    return {sid: s for sid, (t, s) in live.items()}
+
+
+def flush(timeout=5.0):
+    """Wait until the events recorded so far are written."""
+    if _instance is not None:
+        _instance.flush(timeout)
+
+
+def close():
+    """Write what is queued, snapshot and close the log (app shutdown)."""
+    global _instance
+    if _instance is not None:
+        _instance.close()
+        _instance = None
@@ -0,0 +1,60 @@
+"""Bounded executors for blocking work called from the async request path.
+
+Storage calls (SQLite) and PDF rendering (ReportLab) are synchronous; the agents
+await them through these helpers so the event loop keeps serving other sessions.
+Each pool has a fixed number of threads and a cap on queued submissions, so a
+burst of traffic waits for a slot instead of piling up unbounded work.
+
+Pool sizes can be tuned with `IO_WORKERS` and `PDF_WORKERS`. The time a call
+waits before a thread picks it up is exported as `loanbot_executor_wait_seconds{pool}`.
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+IO_WORKERS = int(os.environ.get("IO_WORKERS", "8"))
+PDF_WORKERS = int(os.environ.get("PDF_WORKERS", "2"))
+
+WAIT_SECONDS = metrics.histogram("loanbot_executor_wait_seconds", "Time from submission until a pool thread starts the call.", ("pool",))
+
+
+class _BoundedPool:
+    def __init__(self, name, workers, max_pending):
+        self.name = name
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self.max_pending = max_pending
+        self._slots = None
+
+    def _semaphore(self):
+        # created lazily so it binds to the running event loop
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        return self._slots
+
+    async def run(self, fn, *args, **kwargs):
+        submitted = time.perf_counter()
+
+        def call():
+            WAIT_SECONDS.observe(time.perf_counter() - submitted, self.name)
+            return fn(*args, **kwargs)
+
+        async with self._semaphore():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, call)
+
+
+_io_pool = _BoundedPool("io", IO_WORKERS, IO_WORKERS * 4)
+_pdf_pool = _BoundedPool("pdf", PDF_WORKERS, PDF_WORKERS * 4)
+
+
+async def run_io(fn, *args, **kwargs):
+    """Run a blocking storage call on the I/O pool."""
+    return await _io_pool.run(fn, *args, **kwargs)
+
+
+async def run_pdf(fn, *args, **kwargs):
+    """Run a PDF rendering call on the PDF pool."""
+    return await _pdf_pool.run(fn, *args, **kwargs)
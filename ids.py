@@ -0,0 +1,95 @@
+"""Unique, time-ordered ids (Snowflake layout) for records created by any worker.
+
+An id is a 63-bit integer: milliseconds since 2024-01-01 (41 bits), a worker id
+(10 bits) and a per-millisecond sequence (12 bits), written as 11 fixed-width
+base62 characters. Ids from one process are strictly increasing, and since the
+alphabet is in ASCII order, string order is creation order across workers too.
+
+The worker id comes from `WORKER_ID` (0-1023); without it the process id is
+used, which keeps uvicorn workers on one host apart. Stores should still insert
+new ids without overwriting (see `storage.insert_guest`), so a duplicated worker
+id shows up as a retry instead of lost data.
+"""
+import os
+import threading
+import time
+
+EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+MAX_WORKER = (1 << WORKER_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+WIDTH = 11  # 62**11 > 2**63
+
+
+def _default_worker_id():
+    env = os.environ.get("WORKER_ID")
+    if env:
+        worker = int(env)
+        if not 0 <= worker <= MAX_WORKER:
+            raise ValueError(f"WORKER_ID must be between 0 and {MAX_WORKER}")
+        return worker
+    return os.getpid() & MAX_WORKER
+
+
+class IdGenerator:
+    """Thread-safe id source for one worker."""
+
+    def __init__(self, worker_id=None):
+        self.worker_id = _default_worker_id() if worker_id is None else worker_id
+        self._last_ms = -1
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def next_int(self) -> int:
+        with self._lock:
+            now = int(time.time() * 1000) - EPOCH_MS
+            if now > self._last_ms:
+                self._last_ms, self._sequence = now, 0
+            else:
+                # same millisecond, or the clock stepped back: stay on the last
+                # millisecond and move into the next one when the sequence runs out
+                self._sequence = (self._sequence + 1) & MAX_SEQUENCE
+                if self._sequence == 0:
+                    self._last_ms += 1
+            return (self._last_ms << (WORKER_BITS + SEQUENCE_BITS)) | (self.worker_id << SEQUENCE_BITS) | self._sequence
+
+
+def encode(n: int) -> str:
+    chars = []
+    for _ in range(WIDTH):
+        n, r = divmod(n, 62)
+        chars.append(ALPHABET[r])
+    return "".join(reversed(chars))
+
+
+def decode(text: str) -> dict:
+    """Parts of an id (with or without a `prefix-`): creation time in unix ms, worker and sequence."""
+    n = 0
+    for ch in text.rsplit("-", 1)[-1]:
+        n = n * 62 + ALPHABET.index(ch)
+    return {
+        "unix_ms": (n >> (WORKER_BITS + SEQUENCE_BITS)) + EPOCH_MS,
+        "worker": (n >> SEQUENCE_BITS) & MAX_WORKER,
+        "sequence": n & MAX_SEQUENCE,
+    }
+
+
+_generator = IdGenerator()
+
+
+def _reset_after_fork():
+    global _generator
+    _generator = IdGenerator()
+
+
+if hasattr(os, "register_at_fork"):
+    # a forked worker gets its own pid, so its own worker id
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def new_id(prefix: str = "") -> str:
+    """A new id, e.g. `new_id("guest-")` -> `guest-0RL6ozh5CtM`."""
+    return prefix + encode(_generator.next_int())
@@ -0,0 +1,236 @@
+"""Bulk import of pre-approved customers from CSV or JSONL files.
+
+The input is read as a stream (plain or `.gz`), one batch of `IMPORT_BATCH_ROWS`
+rows at a time, so memory stays flat however large the file is. Each row needs
+`phone`, `name`, `salary`, `preapproved_limit` and `credit_score`; rows that
+fail validation are counted and, if asked, written to a rejects file with the
+reason. Valid rows are upserted into the customer store, and each batch commits
+together with a checkpoint (input byte offset and counters) keyed by a
+fingerprint of the file. Running the same file again resumes after the last
+committed batch, or does nothing if it already finished.
+
+    python tools/import_customers.py drop.csv.gz --rejects rejects.jsonl
+
+The app accepts the same files at `POST /customers/import` (see main.py; it needs
+IMPORT_TOKEN).
+"""
+import csv
+import gzip
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+from collections import OrderedDict
+
+import customers
+import storage
+
+BATCH_ROWS = int(os.environ.get("IMPORT_BATCH_ROWS", "5000"))
+MAX_JOBS = 100
+
+FIELDS = ("phone", "name", "salary", "preapproved_limit", "credit_score")
+_PHONE = re.compile(r"^\d{10}$")
+
+JOBS = OrderedDict()
+
+
+class ImportFormatError(ValueError):
+    """The file cannot be imported at all (unknown format, missing columns)."""
+
+
+def detect_format(path: str) -> str:
+    name = path[:-3] if path.endswith(".gz") else path
+    ext = os.path.splitext(name)[1].lower()
+    if ext == ".csv":
+        return "csv"
+    if ext in (".jsonl", ".ndjson", ".json"):
+        return "jsonl"
+    raise ImportFormatError(f"cannot tell the format of {path}; pass csv or jsonl")
+
+
+def _open(path):
+    with open(path, "rb") as f:
+        gzipped = f.read(2) == b"\x1f\x8b"
+    return gzip.open(path, "rb") if gzipped else open(path, "rb")
+
+
+def fingerprint(path: str) -> str:
+    """Id of the file's content, from its size and first and last megabyte."""
+    size = os.path.getsize(path)
+    h = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(path, "rb") as f:
+        h.update(f.read(1 << 20))
+        if size > 2 << 20:
+            f.seek(-(1 << 20), os.SEEK_END)
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def validate(record: dict):
+    """(phone, customer record) for a valid row; raises ValueError with the reason otherwise."""
+    phone = str(record.get("phone") or "").strip()
+    if not _PHONE.match(phone):
+        raise ValueError("phone must be 10 digits")
+    name = str(record.get("name") or "").strip()
+    if not name:
+        raise ValueError("name is required")
+    values = {}
+    for field in ("salary", "preapproved_limit", "credit_score"):
+        raw = record.get(field)
+        try:
+            value = int(str(raw).replace(",", "").strip())
+        except (TypeError, ValueError):
+            raise ValueError(f"{field} must be a whole number, got {raw!r}")
+        if value < 0:
+            raise ValueError(f"{field} must not be negative")
+        values[field] = value
+    if not 300 <= values["credit_score"] <= 900:
+        raise ValueError("credit_score must be between 300 and 900")
+    return phone, {"name": name, **values}
+
+
+def _records(f, fmt, offset, position):
+    """Yield raw rows (dict, or an error string) starting at byte `offset`.
+
+    `position[0]` is kept at the offset just past the last line handed to the
+    parser, so after a row it is where the next row starts.
+    """
+    header = None
+    if fmt == "csv":
+        first = f.readline()
+        header = next(csv.reader([first.decode("utf-8-sig")]))
+        header = [h.strip().lower() for h in header]
+        missing = [c for c in FIELDS if c not in header]
+        if missing:
+            raise ImportFormatError(f"missing columns: {', '.join(missing)}")
+        offset = max(offset, len(first))
+    f.seek(offset)
+    position[0] = offset
+
+    def lines():
+        for raw in f:
+            position[0] += len(raw)
+            yield raw.decode("utf-8")
+
+    if fmt == "csv":
+        for row in csv.reader(lines()):
+            if not row:
+                continue
+            yield dict(zip(header, row)) if len(row) == len(header) else f"expected {len(header)} columns, got {len(row)}"
+        return
+    for line in lines():
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield f"invalid JSON: {e}"
+            continue
+        yield record if isinstance(record, dict) else "expected a JSON object"
+
+
+def import_file(path: str, fmt: str = None, batch_rows: int = None, progress=None, rejects=None,
+                name: str = None, restart: bool = False) -> dict:
+    """Import customers from `path`; returns the final counters.
+
+    `progress(stats)` is called after every committed batch. `rejects` is an
+    open text file that receives one JSON line per rejected row. `restart`
+    ignores an earlier checkpoint for the same file.
+    """
+    fmt = fmt or detect_format(name or path)
+    batch_rows = batch_rows or BATCH_ROWS
+    source_id = fingerprint(path)
+    if restart:
+        storage.delete_import_checkpoint(source_id)
+    state = storage.get_import_checkpoint(source_id) or {
+        "source_id": source_id, "name": name or os.path.basename(path), "offset": 0,
+        "rows": 0, "imported": 0, "rejected": 0, "done": 0,
+    }
+    total = os.path.getsize(path)
+    started, start_rows = time.perf_counter(), state["rows"]
+
+    def stats():
+        elapsed = time.perf_counter() - started
+        return dict(state, elapsed_s=round(elapsed, 3), file_bytes=total,
+                    rows_per_s=round((state["rows"] - start_rows) / elapsed, 1) if elapsed else 0.0)
+
+    if state["done"]:
+        return dict(stats(), resumed=True, already_done=True)
+    resumed = state["offset"] > 0
+    position = [state["offset"]]
+    batch, rejected = [], []
+
+    def commit(done=False):
+        state.update(offset=position[0], done=int(done), updated_at=time.time())
+        storage.import_customers(batch, state)
+        customers.update(batch)
+        batch.clear()
+        # rejects go out once their batch is committed, so a resumed run does not repeat them
+        if rejects is not None and rejected:
+            rejects.writelines(rejected)
+            rejects.flush()
+        rejected.clear()
+        if progress:
+            progress(stats())
+
+    with _open(path) as f:
+        for raw in _records(f, fmt, state["offset"], position):
+            state["rows"] += 1
+            try:
+                if isinstance(raw, str):
+                    raise ValueError(raw)
+                batch.append(validate(raw))
+                state["imported"] += 1
+            except ValueError as e:
+                state["rejected"] += 1
+                if rejects is not None:
+                    rejected.append(json.dumps({"row": state["rows"], "error": str(e), "data": raw}, ensure_ascii=False, default=str) + "\n")
+            if state["rows"] % batch_rows == 0:
+                commit()
+        commit(done=True)
+    return dict(stats(), resumed=resumed)
+
+
+def _record_job(job_id, **fields):
+    job = JOBS.setdefault(job_id, {"job_id": job_id})
+    job.update(fields)
+    while len(JOBS) > MAX_JOBS:
+        JOBS.popitem(last=False)
+    return job
+
+
+def new_job(name: str) -> str:
+    job_id = uuid.uuid4().hex
+    _record_job(job_id, name=name, status="receiving")
+    return job_id
+
+
+def spooled(job_id: str, size: int):
+    """Mark an upload as fully received and waiting to be imported."""
+    return _record_job(job_id, status="queued", upload_bytes=size)
+
+
+def upload_failed(job_id: str, error: str):
+    """Mark an upload that was not fully received (too large, client went away)."""
+    return _record_job(job_id, status="failed", error=error)
+
+
+def run_job(job_id: str, path: str, fmt: str = None, name: str = None):
+    """Import an uploaded file for job `job_id`, keeping its status current; deletes the file when done."""
+    _record_job(job_id, status="running")
+    try:
+        result = import_file(path, fmt=fmt, name=name, progress=lambda stats: _record_job(job_id, **stats))
+        _record_job(job_id, status="done", **result)
+    except Exception as e:
+        _record_job(job_id, status="failed", error=str(e))
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def get_job(job_id: str):
+    return JOBS.get(job_id)
@@ -3,64 +3,264 @@
 Usage:
  - Set environment variable `OPENAI_API_KEY` before running the app.
  - The wrapper will return None if OpenAI is not available or not configured.
+ - `agenerate_chat_reply` is the async variant used by the `/chat` request path;
+   `generate_chat_reply` remains for scripts and other synchronous callers.
+ - `astream_chat_reply` yields the reply incrementally for `/chat/stream`.
+ - `OPENAI_BASE_URL` (read by the SDK) points the client at another server, e.g.
+   `tools/fake_openai_server.py` for local testing.
+ - Replies are cached on the normalized question plus decision context, and
+   concurrent identical questions share one call (see `llm_cache.py`);
+   `LLM_CACHE_TTL` / `LLM_CACHE_MAX_ENTRIES` tune it, 0 disables it.
+ - Upstream calls go through `llm_client.py`: pooled connections, deadlines,
+   bounded concurrency, jittered retries and a circuit breaker. When the circuit
+   is open the functions here return None at once and the caller falls back.
+ - `set_clients` swaps in stub clients so the cache can be exercised offline.
+ - Reply time (cache hits included), upstream call time and streaming time to
+   first chunk are exported as `loanbot_llm_seconds{op}`, together with cache
+   and circuit breaker gauges.
 """
 import os
 import logging
+import time
+from importlib.util import find_spec
 
-try:
-    import openai
-    OPENAI_AVAILABLE = True
-except Exception:
-    openai = None
-    OPENAI_AVAILABLE = False
+import llm_client
+import metrics
+from llm_cache import ReplyCache, fingerprint
+
+# the SDK itself is imported by llm_client on the first call (it is the slowest import in the app)
+OPENAI_AVAILABLE = find_spec("openai") is not None
 
 logger = logging.getLogger(__name__)
 
+SYSTEM_PROMPT = (
+    "You are a helpful, concise financial assistant for a personal loan application system. "
+    "Answer user questions politely, explain decisions briefly, and offer next steps. "
+    "Do not produce PII or store data. If you are unsure, ask a clarifying question."
+)
+
+# clients are created once and reused so their HTTP connection pools are shared across calls
+_client = None
+_async_client = None
+# True once stub clients were installed with `set_clients`
+_injected = False
+
+_cache = ReplyCache(
+    max_entries=int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "1024")),
+    ttl=float(os.environ.get("LLM_CACHE_TTL", "600")),
+)
+
+LLM_SECONDS = metrics.histogram("loanbot_llm_seconds", "LLM reply time by operation.", ("op",))
+
 
 def is_configured():
-    return OPENAI_AVAILABLE and bool(os.environ.get("OPENAI_API_KEY"))
+    return _injected or (OPENAI_AVAILABLE and bool(os.environ.get("OPENAI_API_KEY")))
+
+
+def set_clients(client=None, async_client=None):
+    """Use the given OpenAI-compatible clients instead of real ones (e.g. stubs in tools/).
+
+    Passing nothing restores the default clients built from OPENAI_API_KEY. The
+    reply cache is cleared either way.
+    """
+    global _client, _async_client, _injected
+    _client = client
+    _async_client = async_client
+    _injected = client is not None or async_client is not None
+    _cache.clear()
+
+
+def cache_stats() -> dict:
+    """Reply cache size and hit/miss/coalesced/eviction counters."""
+    return _cache.stats()
+
+
+def client_stats() -> dict:
+    """Upstream call counters, concurrency and circuit breaker state."""
+    return llm_client.stats()
+
+
+@metrics.collector
+def _llm_metrics():
+    cache = _cache.stats()
+    client = llm_client.stats()
+    breaker = client["breaker"]
+    return [
+        ("loanbot_llm_cache_entries", "gauge", "Replies in the LLM reply cache.", {(): cache["size"]}),
+        ("loanbot_llm_cache_lookups_total", "counter", "LLM reply cache lookups by result.", {
+            (("result", "hit"),): cache["hits"],
+            (("result", "miss"),): cache["misses"] - cache["coalesced"],
+            (("result", "coalesced"),): cache["coalesced"],
+        }),
+        ("loanbot_llm_upstream_total", "counter", "Upstream LLM call outcomes.", {
+            (("event", name),): client[name] for name in ("calls", "retries", "timeouts", "failures", "no_slot")
+        }),
+        ("loanbot_llm_in_flight", "gauge", "Upstream LLM calls in progress.", {(): client["in_flight"]}),
+        ("loanbot_llm_breaker_state", "gauge", "1 for the circuit breaker's current state.", {
+            (("state", state),): int(breaker["state"] == state) for state in ("closed", "open", "half_open")
+        }),
+        ("loanbot_llm_breaker_opens_total", "counter", "Times the LLM circuit breaker opened.", {(): breaker["opens"]}),
+    ]
+
+
+def warm():
+    """Build the clients (and so import the SDK) before the first question; False if not configured."""
+    if not is_configured():
+        return False
+    _get_client()
+    _get_async_client()
+    return True
+
+
+def _get_client():
+    global _client
+    if _client is None:
+        _client = llm_client.make_client()
+    return _client
+
+
+def _get_async_client():
+    global _async_client
+    if _async_client is None:
+        _async_client = llm_client.make_async_client()
+    return _async_client
+
+
+def context_hint(session_context: dict | None) -> str:
+    """The session context exactly as the model sees it ("" if there is none)."""
+    if not session_context:
+        return ""
+    ctx_parts = []
+    if session_context.get("last_reason"):
+        ctx_parts.append(f"Last decision reason: {session_context.get('last_reason')}")
+    details = session_context.get("last_details")
+    if details:
+        parts = []
+        if details.get("emi") is not None:
+            parts.append(f"EMI: {int(details.get('emi'))}")
+        if details.get("preapproved_limit") is not None:
+            parts.append(f"Preapproved limit: {int(details.get('preapproved_limit'))}")
+        if parts:
+            ctx_parts.append("; ".join(parts))
+    return "Context: " + " | ".join(ctx_parts) if ctx_parts else ""
+
+
+def build_messages(user_message: str, session_context: dict | None = None) -> list:
+    """Return the chat messages for `user_message`, with session context as a system hint."""
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": user_message}]
 
+    # add context if available
+    hint = context_hint(session_context)
+    if hint:
+        messages.insert(1, {"role": "system", "content": hint})
+    return messages
 
+
+def cache_key(user_message: str, session_context: dict | None = None, model: str = "gpt-3.5-turbo") -> str:
+    """Questions that differ only in case, spacing or trailing punctuation share a key."""
+    return fingerprint(model, user_message, context_hint(session_context))
+
+
+@metrics.timed(LLM_SECONDS)
 def generate_chat_reply(user_message: str, session_context: dict | None = None, model: str = "gpt-3.5-turbo") -> str | None:
-    """Return a short assistant reply using OpenAI ChatCompletion. Returns None if not available.
+    """Return a short assistant reply using OpenAI chat completions. Returns None if not available.
 
     session_context can include last_details, last_reason, or other info to help the model.
     """
     if not is_configured():
         return None
 
-    try:
-        openai.api_key = os.environ.get("OPENAI_API_KEY")
+    messages = build_messages(user_message, session_context)
 
-        system_prompt = (
-            "You are a helpful, concise financial assistant for a personal loan application system. "
-            "Answer user questions politely, explain decisions briefly, and offer next steps. "
-            "Do not produce PII or store data. If you are unsure, ask a clarifying question."
+    def request(timeout):
+        return _get_client().chat.completions.create(
+            model=model, messages=messages, max_tokens=150, temperature=0.6, timeout=timeout
         )
 
-        # craft messages
-        messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_message}]
-
-        # add context if available
-        if session_context:
-            ctx_parts = []
-            if session_context.get("last_reason"):
-                ctx_parts.append(f"Last decision reason: {session_context.get('last_reason')}")
-            details = session_context.get("last_details")
-            if details:
-                parts = []
-                if details.get("emi") is not None:
-                    parts.append(f"EMI: {int(details.get('emi'))}")
-                if details.get("preapproved_limit") is not None:
-                    parts.append(f"Preapproved limit: {int(details.get('preapproved_limit'))}")
-                if parts:
-                    ctx_parts.append("; ".join(parts))
-            if ctx_parts:
-                messages.insert(1, {"role": "system", "content": "Context: " + " | ".join(ctx_parts)})
-
-        resp = openai.ChatCompletion.create(model=model, messages=messages, max_tokens=150, temperature=0.6)
-        text = resp["choices"][0]["message"]["content"].strip()
-        return text
-    except Exception as e:
-        logger.exception("OpenAI call failed: %s", e)
+    @metrics.timed(LLM_SECONDS, "upstream")
+    def call():
+        try:
+            return llm_client.call(request).choices[0].message.content.strip()
+        except llm_client.Unavailable as e:
+            logger.warning("OpenAI call skipped: %s", e)
+            return None
+        except Exception as e:
+            logger.exception("OpenAI call failed: %s", e)
+            return None
+
+    return _cache.get_or_call(cache_key(user_message, session_context, model), call)
+
+
+@metrics.timed(LLM_SECONDS)
+async def agenerate_chat_reply(user_message: str, session_context: dict | None = None, model: str = "gpt-3.5-turbo") -> str | None:
+    """Async variant of `generate_chat_reply`; never blocks the event loop."""
+    if not is_configured():
         return None
+
+    messages = build_messages(user_message, session_context)
+
+    def request(timeout):
+        return _get_async_client().chat.completions.create(
+            model=model, messages=messages, max_tokens=150, temperature=0.6, timeout=timeout
+        )
+
+    @metrics.timed(LLM_SECONDS, "upstream")
+    async def call():
+        try:
+            resp = await llm_client.acall(request)
+            return resp.choices[0].message.content.strip()
+        except llm_client.Unavailable as e:
+            logger.warning("OpenAI call skipped: %s", e)
+            return None
+        except Exception as e:
+            logger.exception("OpenAI call failed: %s", e)
+            return None
+
+    return await _cache.aget_or_call(cache_key(user_message, session_context, model), call)
+
+
+async def astream_chat_reply(user_message: str, session_context: dict | None = None, model: str = "gpt-3.5-turbo"):
+    """Async generator yielding reply text chunks as the model produces them.
+
+    Yields nothing if OpenAI is not configured or the call fails before the first
+    chunk, so callers can fall back to a canned reply. A cached reply is yielded
+    in one piece; a completed stream is added to the cache.
+    """
+    if not is_configured():
+        return
+
+    key = cache_key(user_message, session_context, model)
+    if _cache.enabled:
+        cached = _cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+
+    messages = build_messages(user_message, session_context)
+
+    def open_stream(timeout):
+        return _get_async_client().chat.completions.create(
+            model=model, messages=messages, max_tokens=150, temperature=0.6, stream=True, timeout=timeout
+        )
+
+    parts = []
+    started = time.perf_counter()
+    try:
+        async for chunk in llm_client.astream(open_stream):
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if not parts:
+                    LLM_SECONDS.observe(time.perf_counter() - started, "stream_first_token")
+                parts.append(delta)
+                yield delta
+    except llm_client.Unavailable as e:
+        logger.warning("OpenAI streaming call skipped: %s", e)
+        return
+    except Exception as e:
+        logger.exception("OpenAI streaming call failed: %s", e)
+        return
+    finally:
+        LLM_SECONDS.observe(time.perf_counter() - started, "stream")
+    _cache.put(key, "".join(parts).strip() or None)
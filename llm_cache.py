@@ -0,0 +1,176 @@
+"""Reply cache with single-flight coalescing for LLM calls.
+
+POST-step questions repeat a lot ("what is my EMI", "why was I rejected") with the
+same decision context, so replies are cached on a fingerprint of the model, the
+normalized question and the context the model is shown. Entries expire after a
+TTL and the least recently used entry is evicted beyond `max_entries`.
+
+Concurrent requests for a key that is not cached yet share one upstream call:
+the first caller runs it, the others wait for its result. In `stats()`, `misses`
+counts every lookup that was not cached and `coalesced` the misses that shared
+another caller's call. Failed calls (None) are handed to the waiters but not cached.
+If the caller running the call is cancelled (its client went away), the waiters
+are not: one of them runs the call instead.
+"""
+import asyncio
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+_SPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(text: str) -> str:
+    """Case, surrounding punctuation and runs of whitespace don't change the question."""
+    return _SPACE.sub(" ", (text or "").lower()).strip(" ?!.,")
+
+
+def fingerprint(model: str, prompt: str, context: str = "") -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    for part in (model, normalize_prompt(prompt), context):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class _LeaderCancelled(Exception):
+    """Set on an in-flight call whose caller was cancelled; its waiters start over."""
+
+
+class ReplyCache:
+    """LRU of reply strings with a TTL from insertion; safe to share between threads."""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # key -> (expires_at, reply); ordered least recently used first
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        # key -> asyncio.Future / (threading.Event, result list) for calls in flight
+        self._inflight = {}
+        self._sync_inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.ttl > 0
+
+    def get(self, key):
+        """Cached reply for `key`, or None. Counts a hit or a miss."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._data[key]
+                self.expirations += 1
+            self.misses += 1
+            return None
+
+    def put(self, key, reply):
+        if not self.enabled or reply is None:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, reply)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    async def aget_or_call(self, key, call):
+        """Return the cached reply for `key`, or await `call()` once for all concurrent callers."""
+        if not self.enabled:
+            return await call()
+        reply = self.get(key)
+        if reply is not None:
+            return reply
+        joined = False
+        while True:
+            pending = self._inflight.get(key)
+            if pending is None:
+                break
+            if not joined:
+                self.coalesced += 1
+                joined = True
+            try:
+                return await asyncio.shield(pending)
+            except _LeaderCancelled:
+                # the leader's client went away; the first waiter to get here takes over
+                continue
+        pending = asyncio.get_running_loop().create_future()
+        self._inflight[key] = pending
+        try:
+            reply = await call()
+            self.put(key, reply)
+            pending.set_result(reply)
+            return reply
+        except asyncio.CancelledError:
+            # only this caller was cancelled: don't hand the cancellation to the waiters
+            pending.set_exception(_LeaderCancelled())
+            pending.exception()
+            raise
+        except BaseException as e:
+            pending.set_exception(e)
+            # waiters get the error; nobody else is left to retrieve it
+            pending.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    def get_or_call(self, key, call):
+        """Blocking variant of `aget_or_call` for synchronous callers on several threads."""
+        if not self.enabled:
+            return call()
+        reply = self.get(key)
+        if reply is not None:
+            return reply
+        with self._lock:
+            pending = self._sync_inflight.get(key)
+            leader = pending is None
+            if leader:
+                pending = self._sync_inflight[key] = (threading.Event(), [])
+            else:
+                self.coalesced += 1
+        done, result = pending
+        if not leader:
+            done.wait()
+            return result[0] if result else None
+        try:
+            reply = call()
+            self.put(key, reply)
+            result.append(reply)
+            return reply
+        finally:
+            with self._lock:
+                del self._sync_inflight[key]
+            done.set()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "upstream_calls": self.misses - self.coalesced,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
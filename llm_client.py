@@ -0,0 +1,305 @@
+"""Resilient access to the OpenAI API for `llm.py`.
+
+Every upstream call goes through `acall` / `call` (or `astream` for streaming), which:
+
+- reuse one pooled HTTP client per flavour (`LLM_POOL_SIZE` connections, keep-alive);
+- bound concurrent upstream calls (`LLM_MAX_CONCURRENCY`); a caller that cannot
+  get a slot before its deadline gives up;
+- give each attempt `LLM_TIMEOUT` seconds and the whole call, retries included,
+  `LLM_DEADLINE` seconds;
+- retry timeouts, connection errors, 429 and 5xx responses up to `LLM_RETRIES`
+  times with full-jitter exponential backoff (`LLM_BACKOFF` base seconds);
+- open a circuit breaker after `LLM_BREAKER_FAILURES` consecutive failed calls.
+  While open, calls fail at once with `Unavailable`; after `LLM_BREAKER_RESET`
+  seconds one trial call decides whether it closes again.
+
+`llm.py` turns every failure into None, so `master_agent` answers from its
+rule-based POST replies instead of waiting on a struggling upstream.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+
+# imported by `load_sdk` on first use: the openai SDK alone takes most of the app's import time
+httpx = None
+openai = None
+
+TIMEOUT = float(os.environ.get("LLM_TIMEOUT", "10"))
+DEADLINE = float(os.environ.get("LLM_DEADLINE", "15"))
+RETRIES = int(os.environ.get("LLM_RETRIES", "2"))
+BACKOFF = float(os.environ.get("LLM_BACKOFF", "0.2"))
+MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "8"))
+POOL_SIZE = int(os.environ.get("LLM_POOL_SIZE", "20"))
+
+
+class Unavailable(Exception):
+    """The call was not attempted: circuit open, no free slot, or deadline already spent."""
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open -> half_open (one trial call) -> closed."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opens = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._trial_started = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            now = time.monotonic()
+            if self.state == "open" and now - self._opened_at >= self.reset_timeout:
+                self.state = "half_open"
+            # half open: one trial at a time; a trial that never reported back is replaced
+            if self.state == "half_open" and (
+                self._trial_started is None or now - self._trial_started >= self.reset_timeout
+            ):
+                self._trial_started = now
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._trial_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_started = None
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self.opens += 1
+
+    def stats(self) -> dict:
+        return {"state": self.state, "consecutive_failures": self.failures, "opens": self.opens, "rejected": self.rejected}
+
+
+breaker = CircuitBreaker(
+    failure_threshold=int(os.environ.get("LLM_BREAKER_FAILURES", "5")),
+    reset_timeout=float(os.environ.get("LLM_BREAKER_RESET", "30")),
+)
+
+_counters = {"calls": 0, "retries": 0, "timeouts": 0, "failures": 0, "no_slot": 0}
+_in_flight = 0
+_sync_slots = threading.BoundedSemaphore(MAX_CONCURRENCY)
+# asyncio primitives belong to one event loop; rebuilt if a new loop comes along (scripts, tests)
+_async_slots = None
+_async_slots_loop = None
+
+
+def load_sdk():
+    """Import the openai SDK (and httpx) if not done yet; returns the module."""
+    global httpx, openai
+    if openai is None:
+        import httpx as _httpx
+        import openai as _openai
+
+        httpx, openai = _httpx, _openai
+    return openai
+
+
+def make_client():
+    """Blocking OpenAI client on a pooled keep-alive connection; retries are done here, not by the SDK."""
+    load_sdk()
+    return openai.OpenAI(
+        api_key=os.environ.get("OPENAI_API_KEY"),
+        timeout=TIMEOUT,
+        max_retries=0,
+        http_client=openai.DefaultHttpxClient(
+            limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE)
+        ),
+    )
+
+
+def make_async_client():
+    load_sdk()
+    return openai.AsyncOpenAI(
+        api_key=os.environ.get("OPENAI_API_KEY"),
+        timeout=TIMEOUT,
+        max_retries=0,
+        http_client=openai.DefaultAsyncHttpxClient(
+            limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE)
+        ),
+    )
+
+
+def retryable(exc) -> bool:
+    """Timeouts, dropped connections, rate limiting and server errors are worth another attempt."""
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError)):
+        return True
+    if openai is None:
+        # SDK never loaded, so this cannot be one of its errors
+        return False
+    if isinstance(exc, openai.APIConnectionError):
+        return True
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code in (408, 429) or exc.status_code >= 500
+    return False
+
+
+def _is_timeout(exc):
+    return isinstance(exc, (asyncio.TimeoutError, TimeoutError)) or (
+        openai is not None and isinstance(exc, openai.APITimeoutError)
+    )
+
+
+def _backoff(attempt):
+    # full jitter: uniform in [0, base * 2^attempt)
+    return random.uniform(0, BACKOFF * (2 ** attempt))
+
+
+def _slots():
+    global _async_slots, _async_slots_loop
+    loop = asyncio.get_running_loop()
+    if _async_slots_loop is not loop:
+        _async_slots = asyncio.Semaphore(MAX_CONCURRENCY)
+        _async_slots_loop = loop
+    return _async_slots
+
+
+async def _acquire(deadline):
+    try:
+        await asyncio.wait_for(_slots().acquire(), max(deadline - time.monotonic(), 0))
+    except asyncio.TimeoutError:
+        _counters["no_slot"] += 1
+        raise Unavailable("no free LLM slot before the deadline")
+
+
+async def _attempts(request, deadline):
+    """Await `request(timeout)` until it succeeds, retrying retryable errors within `deadline`."""
+    attempt = 0
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise Unavailable("LLM deadline exceeded")
+        budget = min(TIMEOUT, remaining)
+        try:
+            return await asyncio.wait_for(request(budget), budget)
+        except Exception as e:
+            if _is_timeout(e):
+                _counters["timeouts"] += 1
+            delay = _backoff(attempt)
+            if not retryable(e) or attempt >= RETRIES or time.monotonic() + delay >= deadline:
+                raise
+            attempt += 1
+            _counters["retries"] += 1
+            await asyncio.sleep(delay)
+
+
+def _record(exc):
+    """Only upstream trouble counts against the breaker; a 4xx answer means the upstream is up."""
+    if isinstance(exc, Unavailable) or retryable(exc):
+        _counters["failures"] += 1
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+
+
+async def acall(request):
+    """Run `request(timeout)`, a coroutine function making one API call, with all the protections above."""
+    global _in_flight
+    if not breaker.allow():
+        raise Unavailable("LLM circuit open")
+    _counters["calls"] += 1
+    deadline = time.monotonic() + DEADLINE
+    await _acquire(deadline)
+    _in_flight += 1
+    try:
+        result = await _attempts(request, deadline)
+    except Exception as e:
+        _record(e)
+        raise
+    finally:
+        _in_flight -= 1
+        _slots().release()
+    breaker.record_success()
+    return result
+
+
+async def astream(open_stream):
+    """Yield chunks from `open_stream(timeout)`, an async iterable of stream events.
+
+    Opening the stream is retried like `acall`; once chunks flow there are no
+    retries, and each chunk must arrive before the overall deadline.
+    """
+    global _in_flight
+    if not breaker.allow():
+        raise Unavailable("LLM circuit open")
+    _counters["calls"] += 1
+    deadline = time.monotonic() + DEADLINE
+    await _acquire(deadline)
+    _in_flight += 1
+    stream = None
+    try:
+        stream = await _attempts(open_stream, deadline)
+        chunks = stream.__aiter__()
+        while True:
+            try:
+                chunk = await asyncio.wait_for(chunks.__anext__(), max(deadline - time.monotonic(), 0))
+            except StopAsyncIteration:
+                break
+            yield chunk
+    except Exception as e:
+        if _is_timeout(e):
+            _counters["timeouts"] += 1
+        _record(e)
+        raise
+    else:
+        breaker.record_success()
+    finally:
+        _in_flight -= 1
+        _slots().release()
+        close = getattr(stream, "close", None)
+        if close is not None:
+            await close()
+
+
+def call(request):
+    """Blocking variant of `acall`. Each attempt gets the SDK timeout; the deadline bounds retries."""
+    if not breaker.allow():
+        raise Unavailable("LLM circuit open")
+    _counters["calls"] += 1
+    deadline = time.monotonic() + DEADLINE
+    if not _sync_slots.acquire(timeout=DEADLINE):
+        _counters["no_slot"] += 1
+        raise Unavailable("no free LLM slot before the deadline")
+    try:
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    raise Unavailable("LLM deadline exceeded")
+                result = request(min(TIMEOUT, remaining))
+                break
+            except Exception as e:
+                if _is_timeout(e):
+                    _counters["timeouts"] += 1
+                delay = _backoff(attempt)
+                if not retryable(e) or attempt >= RETRIES or time.monotonic() + delay >= deadline:
+                    _record(e)
+                    raise
+                attempt += 1
+                _counters["retries"] += 1
+                time.sleep(delay)
+    finally:
+        _sync_slots.release()
+    breaker.record_success()
+    return result
+
+
+def stats() -> dict:
+    return {**_counters, "in_flight": _in_flight, "max_concurrency": MAX_CONCURRENCY, "breaker": breaker.stats()}
@@ -1,42 +1,174 @@
-from fastapi import FastAPI
-from fastapi.responses import HTMLResponse
-from fastapi.staticfiles import StaticFiles
-from agents import master_agent
+# first, so startup milestones count from the start of the import
+import startup
+
+import asyncio
+import hmac
+import json
+import logging
+import math
+import os
+import time
+import weakref
 from typing import Optional
 
-app = FastAPI()
+from contextlib import asynccontextmanager
 
-# mount generated files (sanction PDFs) so the frontend can download them
-app.mount("/generated", StaticFiles(directory="generated"), name="generated")
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
+from agents import master_agent, stream_master_agent
+from executors import run_io
+import customers
+import eventlog
+import importer
+import llm
+import metrics
+import offers
+import profiler
+import ratelimit
+import sanction
+import sanction_queue
+import static_assets
+from sessions import create_session_store
 
-# sessions keyed by session_id (simple in-memory store for demo)
-SESSIONS = {}
 
+logger = logging.getLogger(__name__)
 
-@app.get("/", response_class=HTMLResponse)
-def home():
-    with open("static/index.html", "r", encoding="utf-8") as f:
-        return f.read()
 
+async def _letter_retention():
+    """Expire and compact sanction letters every SANCTION_RETENTION_INTERVAL seconds."""
+    while True:
+        try:
+            await run_io(sanction.run_retention)
+        except Exception:
+            logger.exception("sanction letter retention failed")
+        await asyncio.sleep(sanction.RETENTION_INTERVAL)
 
-@app.post("/chat")
-def chat(data: dict):
-    """Chat endpoint expects JSON {"message": str, "session_id": Optional[str]}.
 
-    If no session_id is provided, a default session is used (useful for quick demos).
-    """
-    user_message = data.get("message", "")
-    session_id: Optional[str] = data.get("session_id")
+async def _customer_refresh():
+    """Pick up customers other workers or imports wrote, every CUSTOMER_REFRESH_SECONDS."""
+    while True:
+        await asyncio.sleep(customers.REFRESH_SECONDS)
+        try:
+            await run_io(customers.refresh)
+        except Exception:
+            logger.exception("customer directory refresh failed")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # warm the customer directory before the first phone lookup
+    await run_io(customers.load)
+    await run_io(static_assets.load)
+    if eventlog.ENABLED:
+        await _recover_sessions()
+    retention = asyncio.create_task(_letter_retention()) if sanction.RETENTION_DAYS > 0 else None
+    refresh = asyncio.create_task(_customer_refresh()) if customers.REFRESH_SECONDS > 0 else None
+    # offer envelopes fill in the background (until then they are computed per phone on
+    # demand), then the parts that load on first use
+    parts = [("offers", lambda: run_io(offers.precompute))]
+    if startup.WARMUP:
+        parts += [
+            ("reportlab", lambda: run_io(sanction.warm)),
+            ("sanction_workers", sanction_queue.warm),
+            ("llm", lambda: run_io(llm.warm)),
+        ]
+    warmup = startup.warm(parts)
+    startup.mark("started")
+    yield
+    warmup.cancel()
+    if retention:
+        retention.cancel()
+    if refresh:
+        refresh.cancel()
+    await sanction_queue.shutdown()
+    await run_io(eventlog.close)
+
+
+async def _recover_sessions():
+    """Rebuild conversations from the event log when the session store starts empty (memory backend)."""
+    if SESSIONS.stats()["size"]:
+        return
+    recovered = await run_io(eventlog.recover)
+    for session_id, session in recovered.items():
+        await SESSIONS.save(session_id, session)
+    if recovered:
+        logger.info("recovered %d sessions from the event log", len(recovered))
+
+
+app = FastAPI(lifespan=lifespan)
+
+# sessions keyed by session_id; backend chosen by SESSION_BACKEND (see sessions.py)
+SESSIONS = create_session_store()
+
+# one lock per live session_id so concurrent messages for a session run one at a time;
+# entries disappear once no request holds the lock
+_SESSION_LOCKS = weakref.WeakValueDictionary()
+
+TRUST_FORWARDED_FOR = os.environ.get("TRUST_FORWARDED_FOR", "").lower() in ("1", "true", "yes")
+
+REQUEST_SECONDS = metrics.histogram("loanbot_request_seconds", "Chat request time, session lock wait included.", ("endpoint",))
+SESSION_SECONDS = metrics.histogram("loanbot_session_seconds", "Session store load/save time.", ("op",))
+
+
+@metrics.collector
+def _session_metrics():
+    stats = SESSIONS.stats()
+    return [
+        ("loanbot_sessions", "gauge", "Live sessions in the session store.", {(): stats["size"]}),
+        ("loanbot_session_lookups_total", "counter", "Session store lookups by result.", {
+            (("result", "hit"),): stats["hits"],
+            (("result", "miss"),): stats["misses"],
+        }),
+        ("loanbot_session_removals_total", "counter", "Sessions dropped by the store.", {
+            (("reason", "evicted"),): stats["evictions"],
+            (("reason", "expired"),): stats["expirations"],
+        }),
+    ]
+
+
+def _client_ip(request: Request):
+    """The caller's address; the first X-Forwarded-For hop when TRUST_FORWARDED_FOR is set (behind a proxy)."""
+    if TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else None
+
+
+def _session_lock(session_id: str) -> asyncio.Lock:
+    lock = _SESSION_LOCKS.get(session_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        _SESSION_LOCKS[session_id] = lock
+    return lock
+
+
+@app.api_route("/", methods=["GET", "HEAD"], response_class=HTMLResponse)
+async def home(request: Request):
+    """The chat UI, from memory (see static_assets.py); no IO, so it skips the thread pool."""
+    return static_assets.response(request, static_assets.get("index.html"))
+
 
-    if session_id:
-        session = SESSIONS.setdefault(session_id, {"step": "START"})
-    else:
-        # fallback single demo session
-        session = SESSIONS.setdefault("__default__", {"step": "START"})
+@app.api_route("/static/{name:path}", methods=["GET", "HEAD"])
+async def static_file(name: str, request: Request):
+    asset = static_assets.get(name)
+    if asset is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    return static_assets.response(request, asset)
 
-    reply = master_agent(user_message, session)
 
-    response = {"reply": reply, "session_id": session_id or "__default__"}
+async def _finish_turn(session_id: str, session: dict, reply: str) -> dict:
+    """Save the session after a turn and build the `/chat` response for it."""
+    response = {"reply": reply, "session_id": session_id}
+    # A queued sanction letter: pick up the file once the renderer has finished it
+    if session.get("sanction_job"):
+        response["sanction_job"] = session["sanction_job"]
+        if not session.get("last_file"):
+            job = await run_io(sanction_queue.get_job, session["sanction_job"])
+            if job and job.get("file"):
+                session["last_file"] = job["file"]
+    with metrics.timer(SESSION_SECONDS, "save"):
+        await SESSIONS.save(session_id, session)
     # Include a file link if a sanction PDF was created in this session
     if session.get("last_file"):
         response["file"] = session.get("last_file")
@@ -45,5 +177,315 @@ def chat(data: dict):
         response["last_reason"] = session.get("last_reason")
     if session.get("last_details"):
         response["last_details"] = session.get("last_details")
+    return response
+
+
+@app.post("/chat")
+async def chat(data: dict, request: Request):
+    """Chat endpoint expects JSON {"message": str, "session_id": Optional[str]}.
+
+    If no session_id is provided, a default session is used (useful for quick demos).
+    Messages for the same session are processed one at a time.
+    """
+    user_message = data.get("message", "")
+    # fallback single demo session
+    session_id: str = data.get("session_id") or "__default__"
+
+    with profiler.track("chat"), metrics.timer(REQUEST_SECONDS, "chat"):
+        async with _session_lock(session_id):
+            with metrics.timer(SESSION_SECONDS, "get"):
+                session = await SESSIONS.get(session_id) or {"step": "START"}
+            with ratelimit.client(_client_ip(request), session_id), eventlog.conversation(session_id):
+                reply = await master_agent(user_message, session)
+            return await _finish_turn(session_id, session, reply)
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_stream(data: dict, request: Request):
+    """Same request as `/chat`, answered as server-sent events.
+
+    Emits `token` events ({"text": ...}) as the reply is produced, then one `done`
+    event carrying the full `/chat` response plus `ttft_ms` (time to first token).
+    Only free-form questions after a decision are streamed token by token; other
+    turns arrive as a single token event.
+    """
+    user_message = data.get("message", "")
+    session_id: str = data.get("session_id") or "__default__"
+    ip = _client_ip(request)
+
+    async def events():
+        started = time.perf_counter()
+        ttft = None
+        parts = []
+        with profiler.track("chat_stream"), metrics.timer(REQUEST_SECONDS, "chat_stream"):
+            async with _session_lock(session_id):
+                with metrics.timer(SESSION_SECONDS, "get"):
+                    session = await SESSIONS.get(session_id) or {"step": "START"}
+                with ratelimit.client(ip, session_id), eventlog.conversation(session_id):
+                    async for chunk in stream_master_agent(user_message, session):
+                        if ttft is None:
+                            ttft = (time.perf_counter() - started) * 1000
+                        parts.append(chunk)
+                        yield _sse("token", {"text": chunk})
+                response = await _finish_turn(session_id, session, "".join(parts))
+            response["ttft_ms"] = round(ttft or 0.0, 2)
+        yield _sse("done", response)
+
+    # no-cache / no buffering so proxies pass events through as they are produced
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+
+@app.get("/ready")
+def ready():
+    """`warm` once the background warm-up has loaded everything, else `cold`; see startup.py."""
+    return startup.status()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    """Counters, histograms and gauges in the Prometheus text exposition format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# letters hold personal data: browsers may keep them, shared caches (the CDN) must revalidate
+LETTER_CACHE_CONTROL = os.environ.get("LETTER_CACHE_CONTROL", "private, max-age=86400")
 
+
+@app.api_route("/generated/{name}", methods=["GET", "HEAD"])
+def generated_letter(name: str, request: Request):
+    """A sanction letter PDF, `<letter id>.pdf`, looked up in the letter index.
+
+    Supports Range requests and conditional GETs (ETag / Last-Modified).
+    """
+    path = sanction.letter_file(name)
+    if not path:
+        raise HTTPException(status_code=404, detail="Unknown sanction letter")
+    return static_assets.file_response(request, path, "application/pdf", LETTER_CACHE_CONTROL)
+
+
+@app.get("/sanction/{job_id}")
+def sanction_status(job_id: str):
+    """Status of a queued sanction letter: queued, running, done (with `file`) or failed."""
+    job = sanction_queue.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Unknown sanction job")
+    return job
+
+
+@app.get("/sessions/stats")
+def session_stats():
+    """Session store size and hit/miss/eviction/expiration counters."""
+    return SESSIONS.stats()
+
+
+@app.get("/customers/stats")
+def customer_stats():
+    """Customer directory size and lookup counters (hits, misses, cached misses, storage lookups)."""
+    return {**customers.stats(), **offers.stats()}
+
+
+# uploads are spooled here while they are imported
+IMPORT_DIR = os.environ.get("IMPORT_DIR", "imports")
+# imports write credit scores and limits, so the endpoints need this token (X-Import-Token); unset disables them
+IMPORT_TOKEN = os.environ.get("IMPORT_TOKEN", "")
+IMPORT_MAX_BYTES = int(float(os.environ.get("IMPORT_MAX_MB", "100")) * 1024 * 1024)
+_import_tasks = set()
+
+
+def _check_import_token(request: Request):
+    if not IMPORT_TOKEN:
+        raise HTTPException(status_code=403, detail="Customer import over HTTP is disabled (IMPORT_TOKEN is not set)")
+    if not hmac.compare_digest(request.headers.get("x-import-token", "").encode(), IMPORT_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Missing or wrong X-Import-Token")
+
+
+@app.post("/customers/import")
+async def import_customers(request: Request, format: Optional[str] = None, name: Optional[str] = None):
+    """Start a bulk customer import from the raw request body (CSV or JSONL, optionally gzipped).
+
+    Requires the `X-Import-Token` header to match IMPORT_TOKEN; bodies over
+    IMPORT_MAX_MB are refused with 413. Give `format` (csv / jsonl) or a file
+    `name` to detect it from. The body is spooled to disk as it arrives and
+    imported in the background; poll `GET /customers/import/{job_id}` for
+    progress. Uploading the same file again resumes an interrupted import.
+    """
+    _check_import_token(request)
+    try:
+        fmt = format or importer.detect_format(name or "")
+    except importer.ImportFormatError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if fmt not in ("csv", "jsonl"):
+        raise HTTPException(status_code=422, detail="format must be csv or jsonl")
+    too_large = f"Upload exceeds IMPORT_MAX_MB ({IMPORT_MAX_BYTES} bytes)"
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > IMPORT_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=too_large)
+    job_id = importer.new_job(name)
+    os.makedirs(IMPORT_DIR, exist_ok=True)
+    path = os.path.join(IMPORT_DIR, f"{job_id}.upload")
+    size = 0
+    try:
+        with open(path, "wb") as f:
+            async for chunk in request.stream():
+                size += len(chunk)
+                # chunked bodies carry no Content-Length: count as they arrive
+                if size > IMPORT_MAX_BYTES:
+                    raise HTTPException(status_code=413, detail=too_large)
+                await run_io(f.write, chunk)
+    except BaseException as e:
+        os.remove(path)
+        importer.upload_failed(job_id, getattr(e, "detail", None) or "upload interrupted")
+        raise
+    job = importer.spooled(job_id, size)
+    # a dedicated thread: a long import should not hold one of the IO pool's slots
+    task = asyncio.create_task(asyncio.to_thread(importer.run_job, job_id, path, fmt, name))
+    _import_tasks.add(task)
+    task.add_done_callback(_import_tasks.discard)
+    return dict(job)
+
+
+@app.get("/customers/import/{job_id}")
+def import_status(job_id: str, request: Request):
+    """Progress of a customer import: rows read, imported, rejected, rows/s and status (same token as the upload)."""
+    _check_import_token(request)
+    job = importer.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Unknown import job")
+    return job
+
+
+@app.get("/steps/stats")
+def step_stats():
+    """Per-step turn counts and mean/max handler time of the conversation state machine."""
+    from agents import MACHINE
+
+    return MACHINE.timings()
+
+
+@app.get("/llm/stats")
+def llm_stats():
+    """LLM reply cache counters and upstream client health (retries, timeouts, circuit breaker)."""
+    from llm import cache_stats, client_stats
+
+    return {"cache": cache_stats(), "client": client_stats()}
+
+
+@app.post("/underwrite/batch")
+def underwrite_batch(data: dict):
+    """Score many applicants at once.
+
+    Expects JSON columns of equal length: {"credit_score": [...], "loan_amount": [...],
+    "preapproved_limit": [...], "salary": [...]}, plus an optional "tenure" (column or single
+    value, default 12 months); set "reasons": true to also get reason strings. Non-numeric,
+    nested or non-finite values and tenures outside 1..480 months get 422.
+    """
+    from rules_batch import evaluate_loans
+
+    columns = ("credit_score", "loan_amount", "preapproved_limit", "salary")
+    missing = [c for c in columns if not isinstance(data.get(c), list)]
+    if missing:
+        raise HTTPException(status_code=422, detail=f"Missing or non-list columns: {', '.join(missing)}")
+    try:
+        result = evaluate_loans(*(data[c] for c in columns), tenure=data.get("tenure", 12))
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    response = {
+        "codes": result.codes.tolist(),
+        "decisions": result.decisions.tolist(),
+        "emi": result.emi.tolist(),
+    }
+    if data.get("reasons"):
+        response["reasons"] = list(result.reasons)
     return response
+
+
+@app.get("/rules")
+def get_rules():
+    """The active underwriting thresholds and where they were loaded from."""
+    from rules import active_rules
+
+    rules = active_rules()
+    return {"source": rules.source, **rules.as_dict()}
+
+
+@app.post("/rules/reload")
+def rules_reload():
+    """Recompile rules from RULES_FILE and swap them in; the current rules stay active on error."""
+    from rules import reload_rules
+
+    try:
+        rules = reload_rules()
+    except (OSError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Rules not reloaded: {e}")
+    return {"source": rules.source, **rules.as_dict()}
+
+
+@app.get("/offers")
+def loan_offers(credit_score: int, preapproved_limit: float, salary: float,
+                loan_amount: Optional[float] = None, tenure: Optional[int] = None):
+    """The largest approvable amount per tenure for an applicant, under the active rules.
+
+    With `loan_amount`, also the shortest tenure over which that amount is approved.
+    """
+    from amortization import MAX_TENURE_MONTHS
+
+    amounts = (preapproved_limit, salary) if loan_amount is None else (preapproved_limit, salary, loan_amount)
+    if not all(math.isfinite(amount) and amount >= 0 for amount in amounts):
+        raise HTTPException(status_code=422, detail="amounts must be finite and non-negative")
+    if tenure is not None and not 0 < tenure <= MAX_TENURE_MONTHS:
+        raise HTTPException(status_code=422, detail=f"tenure must be between 1 and {MAX_TENURE_MONTHS}")
+    offer = offers.counter_offer(credit_score, loan_amount or 0, preapproved_limit, salary, tenure)
+    if offer is None:
+        return {"eligible": False, "offers": [], "shortest_tenure": None}
+    if loan_amount is None:
+        offer["shortest_tenure"] = None
+    return {"eligible": True, **offer}
+
+
+@app.get("/schedule")
+def payment_schedule(principal: float, months: int, annual_rate: Optional[float] = None,
+                     prepay_amount: float = 0, prepay_month: int = 0):
+    """Repayment schedule for a loan; `annual_rate` defaults to the underwriting rate.
+
+    An optional lump-sum prepayment (`prepay_amount` with instalment `prepay_month`)
+    keeps the EMI and shortens the tenure.
+    """
+    from amortization import MAX_ANNUAL_RATE, MAX_PRINCIPAL, MAX_TENURE_MONTHS, schedule
+    from rules import active_rules
+
+    if not 0 < principal <= MAX_PRINCIPAL:  # also false for NaN
+        raise HTTPException(status_code=422, detail=f"principal must be positive and at most {MAX_PRINCIPAL:,.0f}")
+    if months <= 0:
+        raise HTTPException(status_code=422, detail="months must be positive")
+    if months > MAX_TENURE_MONTHS:
+        raise HTTPException(status_code=422, detail=f"months must be at most {MAX_TENURE_MONTHS}")
+    if annual_rate is not None and not 0 <= annual_rate <= MAX_ANNUAL_RATE:
+        raise HTTPException(status_code=422, detail=f"annual_rate must be between 0 and {MAX_ANNUAL_RATE:g}")
+    if not math.isfinite(prepay_amount):
+        raise HTTPException(status_code=422, detail="prepay_amount must be a finite number")
+    if annual_rate is None:
+        annual_rate = active_rules().annual_rate
+    prepayments = {prepay_month: prepay_amount} if prepay_amount > 0 and prepay_month > 0 else None
+    plan = schedule(principal, months, annual_rate, prepayments)
+    columns = ("month", "payment", "interest", "principal", "prepayment", "balance")
+    return {
+        "principal": principal,
+        "months": months,
+        "annual_rate": annual_rate,
+        "emi": round(plan["emi"], 2),
+        "total_interest": round(plan["total_interest"], 2),
+        "total_payable": round(principal + plan["total_interest"], 2),
+        "rows": [
+            {c: (int(v) if c == "month" else round(float(v), 2)) for c, v in zip(columns, row)}
+            for row in zip(*(plan[c] for c in columns))
+        ],
+    }
+
+
+startup.mark("imported")
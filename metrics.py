@@ -0,0 +1,185 @@
+"""In-process metrics with Prometheus text exposition, served by `GET /metrics`.
+
+Counters and histograms are created once at import time by the modules that use
+them and observed from the request path (and from executor threads, so updates
+take a per-metric lock). Gauges that mirror state kept elsewhere (session store,
+reply cache, circuit breaker, sanction queue) are registered as collectors that
+are only read when `/metrics` is scraped.
+
+    STORAGE = metrics.histogram("loanbot_storage_seconds", "Storage call time.", ("op",))
+
+    @metrics.timed(STORAGE)                 # labelled with the function name
+    def get_customer(phone): ...
+
+    with metrics.timer(REQUEST, "chat"):    # explicit label values
+        ...
+"""
+import bisect
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+
+# latency buckets in seconds: 0.5ms .. 30s
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = {}
+_collectors = []
+
+
+def _label_text(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, _label_text(self.labels, key), value) for key, value in items]
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            # first bucket with value <= bound; past the end means +Inf
+            series[bisect.bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def count(self, *label_values):
+        series = self._series.get(label_values)
+        return sum(series[:-1]) if series else 0
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        out = []
+        for key, series in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += n
+                le = f'le="{_number(bound)}"'
+                out.append((self.name + "_bucket", _label_text(self.labels, key, (le,)), cumulative))
+            out.append((self.name + "_sum", _label_text(self.labels, key), series[-1]))
+            out.append((self.name + "_count", _label_text(self.labels, key), cumulative))
+        return out
+
+
+def _register(metric):
+    existing = _registry.get(metric.name)
+    if existing is not None:
+        # modules may be imported twice (e.g. as __main__); reuse the first instance
+        return existing
+    _registry[metric.name] = metric
+    return metric
+
+
+def counter(name, help, labels=()) -> Counter:
+    return _register(Counter(name, help, labels))
+
+
+def histogram(name, help, labels=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+    return _register(Histogram(name, help, labels, buckets))
+
+
+def collector(fn):
+    """Register `fn() -> [(name, type, help, {label tuple or (): value})]`, read at scrape time."""
+    _collectors.append(fn)
+    return fn
+
+
+@contextmanager
+def timer(hist, *label_values):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        hist.observe(time.perf_counter() - started, *label_values)
+
+
+def timed(hist, *label_values):
+    """Decorator observing the call time of a sync or async function (label: the function name)."""
+
+    def decorate(fn):
+        labels = label_values or (fn.__name__,)
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    hist.observe(time.perf_counter() - started, *labels)
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                hist.observe(time.perf_counter() - started, *labels)
+
+        return wrapper
+
+    return decorate
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    for metric in _registry.values():
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{labels} {_number(value)}")
+    for fn in _collectors:
+        for name, type_, help, values in fn():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {type_}")
+            for labels, value in values.items():
+                label_text = _label_text([k for k, _ in labels], [v for _, v in labels])
+                lines.append(f"{name}{label_text} {_number(value)}")
+    return "\n".join(lines) + "\n"
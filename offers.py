@@ -0,0 +1,268 @@
+"""Counter-offers: the largest loan the underwriting rules would approve, per tenure.
+
+With the credit score floor met, an amount is approved when it is within the
+pre-approved limit, or within `max_preapproved_multiple` times it and its
+amortized EMI is at most `max_emi_to_salary` of salary. The EMI is linear in the
+principal (`amount * rate_factor(rate, months)`), so the best amount for a tenure
+has a closed form:
+
+    max(preapproved_limit, min(multiple * preapproved_limit, ratio * salary / rate_factor))
+
+computed here for all tenures (and, with array inputs, all applicants) in one
+NumPy expression. Amounts above the pre-approved limit are rounded down to
+`OFFER_STEP` rupees and checked against the EMI rule, so every offered amount is
+one `rules.evaluate_loan` approves.
+
+`OFFER_TENURES` (default 12,24,36,48,60) are the tenures offered;
+`OFFER_MAX_TENURE` bounds the search for the shortest tenure that fits a
+requested amount.
+
+Registered customers' inputs rarely change, so their results are kept as an
+`Envelope` per phone: `precompute()` fills the cache for the whole customer
+directory in one vectorized pass (run in the background at startup), `envelope()`
+computes a missing one on demand, and entries are dropped when `customers`
+reports a changed record or the active rules are replaced.
+"""
+import os
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+import numpy as np
+
+import customers
+import metrics
+from amortization import emi_array
+from rules import active_rules
+
+TENURES = tuple(int(t) for t in os.environ.get("OFFER_TENURES", "12,24,36,48,60").split(","))
+MAX_TENURE = int(os.environ.get("OFFER_MAX_TENURE", "84"))
+STEP = int(os.environ.get("OFFER_STEP", "1000"))
+
+
+@lru_cache(maxsize=64)
+def _factors(annual_rate: float, tenures: tuple):
+    """Read-only rate factors (EMI per rupee) for `tenures`, memoized like `amortization.rate_factor`."""
+    factors = emi_array(1.0, np.array(tenures), annual_rate)
+    factors.flags.writeable = False
+    return factors
+
+
+def max_amounts(credit_score, preapproved_limit, salary, tenures=TENURES, rules=None, step=STEP):
+    """Largest approvable amount for each tenure (0 where the credit score fails).
+
+    Scalars give one amount per tenure; columns of applicants (equal-length arrays)
+    give an (applicants, tenures) array.
+    """
+    rules = rules or active_rules()
+    factors = _factors(float(rules.annual_rate), tuple(int(t) for t in tenures))
+    credit_score = np.asarray(credit_score, dtype=float)[..., None]
+    preapproved = np.asarray(preapproved_limit, dtype=float)[..., None]
+    budget = rules.max_emi_to_salary * np.asarray(salary if salary is not None else 0, dtype=float)[..., None]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        affordable = np.floor(budget / factors / step) * step
+    # floor division can land a rounding error above the budget; step back once if so
+    affordable = np.where(affordable * factors <= budget, affordable, affordable - step)
+    stretched = np.minimum(np.floor(rules.max_preapproved_multiple * preapproved), affordable)
+    best = np.maximum(preapproved, np.where(budget > 0, stretched, 0))
+    return np.where(credit_score >= rules.min_credit_score, best, 0).astype(np.int64)
+
+
+def shortest_tenure(credit_score, loan_amount, preapproved_limit, salary, rules=None, max_tenure=None):
+    """Fewest months (up to OFFER_MAX_TENURE) over which `loan_amount` is approved, or None."""
+    rules = rules or active_rules()
+    if credit_score < rules.min_credit_score:
+        return None
+    if loan_amount <= preapproved_limit:
+        return 1
+    if loan_amount > rules.max_preapproved_multiple * preapproved_limit or not salary:
+        return None
+    factors = _factors(float(rules.annual_rate), tuple(range(1, (max_tenure or MAX_TENURE) + 1)))
+    # rate factors fall as the tenure grows, so the first fit is the shortest
+    fits = loan_amount * factors <= rules.max_emi_to_salary * salary
+    return int(fits.argmax()) + 1 if fits[-1] else None
+
+
+def _offers(tenures, amounts, rules):
+    emis = np.asarray(amounts) * _factors(float(rules.annual_rate), tuple(tenures))
+    return [
+        {"tenure": t, "max_amount": int(a), "emi": round(float(e), 2)}
+        for t, a, e in zip(tenures, amounts, emis)
+        if a > 0
+    ]
+
+
+def counter_offer(credit_score, loan_amount, preapproved_limit, salary, tenure=None, rules=None, tenures=TENURES):
+    """What can be approved instead of (`loan_amount`, `tenure`); None if no loan can be.
+
+    Returns {"offers": [{"tenure", "max_amount", "emi"}, ...], "shortest_tenure": months
+    or None}; the requested tenure is included in the offers.
+    """
+    rules = rules or active_rules()
+    if credit_score < rules.min_credit_score:
+        return None
+    tenures = sorted(set(tenures) | ({int(tenure)} if tenure else set()))
+    amounts = max_amounts(credit_score, preapproved_limit, salary, tenures, rules)
+    if not amounts.any():
+        return None
+    return {
+        "offers": _offers(tenures, amounts.tolist(), rules),
+        "shortest_tenure": shortest_tenure(credit_score, loan_amount, preapproved_limit, salary, rules),
+    }
+
+
+def offer_message(offer, loan_amount):
+    """Chat text for a counter-offer."""
+    lines = ["Here is what we can approve instead:"]
+    top = max(o["max_amount"] for o in offer["offers"])
+    for o in offer["offers"]:
+        # amounts never fall as the tenure grows; stop at the first tenure reaching the maximum
+        longer = " or longer" if o["max_amount"] == top and o is not offer["offers"][-1] else ""
+        lines.append(f"- ₹{o['max_amount']:,} over {o['tenure']} months{longer} (EMI ₹{o['emi']:,.0f})")
+        if o["max_amount"] == top:
+            break
+    if offer["shortest_tenure"]:
+        lines.append(f"Or keep ₹{loan_amount:,} over {offer['shortest_tenure']} months or more.")
+    return "\n".join(lines)
+
+
+@dataclass(slots=True)
+class Envelope:
+    """One customer's eligibility under the rules it was computed with.
+
+    `ceilings[i]` is the largest approvable amount over `TENURES[i]` months;
+    `hard_reject` is "credit_score" (below the floor) or "no_limit" (nothing is
+    approvable), else None.
+    """
+    credit_score: int
+    preapproved_limit: int
+    salary: int
+    ceilings: tuple
+    hard_reject: Optional[str] = None
+
+    def ceiling(self, tenure):
+        """Largest approvable amount over `tenure` months, or None if it was not precomputed."""
+        try:
+            return self.ceilings[TENURES.index(tenure)]
+        except ValueError:
+            return None
+
+    def best(self):
+        """(largest amount, shortest tenure giving it), or None for a hard reject."""
+        if self.hard_reject:
+            return None
+        top = max(self.ceilings)
+        return top, TENURES[self.ceilings.index(top)]
+
+    def counter_offer(self, loan_amount, tenure, rules=None):
+        """Same as `counter_offer` for this customer, from the cached ceilings when `tenure` is one of them."""
+        rules = rules or active_rules()
+        if tenure not in TENURES:
+            return counter_offer(self.credit_score, loan_amount, self.preapproved_limit, self.salary, tenure, rules)
+        if self.hard_reject:
+            return None
+        return {
+            "offers": _offers(TENURES, self.ceilings, rules),
+            "shortest_tenure": shortest_tenure(self.credit_score, loan_amount, self.preapproved_limit, self.salary, rules),
+        }
+
+
+ENVELOPE_LOOKUPS = metrics.counter("loanbot_offer_envelope_lookups_total", "Eligibility envelope lookups by result.", ("result",))
+
+# precomputed envelopes as columns: phone -> row of `_columns` (credit score, limit, salary),
+# `_ceilings` and `_hard`; rows are turned into Envelope objects when first looked up
+_table = {}
+_columns = _ceilings = _hard = None
+# phone -> Envelope, looked up or computed on demand
+_cache = {}
+# the rules both were computed under
+_cache_rules = None
+_cache_lock = threading.Lock()
+# phones changed while precompute() runs; their rows must not be installed
+_changed_during = None
+# bumped when every envelope is dropped, so a precompute that started before is discarded
+_generation = 0
+
+_HARD_REJECTS = (None, "credit_score", "no_limit")
+
+
+def _hard_rejects(credit_score, ceilings, rules):
+    """Index into _HARD_REJECTS for each row of `ceilings` (one row per customer)."""
+    return np.where(credit_score < rules.min_credit_score, 1, np.where(ceilings.max(axis=-1) > 0, 0, 2))
+
+
+def precompute():
+    """Compute envelopes for every customer in the directory in one pass; returns how many."""
+    global _table, _columns, _ceilings, _hard, _cache, _cache_rules, _changed_during
+    rules = active_rules()
+    with _cache_lock:
+        _changed_during = set()
+        generation = _generation
+    items = customers.items()
+    columns = np.array(
+        [(c.credit_score or 0, c.preapproved_limit or 0, c.salary or 0) for _, c in items], dtype=np.int64
+    ).reshape(-1, 3)
+    ceilings = max_amounts(columns[:, 0], columns[:, 1], columns[:, 2], TENURES, rules)
+    hard = _hard_rejects(columns[:, 0], ceilings, rules)
+    table = {phone: row for row, (phone, _) in enumerate(items)}
+    with _cache_lock:
+        for phone in _changed_during:
+            table.pop(phone, None)
+        _changed_during = None
+        if rules is not active_rules() or generation != _generation:
+            return 0
+        if _cache_rules is not rules:
+            _cache = {}
+        _table, _columns, _ceilings, _hard, _cache_rules = table, columns, ceilings, hard, rules
+    return len(table)
+
+
+def envelope(phone):
+    """The `Envelope` for a registered customer's phone (computed if not precomputed), or None."""
+    global _cache, _table, _cache_rules
+    rules = active_rules()
+    if _cache_rules is rules:
+        found = _cache.get(phone)
+        if found is None:
+            row = _table.get(phone)
+            if row is not None:
+                found = Envelope(*_columns[row].tolist(), tuple(_ceilings[row].tolist()), _HARD_REJECTS[_hard[row]])
+                _cache[phone] = found
+        if found is not None:
+            ENVELOPE_LOOKUPS.inc("hit")
+            return found
+    customer = customers.lookup(phone)
+    if customer is None:
+        return None
+    ENVELOPE_LOOKUPS.inc("miss")
+    inputs = (customer.credit_score or 0, customer.preapproved_limit or 0, customer.salary or 0)
+    ceilings = max_amounts(*inputs, TENURES, rules)
+    found = Envelope(*inputs, tuple(ceilings.tolist()), _HARD_REJECTS[int(_hard_rejects(inputs[0], ceilings, rules))])
+    with _cache_lock:
+        if _cache_rules is not rules:
+            # rules were reloaded: start over under the new ones
+            _cache, _table, _cache_rules = {}, {}, rules
+        _cache[phone] = found
+    return found
+
+
+@customers.on_change
+def invalidate(phones=None):
+    """Drop the envelopes of `phones` (all of them when None)."""
+    global _cache, _table, _generation
+    with _cache_lock:
+        if phones is None:
+            _cache, _table = {}, {}
+            _generation += 1
+            return
+        for phone in phones:
+            _cache.pop(phone, None)
+            _table.pop(phone, None)
+            if _changed_during is not None:
+                _changed_during.add(phone)
+
+
+def stats() -> dict:
+    return {"offer_envelopes_precomputed": len(_table), "offer_envelopes_cached": len(_cache)}
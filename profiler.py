@@ -0,0 +1,111 @@
+"""Opt-in sampling profiler that keeps stacks only for slow requests.
+
+Enabled by setting `PROFILE_SLOW_MS`. A background thread samples the stack of
+the event-loop thread every `PROFILE_INTERVAL_MS` while at least one request is
+being tracked; each sample is credited to every tracked request. When a request
+finishes slower than the threshold its samples are written to `PROFILE_DIR`
+(default `profiles/`) in the folded format understood by flamegraph.pl and
+speedscope (`frame;frame;frame count` per line, root first).
+
+Requests share the event loop, so a slow request's profile also shows whatever
+other requests ran while it was waiting; that is usually the point.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+SLOW_MS = float(os.environ.get("PROFILE_SLOW_MS", "0"))
+INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+
+_active = {}
+_lock = threading.Lock()
+_sampler = None
+_target_thread = None
+_next_id = 0
+dumped = 0
+
+
+def enabled() -> bool:
+    return SLOW_MS > 0
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def _folded_stack(frame):
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def _sample_forever():
+    interval = INTERVAL_MS / 1000
+    while True:
+        time.sleep(interval)
+        if not _active:
+            continue
+        frame = sys._current_frames().get(_target_thread)
+        if frame is None:
+            continue
+        stack = _folded_stack(frame)
+        with _lock:
+            for samples in _active.values():
+                samples[stack] += 1
+
+
+def _ensure_sampler():
+    global _sampler, _target_thread
+    _target_thread = threading.get_ident()
+    if _sampler is None:
+        _sampler = threading.Thread(target=_sample_forever, name="profiler", daemon=True)
+        _sampler.start()
+
+
+def _dump(label, elapsed_ms, samples):
+    global dumped
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(PROFILE_DIR, f"{stamp}-{label}-{int(elapsed_ms)}ms-{os.getpid()}-{dumped}.folded")
+    with open(path, "w", encoding="utf-8") as f:
+        for stack, count in samples.most_common():
+            f.write(f"{stack} {count}\n")
+    dumped += 1
+    return path
+
+
+_DISABLED = nullcontext()
+
+
+def track(label: str):
+    """Profile the enclosed request; dump its stacks if it takes longer than PROFILE_SLOW_MS.
+
+    A no-op unless profiling is enabled. Must be entered on the event-loop thread.
+    """
+    return _track(label) if enabled() else _DISABLED
+
+
+@contextmanager
+def _track(label):
+    global _next_id
+    _ensure_sampler()
+    with _lock:
+        _next_id += 1
+        request_id = _next_id
+        _active[request_id] = Counter()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with _lock:
+            samples = _active.pop(request_id)
+        if elapsed_ms >= SLOW_MS and samples:
+            _dump(label, elapsed_ms, samples)
@@ -0,0 +1,190 @@
+"""Token-bucket rate limiting for customer lookups.
+
+Every phone or guest id typed at the PHONE / ASSOC_PHONE steps costs one token
+from two buckets: the session's and the client IP's. Buckets hold up to `burst`
+tokens and refill at `per_minute`; when either is empty the step answers with a
+backoff message instead of touching storage, so random numbers cannot be used
+to enumerate registered phones or to load the database.
+
+- `MemoryRateLimiter`: buckets in a bounded dict, per process.
+- `SQLiteRateLimiter`: buckets in a SQLite table, shared by worker processes.
+
+`RATE_LIMIT_BACKEND` picks `memory` (default), `sqlite` or `off`; limits come from
+`RATE_LIMIT_SESSION_BURST` / `RATE_LIMIT_SESSION_PER_MIN` and
+`RATE_LIMIT_IP_BURST` / `RATE_LIMIT_IP_PER_MIN`. main.py sets the caller for
+each request with `client(ip, session_id)`; without it (tools, tests) nothing
+is limited. Refusals are counted in `loanbot_rate_limited_total{scope}`.
+"""
+import contextvars
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import metrics
+from executors import run_io
+
+SESSION_BURST = float(os.environ.get("RATE_LIMIT_SESSION_BURST", "5"))
+SESSION_PER_MIN = float(os.environ.get("RATE_LIMIT_SESSION_PER_MIN", "6"))
+IP_BURST = float(os.environ.get("RATE_LIMIT_IP_BURST", "30"))
+IP_PER_MIN = float(os.environ.get("RATE_LIMIT_IP_PER_MIN", "60"))
+
+LIMITED = metrics.counter("loanbot_rate_limited_total", "Lookups refused by the rate limiter, by bucket.", ("scope",))
+
+# (client ip, session id) of the request being handled
+_client = contextvars.ContextVar("rate_limit_client", default=(None, None))
+
+
+@contextmanager
+def client(ip, session_id):
+    """Attribute lookups made inside the block to `ip` and `session_id`."""
+    token = _client.set((ip, session_id))
+    try:
+        yield
+    finally:
+        _client.reset(token)
+
+
+def _refill(tokens, updated, now, burst, per_second):
+    return min(burst, tokens + (now - updated) * per_second)
+
+
+def _shortfall(levels, buckets):
+    """(seconds until every bucket has a token, index of the emptiest bucket), or (0, None)."""
+    waits = [(1 - tokens) / per_second if tokens < 1 else 0.0 for tokens, (_, _, per_second) in zip(levels, buckets)]
+    wait = max(waits)
+    return (wait, waits.index(wait)) if wait else (0.0, None)
+
+
+class RateLimiter:
+    """Interface: `take(buckets)` spends one token from each (key, burst, per_second) bucket.
+
+    Returns (0, None) when it did, or (seconds to wait, index of the bucket that
+    ran dry) without spending anything.
+    """
+
+    def _take(self, buckets, now):
+        raise NotImplementedError
+
+    async def take(self, buckets):
+        return self._take(buckets, time.time())
+
+
+class MemoryRateLimiter(RateLimiter):
+    """Buckets in this process; the least recently used keys are dropped past `max_keys`."""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        # key -> (tokens, updated)
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _take(self, buckets, now):
+        with self._lock:
+            levels = []
+            for key, burst, per_second in buckets:
+                tokens, updated = self._buckets.get(key, (burst, now))
+                levels.append(_refill(tokens, updated, now, burst, per_second))
+            refused = _shortfall(levels, buckets)
+            if refused[0]:
+                return refused
+            for (key, _, _), tokens in zip(buckets, levels):
+                self._buckets[key] = (tokens - 1, now)
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return 0.0, None
+
+
+class SQLiteRateLimiter(RateLimiter):
+    """Buckets in a SQLite table so every worker process draws from the same ones.
+
+    Rows of buckets idle for longer than `idle` seconds (full again by then) are
+    purged every `purge_every` calls.
+    """
+
+    def __init__(self, path: str, idle: float = 3600, purge_every: int = 1000):
+        self.path = path
+        self.idle = idle
+        self.purge_every = purge_every
+        self._calls = 0
+        self._local = threading.local()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS rate_buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _take(self, buckets, now):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            levels = []
+            for key, burst, per_second in buckets:
+                row = conn.execute("SELECT tokens, updated_at FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+                tokens, updated = row or (burst, now)
+                levels.append(_refill(tokens, updated, now, burst, per_second))
+            refused = _shortfall(levels, buckets)
+            if not refused[0]:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO rate_buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                    [(key, tokens - 1, now) for (key, _, _), tokens in zip(buckets, levels)],
+                )
+            self._calls += 1
+            if self._calls % self.purge_every == 0:
+                conn.execute("DELETE FROM rate_buckets WHERE updated_at < ?", (now - self.idle,))
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return refused
+
+    async def take(self, buckets):
+        return await run_io(self._take, buckets, time.time())
+
+
+def create_rate_limiter():
+    """The limiter selected by `RATE_LIMIT_BACKEND`, or None when limiting is off."""
+    backend = os.environ.get("RATE_LIMIT_BACKEND", "memory").lower()
+    if backend == "off":
+        return None
+    if backend == "sqlite":
+        path = os.environ.get("RATE_LIMIT_DB") or os.path.join(os.path.dirname(__file__), "ratelimit.db")
+        return SQLiteRateLimiter(path)
+    if backend != "memory":
+        raise ValueError(f"Unknown RATE_LIMIT_BACKEND {backend!r}; expected 'memory', 'sqlite' or 'off'")
+    return MemoryRateLimiter()
+
+
+LIMITER = create_rate_limiter()
+
+
+async def lookup_backoff():
+    """Spend a lookup for the current client; returns 0 if allowed, else whole seconds to wait."""
+    if LIMITER is None:
+        return 0
+    ip, session_id = _client.get()
+    buckets, scopes = [], []
+    if session_id:
+        buckets.append((f"s:{session_id}", SESSION_BURST, SESSION_PER_MIN / 60))
+        scopes.append("session")
+    if ip:
+        buckets.append((f"ip:{ip}", IP_BURST, IP_PER_MIN / 60))
+        scopes.append("ip")
+    if not buckets:
+        return 0
+    wait, dry = await LIMITER.take(buckets)
+    if not wait:
+        return 0
+    LIMITED.inc(scopes[dry])
+    return math.ceil(wait)
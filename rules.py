@@ -1,48 +1,256 @@
-def evaluate_loan(credit_score, loan_amount, preapproved_limit, salary):
-    """Evaluate loan eligibility and return (decision, reason, details).
+"""Underwriting rules, configured in `rules.json` and compiled once into a decision function.
 
-    - decision: 'APPROVED' or 'REJECTED'
-    - reason: short human-readable explanation.
-    - details: dict with numeric breakdown for explanations (EMI, salary, limits).
-    """
-    details = {
-        "credit_score": credit_score,
-        "loan_amount": loan_amount,
-        "preapproved_limit": preapproved_limit,
-        "salary": salary,
-        "max_allowed": 2 * preapproved_limit if preapproved_limit else 0,
+The config holds the thresholds (credit score floor, maximum multiple of the
+pre-approved limit, maximum EMI-to-salary ratio) and the annual interest rate used
+for the amortized EMI (see `amortization`). `compile_rules` validates it and
+generates a decision function with the thresholds, the rule trace and the reason
+text for every outcome inlined as constants, so evaluating a loan does no config
+lookups and no work beyond formatting the reason.
+
+The reason texts are written once, in `_REASON_FORMATS`; the decision function
+and `format_reason` are both compiled from them. `reload_rules` compiles a new
+rule set and swaps it in with a single assignment: in-flight evaluations finish
+on the rule set they started with.
+
+Set `RULES_FILE` to load the config from another path.
+"""
+import json
+import math
+import os
+
+from amortization import MAX_TENURE_MONTHS, rate_factor
+
+# Decision codes, shared with the vectorized engine in `rules_batch.py`
+APPROVED_WITHIN_LIMIT = 0
+APPROVED_AFFORDABLE = 1
+REJECTED_CREDIT_SCORE = 2
+REJECTED_UNAFFORDABLE = 3
+REJECTED_OVER_MAX = 4
+
+DECISIONS = ("APPROVED", "APPROVED", "REJECTED", "REJECTED", "REJECTED")
+
+DEFAULT_RULES = {
+    "min_credit_score": 700,
+    "max_preapproved_multiple": 2,
+    "max_emi_to_salary": 0.5,
+    "annual_rate": 12.0,
+}
+
+
+def _rules_path():
+    return os.environ.get("RULES_FILE") or os.path.join(os.path.dirname(__file__), "rules.json")
+
+
+class RuleSet:
+    """A compiled rule set: thresholds, per-outcome traces and the `evaluate` function."""
+
+    def __init__(self, min_credit_score, max_preapproved_multiple, max_emi_to_salary, annual_rate, source=None):
+        self.min_credit_score = min_credit_score
+        self.max_preapproved_multiple = max_preapproved_multiple
+        self.max_emi_to_salary = max_emi_to_salary
+        self.annual_rate = annual_rate
+        self.source = source
+        self.traces = _build_traces(self)
+        self.reasons = _build_reasons(self)
+        self.evaluate = _compile_evaluate(self)
+
+    def as_dict(self):
+        return {
+            "min_credit_score": self.min_credit_score,
+            "max_preapproved_multiple": self.max_preapproved_multiple,
+            "max_emi_to_salary": self.max_emi_to_salary,
+            "annual_rate": self.annual_rate,
+        }
+
+    def format_reason(self, code, credit_score, loan_amount, preapproved_limit, salary, emi=None):
+        """Return the human-readable reason for a decision code."""
+        return self.reasons[code](credit_score, loan_amount, preapproved_limit, salary, emi)
+
+
+# Reason text per decision code, as f-string bodies. Runtime fields are the
+# evaluate arguments, `emi` and `max_allowed`; `{min_credit}`, `{pct}` and `{label}`
+# are replaced by the rule set's thresholds before compiling.
+_REASON_FORMATS = {
+    REJECTED_CREDIT_SCORE: "Credit score {credit_score} is below the required minimum of {min_credit}.",
+    APPROVED_WITHIN_LIMIT: "Requested amount ₹{loan_amount:,} is within pre-approved limit of ₹{preapproved_limit:,}.",
+    APPROVED_AFFORDABLE: "Estimated monthly EMI ₹{emi:,.0f} is <= {pct} of monthly salary ₹{salary:,}; affordable.",
+    REJECTED_UNAFFORDABLE: "Estimated monthly EMI ₹{emi:,.0f} exceeds {pct} of monthly salary ₹{salary:,}; unaffordable.",
+    REJECTED_OVER_MAX: (
+        "Requested amount ₹{loan_amount:,} exceeds the allowable maximum "
+        "({label} pre-approved limit ₹{max_allowed:,.0f})."
+    ),
+}
+
+
+def _reason_sources(rules):
+    """Decision code -> f-string literal (source code) of its reason under `rules`."""
+    constants = {
+        "min_credit": rules.min_credit_score,
+        "pct": f"{rules.max_emi_to_salary:.0%}",
+        "label": f"{rules.max_preapproved_multiple:g}x",
     }
+    sources = {}
+    for code, text in _REASON_FORMATS.items():
+        for name, value in constants.items():
+            text = text.replace("{" + name + "}", str(value))
+        sources[code] = "f" + repr(text)
+    return sources
+
+
+_REASON_SOURCE = """
+def reason(credit_score, loan_amount, preapproved_limit, salary, emi):
+    max_allowed = {multiple} * preapproved_limit if preapproved_limit else 0
+    return {text}
+"""
 
-    # Check credit score
-    if credit_score < 700:
-        reason = f"Credit score {credit_score} is below the required minimum of 700."
-        return "REJECTED", reason, details
 
-    # Within preapproved limit
+def _build_reasons(rules):
+    """One formatter per decision code (indexed by code), compiled from `_REASON_FORMATS`."""
+    reasons = []
+    for code, text in sorted(_reason_sources(rules).items()):
+        namespace = {}
+        source = _REASON_SOURCE.format(multiple=repr(rules.max_preapproved_multiple), text=text)
+        exec(compile(source, f"<reason {code}>", "exec"), namespace)
+        reasons.append(namespace["reason"])
+    return tuple(reasons)
+
+
+def _build_traces(rules):
+    """Rule checks, in evaluation order, that lead to each decision code (shared, immutable tuples)."""
+    credit = f"credit_score >= {rules.min_credit_score}"
+    within = "loan_amount <= preapproved_limit"
+    cap = f"loan_amount <= {rules.max_preapproved_multiple:g}x preapproved_limit"
+    afford = f"emi <= {rules.max_emi_to_salary:.0%} of salary"
+    return {
+        REJECTED_CREDIT_SCORE: (f"{credit}: fail",),
+        APPROVED_WITHIN_LIMIT: (f"{credit}: pass", f"{within}: pass"),
+        APPROVED_AFFORDABLE: (f"{credit}: pass", f"{within}: fail", f"{cap}: pass", f"{afford}: pass"),
+        REJECTED_UNAFFORDABLE: (f"{credit}: pass", f"{within}: fail", f"{cap}: pass", f"{afford}: fail"),
+        REJECTED_OVER_MAX: (f"{credit}: pass", f"{within}: fail", f"{cap}: fail"),
+    }
+
+
+# Source of the decision function. Thresholds, traces and reason f-strings are
+# substituted in as literals; the globals it reads are `factors`, the EMI rate
+# factor at the configured rate for every tenure customers can choose, and
+# `rate_factor` for any other tenure.
+_EVALUATE_SOURCE = """
+def evaluate(credit_score, loan_amount, preapproved_limit, salary, tenure=12):
+    max_allowed = {multiple} * preapproved_limit if preapproved_limit else 0
+    if credit_score < {min_credit}:
+        return "REJECTED", {reason_credit}, {{{details}, "trace": {trace_credit}}}
+    # amortized EMI at the configured rate, same figure as the sanction letter
+    emi = loan_amount * (factors.get(tenure) or rate_factor({rate}, tenure))
     if loan_amount <= preapproved_limit:
-        reason = f"Requested amount ₹{loan_amount:,} is within pre-approved limit of ₹{preapproved_limit:,}."
-        details.update({"emi": loan_amount / 12})
-        return "APPROVED", reason, details
-
-    # Up to 2x preapproved limit, check EMI affordability
-    if loan_amount <= 2 * preapproved_limit:
-        emi = loan_amount / 12  # simple monthly EMI estimate without interest for demo
-        details["emi"] = emi
-        if salary:
-            affordable = emi <= 0.5 * salary
-        else:
-            affordable = False
-
-        if affordable:
-            reason = f"Estimated monthly EMI ₹{emi:,.0f} is <= 50% of monthly salary ₹{salary:,}; affordable."
-            return "APPROVED", reason, details
-        else:
-            reason = f"Estimated monthly EMI ₹{emi:,.0f} exceeds 50% of monthly salary ₹{salary:,}; unaffordable."
-            return "REJECTED", reason, details
-
-    # Anything beyond 2x preapproved limit is rejected
-    reason = (
-        f"Requested amount ₹{loan_amount:,} exceeds the allowable maximum (2x pre-approved limit ₹{2*preapproved_limit:,})."
+        return "APPROVED", {reason_within}, {{{details}, "emi": emi, "trace": {trace_within}}}
+    if loan_amount <= max_allowed:
+        if salary and emi <= {ratio} * salary:
+            return "APPROVED", {reason_affordable}, {{{details}, "emi": emi, "trace": {trace_affordable}}}
+        return "REJECTED", {reason_unaffordable}, {{{details}, "emi": emi, "trace": {trace_unaffordable}}}
+    return "REJECTED", {reason_over_max}, {{{details}, "emi": emi, "trace": {trace_over_max}}}
+"""
+
+# the `details` entries every outcome starts with (one dict literal per return)
+_DETAILS_SOURCE = (
+    '"credit_score": credit_score, "loan_amount": loan_amount, "preapproved_limit": preapproved_limit, '
+    '"salary": salary, "max_allowed": max_allowed, "tenure": tenure, "annual_rate": {rate}'
+)
+
+# one applicant per decision code under the default rules; a newly compiled rule set must evaluate them all
+_SAMPLE_APPLICANTS = (
+    (0, 100000, 100000, 50000, 12),
+    (900, 50000, 100000, 50000, 12),
+    (900, 150000, 100000, 1000000, 12),
+    (900, 150000, 100000, 1, 12),
+    (900, 10**9, 100000, 50000, 12),
+)
+
+
+def _compile_evaluate(rules):
+    """Generate and compile the decision function for `rules` (values were validated as finite numbers)."""
+    traces = rules.traces
+    reasons = _reason_sources(rules)
+    rate = repr(float(rules.annual_rate))
+    source = _EVALUATE_SOURCE.format(
+        details=_DETAILS_SOURCE.format(rate=rate),
+        min_credit=repr(rules.min_credit_score),
+        multiple=repr(rules.max_preapproved_multiple),
+        ratio=repr(rules.max_emi_to_salary),
+        rate=rate,
+        trace_credit=repr(traces[REJECTED_CREDIT_SCORE]),
+        trace_within=repr(traces[APPROVED_WITHIN_LIMIT]),
+        trace_affordable=repr(traces[APPROVED_AFFORDABLE]),
+        trace_unaffordable=repr(traces[REJECTED_UNAFFORDABLE]),
+        trace_over_max=repr(traces[REJECTED_OVER_MAX]),
+        reason_credit=reasons[REJECTED_CREDIT_SCORE],
+        reason_within=reasons[APPROVED_WITHIN_LIMIT],
+        reason_affordable=reasons[APPROVED_AFFORDABLE],
+        reason_unaffordable=reasons[REJECTED_UNAFFORDABLE],
+        reason_over_max=reasons[REJECTED_OVER_MAX],
     )
-    details["emi"] = loan_amount / 12
-    return "REJECTED", reason, details
+    factors = {months: rate_factor(float(rules.annual_rate), months) for months in range(1, MAX_TENURE_MONTHS + 1)}
+    namespace = {"rate_factor": rate_factor, "factors": factors}
+    exec(compile(source, f"<rules {rules.source or 'config'}>", "exec"), namespace)
+    return namespace["evaluate"]
+
+
+def compile_rules(config: dict, source=None) -> RuleSet:
+    """Validate a rules config (see DEFAULT_RULES for the keys), compile it and try it out. Raises ValueError."""
+    unknown = set(config) - set(DEFAULT_RULES)
+    if unknown:
+        raise ValueError(f"Unknown rule settings: {', '.join(sorted(unknown))}")
+    merged = {**DEFAULT_RULES, **config}
+    for key, value in merged.items():
+        # json.load accepts NaN and Infinity
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value) or value < 0:
+            raise ValueError(f"Rule setting {key!r} must be a finite non-negative number, got {value!r}")
+    if merged["max_preapproved_multiple"] < 1:
+        raise ValueError("max_preapproved_multiple must be at least 1")
+    rules = RuleSet(source=source, **merged)
+    # a rule set that cannot evaluate must never become active
+    for applicant in _SAMPLE_APPLICANTS:
+        try:
+            rules.evaluate(*applicant)
+        except Exception as e:
+            raise ValueError(f"Rules fail to evaluate {applicant}: {e!r}") from e
+    return rules
+
+
+def load_rules(path=None) -> RuleSet:
+    """Compile the rules config at `path` (default: RULES_FILE / rules.json); defaults if it is missing."""
+    path = path or _rules_path()
+    if not os.path.exists(path):
+        return compile_rules({}, source="defaults")
+    with open(path, "r", encoding="utf-8") as f:
+        return compile_rules(json.load(f), source=path)
+
+
+_active = load_rules()
+
+
+def active_rules() -> RuleSet:
+    return _active
+
+
+def reload_rules(path=None) -> RuleSet:
+    """Recompile the rules config and make it active. On error the current rules stay in place."""
+    global _active
+    rules = load_rules(path)
+    _active = rules
+    return rules
+
+
+def format_reason(code, credit_score, loan_amount, preapproved_limit, salary, emi=None):
+    """Return the human-readable reason for a decision code under the active rules."""
+    return _active.format_reason(code, credit_score, loan_amount, preapproved_limit, salary, emi)
+
+
+def evaluate_loan(credit_score, loan_amount, preapproved_limit, salary, tenure=12):
+    """Evaluate loan eligibility and return (decision, reason, details).
+
+    - decision: 'APPROVED' or 'REJECTED'
+    - reason: short human-readable explanation.
+    - details: dict with numeric breakdown for explanations (EMI over `tenure` months,
+      salary, limits) and `trace`, the rule checks that led to the decision.
+    """
+    return _active.evaluate(credit_score, loan_amount, preapproved_limit, salary, tenure)
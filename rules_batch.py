@@ -0,0 +1,141 @@
+"""Vectorized underwriting: the compiled `rules` thresholds applied to whole columns at once.
+
+Used to re-score portfolios (e.g. after a rule change) without a Python call per
+applicant. Inputs are equal-length columns; the result holds integer decision codes
+(see `rules`) and formats reasons only for the rows that are actually read.
+"""
+import numpy as np
+
+from amortization import MAX_TENURE_MONTHS, emi_array
+
+from rules import (
+    APPROVED_WITHIN_LIMIT,
+    APPROVED_AFFORDABLE,
+    REJECTED_CREDIT_SCORE,
+    REJECTED_UNAFFORDABLE,
+    REJECTED_OVER_MAX,
+    DECISIONS,
+    active_rules,
+)
+
+_DECISIONS = np.array(DECISIONS)
+
+
+class LazyReasons:
+    """Sequence of reason strings, each formatted on first access."""
+
+    def __init__(self, result):
+        self._result = result
+        self._cache = {}
+
+    def __len__(self):
+        return len(self._result)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        reason = self._cache.get(i)
+        if reason is None:
+            r = self._result
+            reason = r.rules.format_reason(
+                int(r.codes[i]),
+                r.credit_score[i].item(),
+                r.loan_amount[i].item(),
+                r.preapproved_limit[i].item(),
+                r.salary[i].item(),
+                r.emi[i].item(),
+            )
+            self._cache[i] = reason
+        return reason
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+class BatchResult:
+    """Columnar underwriting result: `codes`, `decisions`, `emi`, `max_allowed` and lazy `reasons`."""
+
+    def __init__(self, rules, codes, emi, credit_score, loan_amount, preapproved_limit, salary):
+        self.rules = rules
+        self.codes = codes
+        self.emi = emi
+        self.credit_score = credit_score
+        self.loan_amount = loan_amount
+        self.preapproved_limit = preapproved_limit
+        self.salary = salary
+        self.reasons = LazyReasons(self)
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def decisions(self):
+        return _DECISIONS[self.codes]
+
+    @property
+    def max_allowed(self):
+        return self.rules.max_preapproved_multiple * self.preapproved_limit
+
+    @property
+    def approved(self):
+        return self.codes <= APPROVED_AFFORDABLE
+
+
+def _column(name, values, scalar=False):
+    """`values` as a 1-D (or, with `scalar`, 0-D) array of finite numbers; raises ValueError otherwise."""
+    try:
+        array = np.asarray(values)
+    except ValueError as e:  # ragged nested lists
+        raise ValueError(f"{name} must be a list of numbers") from e
+    if array.ndim != 1 and not (scalar and array.ndim == 0):
+        raise ValueError(f"{name} must be a list of numbers" + (" or a single number" if scalar else ""))
+    if array.size and array.dtype.kind not in "iuf":
+        raise ValueError(f"{name} must contain only numbers")
+    if array.dtype.kind == "f" and not np.isfinite(array).all():
+        raise ValueError(f"{name} must contain only finite numbers")
+    return array
+
+
+def evaluate_loans(credit_score, loan_amount, preapproved_limit, salary, tenure=12, rules=None) -> BatchResult:
+    """Evaluate many applicants at once; inputs are array-likes of equal length.
+
+    `tenure` may be a column or a single value for every row. Row i gets the same
+    decision, EMI and reason as
+    `evaluate_loan(credit_score[i], loan_amount[i], preapproved_limit[i], salary[i], tenure[i])`.
+    `rules` defaults to the active compiled rule set. Raises ValueError unless every
+    column is 1-D, numeric and finite and every tenure is 1..MAX_TENURE_MONTHS months.
+    """
+    rules = rules or active_rules()
+    credit_score = _column("credit_score", credit_score)
+    loan_amount = _column("loan_amount", loan_amount)
+    preapproved_limit = _column("preapproved_limit", preapproved_limit)
+    salary = _column("salary", salary)
+    tenure = _column("tenure", tenure, scalar=True)
+    n = len(credit_score)
+    if not (len(loan_amount) == len(preapproved_limit) == len(salary) == n):
+        raise ValueError("credit_score, loan_amount, preapproved_limit and salary must have the same length")
+    if tenure.ndim and len(tenure) != n:
+        raise ValueError("tenure must be a single value or have one entry per row")
+    # the conversational TENURE step accepts whole months in 1..MAX_TENURE_MONTHS only
+    if tenure.size and ((tenure < 1) | (tenure > MAX_TENURE_MONTHS) | (tenure != np.floor(tenure))).any():
+        raise ValueError(f"tenure must be a whole number of months between 1 and {MAX_TENURE_MONTHS}")
+
+    emi = emi_array(loan_amount, tenure, rules.annual_rate)
+    affordable = (salary != 0) & (emi <= rules.max_emi_to_salary * salary)
+    cap = rules.max_preapproved_multiple * preapproved_limit
+
+    # the scalar rules are checked in order, so later conditions only apply where earlier ones didn't
+    codes = np.select(
+        [
+            credit_score < rules.min_credit_score,
+            loan_amount <= preapproved_limit,
+            (loan_amount <= cap) & affordable,
+            loan_amount <= cap,
+        ],
+        [REJECTED_CREDIT_SCORE, APPROVED_WITHIN_LIMIT, APPROVED_AFFORDABLE, REJECTED_UNAFFORDABLE],
+        default=REJECTED_OVER_MAX,
+    ).astype(np.int8)
+
+    return BatchResult(rules, codes, emi, credit_score, loan_amount, preapproved_limit, salary)
@@ -2,12 +2,22 @@ def greet_start():
     return "Welcome to Tata Capital! I'm your AI loan assistant. Please enter your phone number to get started." 
 
 
-def ask_loan_amount(name=None):
+def ask_loan_amount(name=None, offer=None):
+    if name and offer:
+        return f"Hello {name}, {offer} How much loan do you need? (enter amount in numbers, e.g. 300000)"
     if name:
         return f"Hello {name}, how much loan do you need? (enter amount in numbers, e.g. 300000)"
     return "How much loan do you need? (enter amount in numbers, e.g. 300000)"
 
 
+def pre_approved_offer(preapproved_limit, best):
+    """What a registered customer can borrow; `best` is (amount, tenure) from their offer envelope."""
+    amount, tenure = best
+    if amount > preapproved_limit:
+        return f"you are pre-approved for ₹{preapproved_limit:,} and can borrow up to ₹{amount:,} over {tenure} months or longer."
+    return f"you are pre-approved for up to ₹{amount:,}."
+
+
 def ask_tenure():
     return "Please enter desired loan tenure in months (e.g. 12, 24, 36)."
 
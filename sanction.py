@@ -1,67 +1,96 @@
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
+"""Sanction letter PDFs.
+
+The letter layout never changes, so it is rendered with ReportLab once per
+process into a byte template whose applicant fields are `@@field@@` markers; a
+letter then only stamps its (escaped) values into the page content stream,
+deflates the stream (the template is rendered uncompressed so the markers can be
+found) and fixes up the PDF cross-reference table. A ReportLab form XObject would not help
+here: forms belong to one document and every letter is its own file.
+
+Values that are not printable ASCII (e.g. a name in another script) are drawn
+with ReportLab directly, as before, so its font substitution still applies.
+
+Letters are content-addressed: the id is a digest of the application (the
+`create_sanction_letter` arguments), so regenerating the same application
+returns the existing file. Files live under a two-level fan-out,
+`generated/ab/cd/<id>.pdf`, and are found through the `sanction_letters` index in
+storage, which `/generated/<id>.pdf` serves from. `expire_letters` drops letters
+older than `SANCTION_RETENTION_DAYS` and `compact` removes files the index does
+not know about; the app runs both every `SANCTION_RETENTION_INTERVAL` seconds.
+
+ReportLab is imported with the first letter (or by `warm()`), not with the app.
+
+`create_sanction_letters` renders many letters in one process for backfills;
+`python sanction.py letters.jsonl [--workers N]` runs it over a JSONL file of
+`create_sanction_letter` arguments, and `python sanction.py --expire` runs the
+retention job once.
+"""
+import hashlib
+import io
+import json
 import os
+import re
+import threading
+import time
+import zlib
 from datetime import datetime
-import math
 
+import metrics
+import storage
+from amortization import emi
 
-def _ensure_dir(path):
-    if not os.path.exists(path):
-        os.makedirs(path, exist_ok=True)
+# render time of letters rendered in this process (inline fallback, scripts); queued letters render
+# in worker processes, and sanction_queue records their render time, queue_wait and job phases here
+SANCTION_SECONDS = metrics.histogram("loanbot_sanction_seconds", "Sanction letter time by phase.", ("op",))
 
+FIELDS = ("sanction_no", "date", "name", "guest_id", "credit_score", "salary", "preapproved_limit",
+          "amount", "tenure", "annual_rate", "emi", "total_payable")
 
-def _calc_emi(principal, months, annual_rate):
-    # EMI formula: E = P * r * (1+r)^n / ((1+r)^n - 1)
-    if months <= 0:
-        return 0
-    r = annual_rate / 12.0 / 100.0
-    if r == 0:
-        return principal / months
-    numerator = principal * r * (1 + r) ** months
-    denominator = (1 + r) ** months - 1
-    emi = numerator / denominator
-    return emi
+# ReportLab's `invariant` output uses this timestamp; letters swap in their own
+_INVARIANT_DATE = b"D:20000101000000+00'00'"
 
+RETENTION_DAYS = float(os.environ.get("SANCTION_RETENTION_DAYS", "30"))
+RETENTION_INTERVAL = float(os.environ.get("SANCTION_RETENTION_INTERVAL", "3600"))
 
-def create_sanction_letter(name, amount, tenure, salary=None, preapproved_limit=None, credit_score=None, guest_id=None, annual_rate=12.0):
-    """Generate a detailed sanction letter PDF in `generated/` and return its relative path.
+LETTERS = metrics.counter("loanbot_sanction_letters_total", "Sanction letter requests by result.", ("result",))
 
-    The function is backward-compatible when only (name, amount, tenure) are provided.
-    """
-    gen_dir = os.path.join(os.path.dirname(__file__), "generated")
-    _ensure_dir(gen_dir)
+_LETTER_NAME = re.compile(r"^([0-9a-f]{32})\.pdf$")
+# flat `generated/sanction_<time>.pdf` files written before letters were indexed
+_LEGACY_NAME = re.compile(r"^sanction_[0-9TZ]+\.pdf$")
 
-    ts = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
-    file_name = f"sanction_{ts}.pdf"
-    file_path = os.path.join(gen_dir, file_name)
+_templates = {}
+_templates_lock = threading.Lock()
+# shard directories already created by this process
+_shard_dirs = set()
 
-    emi = _calc_emi(amount, tenure, annual_rate)
-    total_payable = emi * tenure
-    sanction_no = f"SAN-{int(datetime.utcnow().timestamp())}-{abs(hash(name))%1000}"
 
-    c = canvas.Canvas(file_path, pagesize=A4)
-    width, height = A4
+def _ensure_dir(path):
+    if not os.path.exists(path):
+        os.makedirs(path, exist_ok=True)
 
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(60, height - 60, "PERSONAL LOAN SANCTION LETTER")
 
-    c.setFont("Helvetica", 11)
-    y = height - 100
-    lines = [
-        f"Sanction No: {sanction_no}",
-        f"Date: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%SZ')}",
+def _calc_emi(principal, months, annual_rate):
+    # EMI formula: E = P * r * (1+r)^n / ((1+r)^n - 1), shared with underwriting
+    return emi(principal, months, annual_rate)
+
+
+def _letter_lines(v):
+    """Body lines for display values `v`; `salary` / `preapproved_limit` are None when unknown."""
+    return [
+        f"Sanction No: {v['sanction_no']}",
+        f"Date: {v['date']}",
         "",
-        f"Customer Name: {name}",
-        f"Guest ID: {guest_id or 'N/A'}",
-        f"Credit Score: {credit_score or 'N/A'}",
-        f"Monthly Salary: ₹{salary:,}" if salary else "Monthly Salary: N/A",
-        f"Pre-approved Limit: ₹{preapproved_limit:,}" if preapproved_limit else "Pre-approved Limit: N/A",
+        f"Customer Name: {v['name']}",
+        f"Guest ID: {v['guest_id']}",
+        f"Credit Score: {v['credit_score']}",
+        f"Monthly Salary: ₹{v['salary']}" if v["salary"] is not None else "Monthly Salary: N/A",
+        f"Pre-approved Limit: ₹{v['preapproved_limit']}" if v["preapproved_limit"] is not None else "Pre-approved Limit: N/A",
         "",
-        f"Requested Loan Amount: ₹{amount:,}",
-        f"Tenure: {tenure} months",
-        f"Annual Interest Rate (assumed): {annual_rate}%",
-        f"Estimated EMI (monthly): ₹{emi:,.2f}",
-        f"Total Payable (approx.): ₹{total_payable:,.2f}",
+        f"Requested Loan Amount: ₹{v['amount']}",
+        f"Tenure: {v['tenure']} months",
+        f"Annual Interest Rate (assumed): {v['annual_rate']}%",
+        f"Estimated EMI (monthly): ₹{v['emi']}",
+        f"Total Payable (approx.): ₹{v['total_payable']}",
         "",
         "Status: APPROVED",
         "",
@@ -69,6 +98,25 @@ def create_sanction_letter(name, amount, tenure, salary=None, preapproved_limit=
         "This sanction letter is a system-generated document for demonstration purposes.",
     ]
 
+
+def _canvas(buf, **options):
+    """A ReportLab canvas on A4; ReportLab is imported on first use, it is slow to load."""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    return canvas.Canvas(buf, pagesize=A4, **options)
+
+
+def _draw(c, lines):
+    from reportlab.lib.pagesizes import A4
+
+    width, height = A4
+
+    c.setFont("Helvetica-Bold", 16)
+    c.drawString(60, height - 60, "PERSONAL LOAN SANCTION LETTER")
+
+    c.setFont("Helvetica", 11)
+    y = height - 100
     for line in lines:
         c.drawString(60, y, line)
         y -= 18
@@ -76,7 +124,334 @@ def create_sanction_letter(name, amount, tenure, salary=None, preapproved_limit=
             c.showPage()
             y = height - 60
 
-    c.save()
-    # return path relative to app root so frontend can request '/generated/<file>'
-    rel_path = os.path.join('generated', file_name).replace('\\', '/')
-    return rel_path
+
+class _Template:
+    """A rendered letter with `@@field@@` markers, split around its page content stream."""
+
+    def __init__(self, has_salary, has_limit):
+        markers = {f: f"@@{f}@@" for f in FIELDS}
+        if not has_salary:
+            markers["salary"] = None
+        if not has_limit:
+            markers["preapproved_limit"] = None
+        buf = io.BytesIO()
+        c = _canvas(buf, pageCompression=0, invariant=1)
+        _draw(c, _letter_lines(markers))
+        c.save()
+        pdf = buf.getvalue()
+
+        content = int(re.search(rb"/Contents (\d+) 0 R", pdf).group(1))
+        start = pdf.index(b"\n%d 0 obj\n" % content) + 1
+        data = pdf.index(b"stream\n", start) + len(b"stream\n")
+        end = pdf.index(b"endstream", data)
+        xref = pdf.index(b"\nxref\n") + 1
+        trailer = pdf.index(b"trailer\n", xref)
+
+        self.head = pdf[:start]
+        self.stream_header = pdf[start:data]
+        self.stream = pdf[data:end]
+        self.between = pdf[end:xref]
+        self.content_start = start
+        self.offsets = [int(line[:10]) for line in pdf[xref:trailer].splitlines()[2:]]
+        self.trailer = pdf[trailer:pdf.index(b"startxref", trailer)]
+        self.doc_id = re.search(rb"\[<([0-9a-f]+)>", self.trailer).group(1)
+        # stream pieces alternate literal bytes and field names: [bytes, field, bytes, field, ..., bytes]
+        self.pieces = re.split(rb"@@(\w+)@@", self.stream)
+        self._check()
+
+    def _check(self):
+        pdf = self.head + self.stream_header + self.stream + self.between
+        for n, offset in enumerate(self.offsets[1:], start=1):
+            if not pdf.startswith(b"%d 0 obj" % n, offset):
+                raise RuntimeError(f"unexpected layout in ReportLab output (object {n})")
+
+    def render(self, values, now):
+        """PDF bytes with `values` (field -> escaped bytes) stamped in."""
+        parts = self.pieces[:]
+        for i in range(1, len(parts), 2):
+            parts[i] = values[parts[i].decode()]
+        stream = zlib.compress(b"".join(parts))
+        header = self.stream_header.replace(b"/Length %d" % len(self.stream), b"/Filter /FlateDecode /Length %d" % len(stream))
+        head = self.head.replace(_INVARIANT_DATE, now.strftime("D:%Y%m%d%H%M%S+00'00'").encode())
+        shift = len(header) + len(stream) - len(self.stream_header) - len(self.stream)
+        body = b"".join((head, header, stream, self.between))
+        xref = [b"xref\n0 %d\n" % len(self.offsets), b"0000000000 65535 f \n"]
+        for offset in self.offsets[1:]:
+            xref.append(b"%010d 00000 n \n" % (offset + shift if offset > self.content_start else offset))
+        trailer = self.trailer.replace(self.doc_id, hashlib.md5(stream).hexdigest().encode())
+        return b"".join((body, *xref, trailer, b"startxref\n%d\n%%%%EOF\n" % (len(body))))
+
+
+def _template(has_salary, has_limit):
+    key = (has_salary, has_limit)
+    template = _templates.get(key)
+    if template is None:
+        with _templates_lock:
+            template = _templates.get(key)
+            if template is None:
+                template = _templates[key] = _Template(has_salary, has_limit)
+    return template
+
+
+def _escape(text):
+    """PDF string bytes for printable ASCII `text`, or None if ReportLab must encode it."""
+    if not (text.isascii() and text.isprintable()):
+        return None
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)").encode()
+
+
+def letter_id(name, amount, tenure, salary=None, preapproved_limit=None, credit_score=None, guest_id=None, annual_rate=12.0) -> str:
+    """Stable id of an application: the same arguments always give the same letter."""
+    application = dict(name=name, amount=amount, tenure=tenure, salary=salary, preapproved_limit=preapproved_limit,
+                       credit_score=credit_score, guest_id=guest_id, annual_rate=annual_rate)
+    canonical = json.dumps(application, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _display_values(name, amount, tenure, salary, preapproved_limit, credit_score, guest_id, annual_rate, now, sanction_no):
+    monthly = _calc_emi(amount, tenure, annual_rate)
+    return {
+        "sanction_no": sanction_no,
+        "date": now.strftime('%Y-%m-%d %H:%M:%SZ'),
+        "name": f"{name}",
+        "guest_id": f"{guest_id or 'N/A'}",
+        "credit_score": f"{credit_score or 'N/A'}",
+        "salary": f"{salary:,}" if salary else None,
+        "preapproved_limit": f"{preapproved_limit:,}" if preapproved_limit else None,
+        "amount": f"{amount:,}",
+        "tenure": f"{tenure}",
+        "annual_rate": f"{annual_rate}",
+        "emi": f"{monthly:,.2f}",
+        "total_payable": f"{monthly * tenure:,.2f}",
+    }
+
+
+def render_letter(name, amount, tenure, salary=None, preapproved_limit=None, credit_score=None, guest_id=None, annual_rate=12.0, now=None) -> bytes:
+    """PDF bytes of one sanction letter (the arguments of `create_sanction_letter`)."""
+    now = now or datetime.utcnow()
+    lid = letter_id(name, amount, tenure, salary, preapproved_limit, credit_score, guest_id, annual_rate)
+    v = _display_values(name, amount, tenure, salary, preapproved_limit, credit_score, guest_id, annual_rate, now, _sanction_no(lid))
+    escaped = {f: _escape(text) for f, text in v.items() if text is not None}
+    if None in escaped.values():
+        buf = io.BytesIO()
+        c = _canvas(buf)
+        _draw(c, _letter_lines(v))
+        c.save()
+        return buf.getvalue()
+    return _template(v["salary"] is not None, v["preapproved_limit"] is not None).render(escaped, now)
+
+
+def _sanction_no(lid):
+    return f"SAN-{lid[:12].upper()}"
+
+
+def _shard_path(lid):
+    # two levels of 256 directories keep each directory small
+    return f"{lid[:2]}/{lid[2:4]}/{lid}.pdf"
+
+
+def _store_letter(gen_dir, lid, letter, now):
+    """Render `letter` into its shard file; returns its index row."""
+    pdf = render_letter(**letter, now=now)
+    rel = _shard_path(lid)
+    path = os.path.join(gen_dir, rel)
+    shard = os.path.dirname(path)
+    if shard not in _shard_dirs:
+        os.makedirs(shard, exist_ok=True)
+        _shard_dirs.add(shard)
+    # write then rename, so a concurrent render of the same letter never exposes a partial file
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        f = open(tmp, "wb")
+    except FileNotFoundError:
+        # the shard was pruned by a retention run in another process
+        os.makedirs(shard, exist_ok=True)
+        f = open(tmp, "wb")
+    with f:
+        f.write(pdf)
+    os.replace(tmp, path)
+    return (lid, rel, _sanction_no(lid), len(pdf), time.time())
+
+
+def _write_letters(gen_dir, letters, now=None):
+    """Render the letters the index does not already have; returns their URL paths in order."""
+    ids = [letter_id(**letter) for letter in letters]
+    known = storage.letter_paths_for(ids)
+    rows, reused = [], 0
+    for lid, letter in zip(ids, letters):
+        rel = known.get(lid)
+        if rel and os.path.exists(os.path.join(gen_dir, rel)):
+            reused += 1
+            continue
+        rows.append(_store_letter(gen_dir, lid, letter, now or datetime.utcnow()))
+        known[lid] = rows[-1][1]
+    # one index transaction for the whole batch
+    if rows:
+        storage.put_letters(rows)
+    LETTERS.inc("rendered", amount=len(rows))
+    LETTERS.inc("reused", amount=reused)
+    # relative to the app root so the frontend can request '/generated/<id>.pdf'
+    return [f"generated/{lid}.pdf" for lid in ids]
+
+
+def warm():
+    """Load ReportLab and render the letter templates ahead of the first approval."""
+    _generated_dir()
+    for has_salary in (True, False):
+        for has_limit in (True, False):
+            _template(has_salary, has_limit)
+
+
+def _generated_dir():
+    gen_dir = os.environ.get("GENERATED_DIR") or os.path.join(os.path.dirname(__file__), "generated")
+    _ensure_dir(gen_dir)
+    return gen_dir
+
+
+def letter_file(name: str):
+    """Absolute path of the letter served as `/generated/<name>`, or None if it is unknown.
+
+    `name` is `<letter id>.pdf`, resolved through the index; legacy flat
+    `sanction_<time>.pdf` files are still served while they exist.
+    """
+    gen_dir = _generated_dir()
+    match = _LETTER_NAME.match(name)
+    if match:
+        row = storage.get_letter(match.group(1))
+        path = os.path.join(gen_dir, row["path"]) if row else None
+    elif _LEGACY_NAME.match(name):
+        path = os.path.join(gen_dir, name)
+    else:
+        return None
+    return path if path and os.path.isfile(path) else None
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def _prune_dirs(gen_dir, rel_paths):
+    for rel in {os.path.dirname(p) for p in rel_paths}:
+        _shard_dirs.discard(os.path.join(gen_dir, rel))
+        for d in (rel, os.path.dirname(rel)):
+            try:
+                os.rmdir(os.path.join(gen_dir, d))
+            except OSError:
+                # not empty (or already gone)
+                pass
+
+
+def expire_letters(max_age_days: float = None, batch: int = 500) -> int:
+    """Delete letters created more than `max_age_days` ago (default SANCTION_RETENTION_DAYS); returns the count."""
+    max_age_days = RETENTION_DAYS if max_age_days is None else max_age_days
+    gen_dir = _generated_dir()
+    cutoff = time.time() - max_age_days * 86400
+    expired = 0
+    while True:
+        rows = storage.expired_letters(cutoff, batch)
+        if not rows:
+            break
+        for _, rel in rows:
+            _remove(os.path.join(gen_dir, rel))
+        storage.delete_letters([lid for lid, _ in rows])
+        _prune_dirs(gen_dir, [rel for _, rel in rows])
+        expired += len(rows)
+    # legacy flat files have no index row; their modification time is all we have
+    for entry in os.scandir(gen_dir):
+        if _LEGACY_NAME.match(entry.name) and entry.stat().st_mtime < cutoff:
+            expired += _remove(entry.path)
+    LETTERS.inc("expired", amount=expired)
+    return expired
+
+
+def compact(grace_seconds: float = 3600) -> dict:
+    """Reconcile the letter directories with the index.
+
+    Removes shard files (and leftover temporary files) older than `grace_seconds`
+    that no index row points to, drops index rows whose file is gone, and prunes
+    empty shard directories.
+    """
+    gen_dir = _generated_dir()
+    indexed = storage.letter_paths()
+    cutoff = time.time() - grace_seconds
+    orphans, seen = [], set()
+    for top in os.scandir(gen_dir):
+        if not (top.is_dir() and len(top.name) == 2):
+            continue
+        for sub in os.scandir(top.path):
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                rel = f"{top.name}/{sub.name}/{entry.name}"
+                if rel in indexed:
+                    seen.add(rel)
+                elif entry.stat().st_mtime < cutoff:
+                    orphans.append(rel)
+    for rel in orphans:
+        _remove(os.path.join(gen_dir, rel))
+    missing = [lid for rel, lid in indexed.items() if rel not in seen]
+    storage.delete_letters(missing)
+    _prune_dirs(gen_dir, orphans + [rel for rel in indexed if rel not in seen])
+    return {"orphan_files": len(orphans), "missing_files": len(missing)}
+
+
+def run_retention() -> dict:
+    """The periodic job: expire old letters, then compact."""
+    return {"expired": expire_letters(), **compact()}
+
+
+@metrics.timed(SANCTION_SECONDS, "render")
+def create_sanction_letter(name, amount, tenure, salary=None, preapproved_limit=None, credit_score=None, guest_id=None, annual_rate=12.0):
+    """Generate a detailed sanction letter PDF in `generated/` and return its relative path.
+
+    The function is backward-compatible when only (name, amount, tenure) are provided.
+    """
+    return _write_letters(_generated_dir(), [dict(
+        name=name, amount=amount, tenure=tenure, salary=salary, preapproved_limit=preapproved_limit,
+        credit_score=credit_score, guest_id=guest_id, annual_rate=annual_rate,
+    )])[0]
+
+
+@metrics.timed(SANCTION_SECONDS, "bulk")
+def create_sanction_letters(letters) -> list:
+    """Render every letter in `letters` (dicts of `create_sanction_letter` arguments); returns their paths."""
+    return _write_letters(_generated_dir(), list(letters))
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+if __name__ == "__main__":
+    import argparse
+    import multiprocessing
+    import time
+    from concurrent.futures import ProcessPoolExecutor
+
+    parser = argparse.ArgumentParser(description="Render sanction letters in bulk from a JSONL file, or expire old ones.")
+    parser.add_argument("path", nargs="?", help="one JSON object of create_sanction_letter arguments per line")
+    parser.add_argument("--workers", type=int, default=1, help="processes; each renders whole chunks")
+    parser.add_argument("--chunk", type=int, default=500, help="letters per chunk")
+    parser.add_argument("--expire", action="store_true", help="run the retention job (SANCTION_RETENTION_DAYS) and exit")
+    args = parser.parse_args()
+
+    if args.expire:
+        print(run_retention())
+        raise SystemExit(0)
+    if not args.path:
+        parser.error("a JSONL path or --expire is required")
+    with open(args.path, encoding="utf-8") as f:
+        letters = [json.loads(line) for line in f if line.strip()]
+    t0 = time.perf_counter()
+    if args.workers > 1:
+        with ProcessPoolExecutor(args.workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            paths = [p for chunk in pool.map(create_sanction_letters, _chunks(letters, args.chunk)) for p in chunk]
+    else:
+        paths = create_sanction_letters(letters)
+    elapsed = time.perf_counter() - t0
+    print(f"rendered {len(paths)} letters in {elapsed:.2f}s ({len(paths) / elapsed:.0f}/s)")
@@ -0,0 +1,192 @@
+"""Background rendering queue for sanction letters.
+
+Approval no longer waits on ReportLab: the TENURE step submits a job and replies
+straight away, and a small set of consumer tasks feeds jobs to a process pool
+(ReportLab is CPU-bound, so threads would just contend for the GIL).
+
+- The queue is bounded (`SANCTION_QUEUE_SIZE`); `submit` waits up to
+  `SANCTION_ENQUEUE_TIMEOUT` seconds for room and then raises `QueueFull` so the
+  caller can fall back to rendering inline.
+- If a worker process dies the pool is rebuilt and the job retried once.
+- Job status (last `SANCTION_MAX_JOBS` jobs) is kept in memory and in the
+  `sanction_jobs` table, so with several workers sharing sessions
+  (`SESSION_BACKEND=sqlite`) `/sanction/{job_id}` and the chat turn can find a job
+  whichever worker queued it.
+- Queue wait, render time (measured in the worker, reported back with the
+  result) and end-to-end job time go to `loanbot_sanction_seconds`, finished
+  jobs to `loanbot_sanction_jobs_total{status}`; the queue depth is a gauge.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import metrics
+import storage
+from executors import run_io
+
+logger = logging.getLogger(__name__)
+
+WORKERS = int(os.environ.get("SANCTION_WORKERS", "2"))
+QUEUE_SIZE = int(os.environ.get("SANCTION_QUEUE_SIZE", "64"))
+ENQUEUE_TIMEOUT = float(os.environ.get("SANCTION_ENQUEUE_TIMEOUT", "2.0"))
+MAX_JOBS = int(os.environ.get("SANCTION_MAX_JOBS", "10000"))
+
+JOBS = OrderedDict()
+
+SANCTION_SECONDS = metrics.histogram("loanbot_sanction_seconds", "Sanction letter time by phase.", ("op",))
+JOBS_TOTAL = metrics.counter("loanbot_sanction_jobs_total", "Finished sanction jobs by status.", ("status",))
+
+_queue = None
+_pool = None
+_consumers = []
+
+
+class QueueFull(Exception):
+    """Raised when a job could not be queued within ENQUEUE_TIMEOUT."""
+
+
+def _render_letter(kwargs):
+    # runs in the worker process, whose metrics never reach /metrics: the render time
+    # goes back with the result and is recorded by the parent
+    from sanction import create_sanction_letter
+
+    started = time.perf_counter()
+    file_name = create_sanction_letter(**kwargs)
+    return file_name, time.perf_counter() - started
+
+
+def _warm_worker():
+    # runs in the worker process
+    from sanction import warm
+
+    warm()
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        # spawn, not fork: the parent has executor threads and an event loop running
+        _pool = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def _reset_pool(broken):
+    global _pool
+    if _pool is broken:
+        _pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+async def _record(job_id, **fields):
+    job = JOBS.setdefault(job_id, {"job_id": job_id})
+    job.update(fields)
+    # keep the job table bounded, dropping the oldest entries first
+    while len(JOBS) > MAX_JOBS:
+        JOBS.popitem(last=False)
+    # other workers read the status from storage; this one keeps serving its own jobs from memory
+    try:
+        await run_io(storage.put_sanction_job, dict(job), MAX_JOBS if fields.get("status") == "queued" else None)
+    except Exception:
+        logger.exception("could not save status of sanction job %s", job_id)
+    return job
+
+
+async def _render(kwargs):
+    loop = asyncio.get_running_loop()
+    for attempt in range(2):
+        pool = _get_pool()
+        try:
+            return await loop.run_in_executor(pool, _render_letter, kwargs)
+        except BrokenProcessPool:
+            logger.warning("sanction worker pool broke; restarting (attempt %d)", attempt + 1)
+            _reset_pool(pool)
+            if attempt:
+                raise
+
+
+async def _consume(queue):
+    while True:
+        job_id, kwargs, enqueued_at = await queue.get()
+        started = time.perf_counter()
+        SANCTION_SECONDS.observe(started - enqueued_at, "queue_wait")
+        await _record(job_id, status="running")
+        try:
+            file_name, render_seconds = await _render(kwargs)
+            SANCTION_SECONDS.observe(render_seconds, "render")
+            await _record(job_id, status="done", file=file_name)
+            JOBS_TOTAL.inc("done")
+        except Exception as e:
+            logger.exception("sanction job %s failed", job_id)
+            await _record(job_id, status="failed", error=str(e))
+            JOBS_TOTAL.inc("failed")
+        finally:
+            SANCTION_SECONDS.observe(time.perf_counter() - started, "job")
+            queue.task_done()
+
+
+def _ensure_started():
+    global _queue
+    if _queue is None:
+        _queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        _consumers.extend(asyncio.create_task(_consume(_queue)) for _ in range(WORKERS))
+
+
+async def submit(**kwargs) -> str:
+    """Queue a sanction letter for rendering and return its job id.
+
+    kwargs are passed to `sanction.create_sanction_letter`.
+    """
+    _ensure_started()
+    job_id = uuid.uuid4().hex
+    await _record(job_id, status="queued")
+    try:
+        await asyncio.wait_for(_queue.put((job_id, kwargs, time.perf_counter())), ENQUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        JOBS.pop(job_id, None)
+        try:
+            await run_io(storage.delete_sanction_job, job_id)
+        except Exception:
+            logger.exception("could not delete sanction job %s", job_id)
+        JOBS_TOTAL.inc("queue_full")
+        raise QueueFull(f"sanction queue full ({QUEUE_SIZE} pending)")
+    return job_id
+
+
+@metrics.collector
+def _queue_metrics():
+    return [("loanbot_sanction_queue_depth", "gauge", "Sanction jobs waiting for a renderer.",
+             {(): _queue.qsize() if _queue is not None else 0})]
+
+
+async def warm():
+    """Start the worker processes and load ReportLab in each, ahead of the first approval."""
+    loop = asyncio.get_running_loop()
+    pool = _get_pool()
+    await asyncio.gather(*(loop.run_in_executor(pool, _warm_worker) for _ in range(WORKERS)))
+
+
+def get_job(job_id: str):
+    """Return the status dict for a job (`status` is queued/running/done/failed), or None.
+
+    Jobs queued by another worker are read from storage, so call it off the event loop.
+    """
+    job = JOBS.get(job_id)
+    return dict(job) if job else storage.get_sanction_job(job_id)
+
+
+async def shutdown():
+    global _queue, _pool
+    for task in _consumers:
+        task.cancel()
+    await asyncio.gather(*_consumers, return_exceptions=True)
+    _consumers.clear()
+    _queue = None
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
@@ -0,0 +1,221 @@
+"""Pluggable session stores for conversation state keyed by session_id.
+
+- `MemorySessionStore`: in-process LRU with idle TTL and a max entry count.
+- `SQLiteSessionStore`: sessions serialized into a SQLite table, so several
+  uvicorn workers (and restarts) share the same state.
+
+Pick the backend with `SESSION_BACKEND` (`memory` or `sqlite`); `SESSION_TTL`
+(seconds idle), `SESSION_MAX_ENTRIES` and `SESSION_DB` tune it. Both stores
+count hits, misses, evictions and expirations in `stats()`.
+
+Sessions are plain dicts for the agents; stores that persist them use `encode` /
+`decode`, which write the known session fields positionally instead of repeating
+key names in every record.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from executors import run_io
+
+# Known session keys, in encoding order. Append new fields at the end so stored
+# sessions stay decodable.
+FIELDS = (
+    "step",
+    "phone",
+    "customer",
+    "guest_id",
+    "loan_amount",
+    "tenure",
+    "last_decision",
+    "last_reason",
+    "last_details",
+    "last_file",
+    "sanction_job",
+)
+_FIELD_SET = frozenset(FIELDS)
+
+
+def encode(session: dict) -> bytes:
+    """Serialize a session as a compact JSON array: `[extras, *known fields by position]`."""
+    extras = {k: v for k, v in session.items() if k not in _FIELD_SET}
+    values = [extras or None] + [session.get(f) for f in FIELDS]
+    while values and values[-1] is None:
+        values.pop()
+    return json.dumps(values, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def decode(data: bytes) -> dict:
+    values = json.loads(data)
+    if not values:
+        return {}
+    session = {f: v for f, v in zip(FIELDS, values[1:]) if v is not None}
+    session.update(values[0] or {})
+    return session
+
+
+class SessionStore:
+    """Interface for session backends. Methods are async so backends may do I/O."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    async def get(self, session_id: str):
+        """Return the session dict for `session_id`, or None if unknown or expired."""
+        raise NotImplementedError
+
+    async def save(self, session_id: str, session: dict):
+        raise NotImplementedError
+
+    async def delete(self, session_id: str):
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self).__name__,
+            "size": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class MemorySessionStore(SessionStore):
+    """LRU of live session dicts with an idle TTL; the least recently used session goes first."""
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 1800):
+        super().__init__()
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # session_id -> (last_access, session); ordered oldest access first
+        self._data = OrderedDict()
+
+    def _expire(self, now):
+        while self._data:
+            session_id, (last_access, _) = next(iter(self._data.items()))
+            if now - last_access < self.ttl:
+                break
+            del self._data[session_id]
+            self.expirations += 1
+
+    async def get(self, session_id):
+        now = time.monotonic()
+        entry = self._data.get(session_id)
+        if entry is None or now - entry[0] >= self.ttl:
+            if entry is not None:
+                del self._data[session_id]
+                self.expirations += 1
+            self.misses += 1
+            return None
+        self._data[session_id] = (now, entry[1])
+        self._data.move_to_end(session_id)
+        self.hits += 1
+        return entry[1]
+
+    async def save(self, session_id, session):
+        now = time.monotonic()
+        self._data[session_id] = (now, session)
+        self._data.move_to_end(session_id)
+        self._expire(now)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    async def delete(self, session_id):
+        self._data.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteSessionStore(SessionStore):
+    """Sessions encoded into a SQLite table (WAL) so multiple worker processes can share them.
+
+    Expired rows are purged every `purge_every` saves.
+    """
+
+    def __init__(self, path: str, ttl: float = 1800, purge_every: int = 500):
+        super().__init__()
+        self.path = path
+        self.ttl = ttl
+        self.purge_every = purge_every
+        self._saves = 0
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " session_id TEXT PRIMARY KEY, data BLOB NOT NULL, expires_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _get(self, session_id):
+        row = self._conn().execute(
+            "SELECT data, expires_at FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        if row[1] <= time.time():
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self.hits += 1
+        return decode(row[0])
+
+    def _save(self, session_id, session):
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions (session_id, data, expires_at) VALUES (?, ?, ?)",
+            (session_id, encode(session), now + self.ttl),
+        )
+        self._saves += 1
+        if self._saves % self.purge_every == 0:
+            purged = conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,)).rowcount
+            self.expirations += max(purged, 0)
+
+    def _delete(self, session_id):
+        self._conn().execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    async def get(self, session_id):
+        return await run_io(self._get, session_id)
+
+    async def save(self, session_id, session):
+        await run_io(self._save, session_id, session)
+
+    async def delete(self, session_id):
+        await run_io(self._delete, session_id)
+
+    def __len__(self):
+        return self._conn().execute("SELECT count(*) FROM sessions").fetchone()[0]
+
+
+def create_session_store() -> SessionStore:
+    """Build the session store selected by the SESSION_* environment variables."""
+    backend = os.environ.get("SESSION_BACKEND", "memory").lower()
+    ttl = float(os.environ.get("SESSION_TTL", "1800"))
+    if backend == "sqlite":
+        path = os.environ.get("SESSION_DB") or os.path.join(os.path.dirname(__file__), "sessions.db")
+        return SQLiteSessionStore(path, ttl=ttl)
+    if backend != "memory":
+        raise ValueError(f"Unknown SESSION_BACKEND {backend!r}; expected 'memory' or 'sqlite'")
+    return MemorySessionStore(max_entries=int(os.environ.get("SESSION_MAX_ENTRIES", "10000")), ttl=ttl)
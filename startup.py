@@ -0,0 +1,75 @@
+"""Cold start tracking and background warm-up.
+
+ReportLab, the openai SDK and the sanction worker processes are loaded on first
+use, so importing `main` stays fast and the first request is answered sooner.
+Right after startup the app warms them up in the background, one part at a
+time, so the first approval or LLM question does not pay for them either;
+`WARMUP=0` leaves them to first use (the offer envelopes are still precomputed).
+
+`GET /ready` reports `cold` while any part is still loading and `warm` once all
+are loaded (or skipped, e.g. no OpenAI key), with each part's state and the
+startup milestones in ms since `main` started importing.
+`python tools/startup_time.py` measures the import breakdown and cold start.
+"""
+import asyncio
+import logging
+import os
+import time
+
+STARTED = time.perf_counter()
+
+WARMUP = os.environ.get("WARMUP", "1").lower() not in ("0", "off", "false", "no")
+
+logger = logging.getLogger(__name__)
+
+# milestone -> ms since STARTED
+_milestones = {}
+# part -> cold | warming | warm | skipped | failed
+_parts = {}
+
+
+def _ms():
+    return round((time.perf_counter() - STARTED) * 1000, 1)
+
+
+def mark(milestone):
+    """Record the first time `milestone` is reached."""
+    _milestones.setdefault(milestone, _ms())
+
+
+def warm(parts):
+    """Start loading (name, async function) parts in the background; returns the task.
+
+    Parts load one after another; a function returning False marks its part skipped.
+    """
+    for name, _ in parts:
+        _parts[name] = "cold"
+    return asyncio.create_task(_warm(parts))
+
+
+async def _warm(parts):
+    for name, load in parts:
+        _parts[name] = "warming"
+        try:
+            loaded = await load()
+        except Exception:
+            # not fatal: the part loads on first use instead
+            logger.exception("warm-up of %s failed", name)
+            _parts[name] = "failed"
+            continue
+        if loaded is False:
+            _parts[name] = "skipped"
+            continue
+        _parts[name] = "warm"
+        mark(f"{name}_warm")
+    mark("warm")
+
+
+def status() -> dict:
+    cold = any(state in ("cold", "warming") for state in _parts.values())
+    return {
+        "status": "cold" if cold or "started" not in _milestones else "warm",
+        "parts": dict(_parts),
+        "milestones_ms": dict(_milestones),
+        "uptime_ms": _ms(),
+    }
@@ -0,0 +1,200 @@
+"""A small table-driven state machine for the conversation flow in `agents.py`.
+
+Each step is registered once with its handler, an optional input parser and the
+steps it may move to:
+
+    @machine.step("LOAN_AMOUNT", parse=parse_amount, to=("TENURE",))
+    async def loan_amount(session, amount):
+        session["loan_amount"] = amount
+        return goto("TENURE", ask_tenure())
+
+`dispatch` finds the current step with one dict lookup, runs its parser (an
+invalid input is answered with the parser's help text and the step stays put),
+calls the handler and applies the `Transition` it returns. A handler may only
+move to the steps it declared, and `compile()` checks that every declared target
+is a registered step. Interceptors (e.g. "why") are checked before the step.
+
+The time spent in each step is recorded (`timings()`); `observe` registers extra
+callbacks that receive `(step, seconds)` after every turn, and `listen` callbacks
+receive the turn itself: `(session, step, value, to, valid)`.
+"""
+import time
+from typing import Callable, NamedTuple, Optional
+
+
+class Transition(NamedTuple):
+    reply: str
+    to: Optional[str] = None
+
+
+def goto(step: str, reply: str) -> Transition:
+    """Reply and move the session to `step`."""
+    return Transition(reply, step)
+
+
+def stay(reply: str) -> Transition:
+    """Reply and keep the current step."""
+    return Transition(reply)
+
+
+class InvalidInput(Exception):
+    """Raised by a parser; the message is sent back to the user and the step does not change."""
+
+
+class TransitionError(ValueError):
+    """A handler tried to move to a step it did not declare, or a declared step does not exist."""
+
+
+def parse_int(help_text: str, strip_commas: bool = False, minimum: Optional[int] = None,
+              maximum: Optional[int] = None) -> Callable:
+    """Parser for whole numbers (as `int()` reads them); anything else is answered with `help_text`."""
+
+    def parse(message):
+        try:
+            value = int(message.replace(",", "") if strip_commas else message)
+        except Exception:
+            raise InvalidInput(help_text)
+        if (minimum is not None and value < minimum) or (maximum is not None and value > maximum):
+            raise InvalidInput(help_text)
+        return value
+
+    return parse
+
+
+class _Step(NamedTuple):
+    handler: Callable
+    parse: Optional[Callable]
+    to: frozenset
+
+
+class StateMachine:
+    def __init__(self, initial: str, fallback: str):
+        self.initial = initial
+        # reply for a session whose step has no registered handler
+        self.fallback = fallback
+        self._steps = {}
+        self._interceptors = []
+        self._observers = []
+        self._listeners = []
+        # step -> [turns, total seconds, max seconds]
+        self._timings = {}
+        self._compiled = False
+
+    def step(self, name: str, parse: Optional[Callable] = None, to=()):
+        """Register the decorated `async def handler(session, value)` for step `name`.
+
+        `value` is the parsed input if `parse` is given, else the raw message.
+        """
+
+        def register(handler):
+            if name in self._steps:
+                raise TransitionError(f"step {name!r} is already registered")
+            self._steps[name] = _Step(handler, parse, frozenset(to))
+            self._compiled = False
+            return handler
+
+        return register
+
+    def intercept(self, label: str, matches: Callable, to=()):
+        """Register `async def handler(session, message)` for messages where `matches(message)` is true, in any step."""
+
+        def register(handler):
+            self._interceptors.append((label, matches, _Step(handler, None, frozenset(to))))
+            self._compiled = False
+            return handler
+
+        return register
+
+    def observe(self, callback: Callable):
+        """Call `callback(step, seconds)` after every turn."""
+        self._observers.append(callback)
+        return callback
+
+    def listen(self, callback: Callable):
+        """Call `callback(session, step, value, to, valid)` after every turn.
+
+        `value` is the parsed input, `to` the step moved to (None if it stayed) and
+        `valid` False when the parser rejected the input (`value` is then the raw
+        message). A turn whose handler raised is not reported.
+        """
+        self._listeners.append(callback)
+        return callback
+
+    def notify(self, session, step, value, to, valid=True):
+        """Report a turn handled outside `dispatch` (e.g. streaming) to the `listen` callbacks."""
+        for callback in self._listeners:
+            callback(session, step, value, to, valid)
+
+    def compile(self):
+        """Check that every declared transition targets a registered step."""
+        specs = list(self._steps.items()) + [(label, spec) for label, _, spec in self._interceptors]
+        for name, spec in specs:
+            unknown = spec.to - self._steps.keys()
+            if unknown:
+                raise TransitionError(f"step {name!r} declares unknown targets: {', '.join(sorted(unknown))}")
+        if self.initial not in self._steps:
+            raise TransitionError(f"initial step {self.initial!r} is not registered")
+        self._compiled = True
+        return self
+
+    @property
+    def steps(self):
+        return tuple(self._steps)
+
+    async def dispatch(self, message, session) -> str:
+        """Run one turn for `session` and return the reply."""
+        if not self._compiled:
+            self.compile()
+        started = time.perf_counter()
+        for label, matches, spec in self._interceptors:
+            if matches(message):
+                name = label
+                break
+        else:
+            name = session.get("step", self.initial)
+            spec = self._steps.get(name)
+            if spec is None:
+                return self.fallback
+        try:
+            if spec.parse is not None:
+                try:
+                    value = spec.parse(message)
+                except InvalidInput as e:
+                    if self._listeners:
+                        self.notify(session, name, message, None, False)
+                    return str(e)
+            else:
+                value = message
+            reply, to = await spec.handler(session, value)
+            if to is not None:
+                if to not in spec.to:
+                    raise TransitionError(f"step {name!r} may not move to {to!r}")
+                session["step"] = to
+            if self._listeners:
+                self.notify(session, name, value, to)
+            return reply
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def record(self, name, seconds):
+        """Add one turn of `seconds` to step `name` (for turns handled outside `dispatch`, e.g. streaming)."""
+        entry = self._timings.get(name)
+        if entry is None:
+            entry = self._timings[name] = [0, 0.0, 0.0]
+        entry[0] += 1
+        entry[1] += seconds
+        if seconds > entry[2]:
+            entry[2] = seconds
+        for callback in self._observers:
+            callback(name, seconds)
+
+    def timings(self) -> dict:
+        """Per-step turn count and mean/max handler time in milliseconds."""
+        return {
+            name: {
+                "turns": turns,
+                "mean_ms": round(total / turns * 1000, 3),
+                "max_ms": round(worst * 1000, 3),
+            }
+            for name, (turns, total, worst) in self._timings.items()
+        }
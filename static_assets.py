@@ -0,0 +1,170 @@
+"""Frontend files served from memory, and HTTP caching for downloads.
+
+Files under `STATIC_DIR` (default `static/`) are read once, at startup or on the
+first request, together with their gzip (and, when the `brotli` package is
+installed, brotli) encodings, so `GET /` and `GET /static/<path>` never touch the
+disk. Each file gets a strong ETag (a digest of its content, suffixed per
+encoding) and a `Cache-Control` header: `no-cache` for HTML, so browsers and the
+CDN revalidate the page and a conditional request is answered `304` without a
+body, and `STATIC_CACHE_CONTROL` (default `public, max-age=3600`) for the rest.
+Compressed variants are only kept when smaller; responses carry
+`Vary: Accept-Encoding`. Restart the app (or call `load()`) after changing files.
+
+`file_response` serves a file on disk (sanction letter PDFs) with Starlette's
+`FileResponse`, which answers `Range` requests, plus `Cache-Control` and `304`
+for `If-None-Match` / `If-Modified-Since`.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from importlib.util import find_spec
+from typing import Optional
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+
+import metrics
+
+STATIC_DIR = os.environ.get("STATIC_DIR", "static")
+CACHE_CONTROL = os.environ.get("STATIC_CACHE_CONTROL", "public, max-age=3600")
+HTML_CACHE_CONTROL = "no-cache"
+
+BROTLI_AVAILABLE = find_spec("brotli") is not None
+
+# compressing tiny or already compressed files does not pay off
+_MIN_COMPRESS_BYTES = 256
+_COMPRESSIBLE = ("text/", "application/javascript", "application/json", "image/svg+xml", "application/xml")
+
+STATIC_RESPONSES = metrics.counter("loanbot_static_responses_total", "Static responses by encoding (or not_modified).", ("encoding",))
+
+
+@dataclass(slots=True)
+class Asset:
+    """One file with its encodings: encoding ("identity", "gzip", "br") -> (body, ETag)."""
+    media_type: str
+    cache_control: str
+    variants: dict
+
+    def etags(self):
+        return {etag for _, etag in self.variants.values()}
+
+
+# path relative to STATIC_DIR -> Asset; None until load()
+_assets = None
+_load_lock = threading.Lock()
+
+
+def _compress(body: bytes, media_type: str) -> dict:
+    if len(body) < _MIN_COMPRESS_BYTES or not media_type.startswith(_COMPRESSIBLE):
+        return {}
+    encoded = {"gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+    if BROTLI_AVAILABLE:
+        import brotli
+
+        encoded["br"] = brotli.compress(body, quality=11)
+    return {encoding: data for encoding, data in encoded.items() if len(data) < len(body)}
+
+
+def _asset(path: str) -> Asset:
+    with open(path, "rb") as f:
+        body = f.read()
+    media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    if media_type.startswith("text/"):
+        media_type += "; charset=utf-8"
+    digest = hashlib.sha256(body).hexdigest()[:32]
+    variants = {"identity": (body, f'"{digest}"')}
+    for encoding, data in _compress(body, media_type).items():
+        variants[encoding] = (data, f'"{digest}-{encoding}"')
+    cache_control = HTML_CACHE_CONTROL if media_type.startswith("text/html") else CACHE_CONTROL
+    return Asset(media_type, cache_control, variants)
+
+
+def load(directory: str = None) -> int:
+    """Read and compress every file under `directory` (default STATIC_DIR); returns how many."""
+    global _assets
+    directory = directory or STATIC_DIR
+    assets = {}
+    for root, _, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(root, name)
+            assets[os.path.relpath(path, directory).replace(os.sep, "/")] = _asset(path)
+    _assets = assets
+    return len(assets)
+
+
+def get(name: str) -> Optional[Asset]:
+    """The asset at `name` (relative to STATIC_DIR), or None."""
+    if _assets is None:
+        with _load_lock:
+            if _assets is None:
+                load()
+    return _assets.get(name)
+
+
+def _accepted(accept_encoding: str) -> set:
+    """Encodings the client accepts (q > 0) from an Accept-Encoding header."""
+    accepted = set()
+    for item in accept_encoding.split(","):
+        encoding, _, params = item.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(encoding.strip().lower())
+    return accepted
+
+
+def _matches(if_none_match: str, etags) -> bool:
+    """If-None-Match uses the weak comparison: W/ prefixes are ignored."""
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") in etags for tag in if_none_match.split(","))
+
+
+def response(request: Request, asset: Asset) -> Response:
+    """The asset in the best encoding the client accepts, or 304 if its copy is current."""
+    accepted = _accepted(request.headers.get("accept-encoding", ""))
+    encoding = next((e for e in ("br", "gzip") if e in asset.variants and (e in accepted or "*" in accepted)), "identity")
+    body, etag = asset.variants[encoding]
+    headers = {"ETag": etag, "Cache-Control": asset.cache_control, "Vary": "Accept-Encoding"}
+    if_none_match = request.headers.get("if-none-match")
+    # any encoding's tag will do: they all stand for the same content
+    if if_none_match and _matches(if_none_match, asset.etags()):
+        STATIC_RESPONSES.inc("not_modified")
+        return Response(status_code=304, headers=headers)
+    STATIC_RESPONSES.inc(encoding)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(body, media_type=asset.media_type, headers=headers)
+
+
+def file_response(request: Request, path: str, media_type: str, cache_control: str) -> Response:
+    """`path` as a FileResponse (Range requests included), or 304 if the client's copy is current."""
+    stat = os.stat(path)
+    file = FileResponse(path, media_type=media_type, stat_result=stat, headers={"Cache-Control": cache_control})
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        fresh = _matches(if_none_match, {file.headers["etag"]})
+    else:
+        fresh = _not_modified_since(request.headers.get("if-modified-since"), stat.st_mtime)
+    if fresh:
+        headers = {k: file.headers[k] for k in ("etag", "last-modified", "cache-control")}
+        return Response(status_code=304, headers=headers)
+    return file
+
+
+def _not_modified_since(if_modified_since: Optional[str], mtime: float) -> bool:
+    if not if_modified_since:
+        return False
+    try:
+        return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return False
+
@@ -1,14 +1,160 @@
-"""Simple JSON-backed storage for persisted customers."""
+"""SQLite-backed storage for persisted customers and guests.
+
+Records live in a single SQLite database (WAL journal) keyed by phone / guest id,
+so lookups are primary-key reads and writes only touch the affected row instead
+of rewriting a whole JSON file. The legacy `customers.json` / `guests.json` files
+are imported once, the first time the database is created.
+
+Set `STORAGE_DB` to override the database path (default: `loanbot.db` next to this file).
+Call times of the public functions are exported as `loanbot_storage_seconds{op}`.
+"""
 import json
+import logging
 import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+STORAGE_SECONDS = metrics.histogram("loanbot_storage_seconds", "Time spent in storage calls.", ("op",))
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = set()
+
+# Ordered schema migrations; index + 1 is the resulting `PRAGMA user_version`.
+_MIGRATIONS = [
+    """
+    CREATE TABLE IF NOT EXISTS customers (
+        phone TEXT PRIMARY KEY,
+        data TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS guests (
+        guest_id TEXT PRIMARY KEY,
+        data TEXT NOT NULL
+    );
+    """,
+    # secondary index: associated_phone -> guest_id, unique across guests
+    """
+    ALTER TABLE guests ADD COLUMN associated_phone TEXT;
+    ALTER TABLE guests ADD COLUMN approved INTEGER NOT NULL DEFAULT 0;
+    UPDATE guests SET
+        associated_phone = json_extract(data, '$.associated_phone'),
+        approved = coalesce(json_extract(data, '$.approved'), 0);
+    UPDATE guests SET associated_phone = NULL, data = json_set(data, '$.associated_phone', NULL)
+        WHERE associated_phone IS NOT NULL AND rowid NOT IN (
+            SELECT min(rowid) FROM guests WHERE associated_phone IS NOT NULL GROUP BY associated_phone
+        );
+    CREATE UNIQUE INDEX IF NOT EXISTS guests_associated_phone
+        ON guests (associated_phone) WHERE associated_phone IS NOT NULL;
+    """,
+    # index of rendered sanction letters: letter id -> sharded file path
+    """
+    CREATE TABLE IF NOT EXISTS sanction_letters (
+        letter_id TEXT PRIMARY KEY,
+        path TEXT NOT NULL,
+        sanction_no TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        created_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS sanction_letters_created_at ON sanction_letters (created_at);
+    """,
+    # progress of bulk customer imports, keyed by a fingerprint of the input file
+    """
+    CREATE TABLE IF NOT EXISTS import_checkpoints (
+        source_id TEXT PRIMARY KEY,
+        name TEXT,
+        offset INTEGER NOT NULL,
+        rows INTEGER NOT NULL,
+        imported INTEGER NOT NULL,
+        rejected INTEGER NOT NULL,
+        done INTEGER NOT NULL DEFAULT 0,
+        updated_at REAL NOT NULL
+    );
+    """,
+    # change numbers for customers, so each worker's directory can pick up rows other
+    # processes wrote (`customers_changed_since`): every write transaction takes the next
+    # value of a one-row counter and stamps it on the rows it writes
+    """
+    ALTER TABLE customers ADD COLUMN version INTEGER NOT NULL DEFAULT 0;
+    CREATE INDEX IF NOT EXISTS customers_version ON customers (version, phone);
+    CREATE TABLE IF NOT EXISTS customer_version (
+        id INTEGER PRIMARY KEY CHECK (id = 0),
+        version INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO customer_version (id, version) VALUES (0, 0);
+    """,
+    # status of queued sanction letters, so any worker can answer for a job another one queued
+    """
+    CREATE TABLE IF NOT EXISTS sanction_jobs (
+        job_id TEXT PRIMARY KEY,
+        status TEXT NOT NULL,
+        file TEXT,
+        error TEXT,
+        updated_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS sanction_jobs_updated_at ON sanction_jobs (updated_at);
+    """,
+]
+
+
+def _base_dir():
+    return os.path.dirname(__file__)
+
+
+def _db_path():
+    return os.environ.get("STORAGE_DB") or os.path.join(_base_dir(), "loanbot.db")
 
 
 def _customers_path():
-    return os.path.join(os.path.dirname(__file__), "customers.json")
+    return os.path.join(_base_dir(), "customers.json")
 
 
-def load_customers():
-    path = _customers_path()
+def _guests_path():
+    return os.path.join(_base_dir(), "guests.json")
+
+
+def _dumps(record: dict) -> str:
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+
+
+def _guest_row(guest_id, record):
+    return guest_id, _dumps(record), record.get("associated_phone"), int(bool(record.get("approved")))
+
+
+def _statements(script):
+    """The SQL statements of a migration script, one at a time."""
+    statement = ""
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            yield statement
+            statement = ""
+
+
+def _migrate(conn):
+    # under the write lock, so worker processes starting together migrate once
+    # (executescript would commit first, hence one statement at a time)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for i, script in enumerate(_MIGRATIONS[version:], start=version + 1):
+            for statement in _statements(script):
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {i}")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+    if version == 0:
+        migrate_json(conn)
+
+
+def _read_json(path):
     try:
         if os.path.exists(path):
             with open(path, "r", encoding="utf-8") as f:
@@ -18,19 +164,354 @@ def load_customers():
     return {}
 
 
+def migrate_json(conn=None):
+    """Import records from the legacy `customers.json` / `guests.json` files.
+
+    Runs automatically when the database is first created; existing rows win, so it
+    is safe to call again. A phone can be associated with one guest only: approved
+    guests claim theirs first, and any other guest on a taken phone is imported
+    without the association (logged).
+    """
+    customers = _read_json(_customers_path())
+    guests = _read_json(_guests_path())
+    unassociated = []
+    with _transaction(conn) as conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO customers (phone, data) VALUES (?, ?)",
+            [(phone, _dumps(rec)) for phone, rec in customers.items()],
+        )
+        for gid, rec in sorted(guests.items(), key=lambda item: not item[1].get("approved")):
+            if conn.execute("SELECT 1 FROM guests WHERE guest_id = ?", (gid,)).fetchone():
+                continue
+            phone = rec.get("associated_phone")
+            if phone is not None and conn.execute("SELECT 1 FROM guests WHERE associated_phone = ?", (phone,)).fetchone():
+                rec = dict(rec, associated_phone=None)
+                unassociated.append(gid)
+            conn.execute(
+                "INSERT INTO guests (guest_id, data, associated_phone, approved) VALUES (?, ?, ?, ?)",
+                _guest_row(gid, rec),
+            )
+    if unassociated:
+        logger.warning(
+            "imported %d legacy guests without their phone (already associated with another guest): %s",
+            len(unassociated), ", ".join(unassociated),
+        )
+    return len(customers), len(guests)
+
+
+def _conn():
+    """Return this thread's connection, creating and migrating the database on first use."""
+    path = _db_path()
+    conn = getattr(_local, "conns", {}).get(path)
+    if conn is not None:
+        return conn
+    # autocommit mode; writes go through `_transaction` so they take the write lock up front
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    with _init_lock:
+        if path not in _initialized:
+            _migrate(conn)
+            _initialized.add(path)
+    if not hasattr(_local, "conns"):
+        _local.conns = {}
+    _local.conns[path] = conn
+    return conn
+
+
+@contextmanager
+def _transaction(conn=None):
+    conn = conn or _conn()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+@metrics.timed(STORAGE_SECONDS)
+def load_customers():
+    rows = _conn().execute("SELECT phone, data FROM customers").fetchall()
+    return {phone: json.loads(data) for phone, data in rows}
+
+
+def iter_customers(batch: int = 10000):
+    """Yield (phone, record) for every persisted customer without loading them all at once."""
+    cursor = _conn().execute("SELECT phone, data FROM customers")
+    while True:
+        rows = cursor.fetchmany(batch)
+        if not rows:
+            break
+        for phone, data in rows:
+            yield phone, json.loads(data)
+
+
+def _next_customer_version(conn) -> int:
+    """Take the next customer change number inside the caller's write transaction."""
+    conn.execute("UPDATE customer_version SET version = version + 1")
+    return conn.execute("SELECT version FROM customer_version").fetchone()[0]
+
+
+def customers_version() -> int:
+    """The latest customer change number (0 if none); see `customers_changed_since`."""
+    return _conn().execute("SELECT version FROM customer_version").fetchone()[0]
+
+
+@metrics.timed(STORAGE_SECONDS)
+def customers_changed_since(after=(0, None), limit: int = 10000):
+    """Customers written after position `after` ((change number, phone)), oldest first.
+
+    Returns (position of the last row, [(phone, record)]); pass the position back
+    to continue. One write shares its change number across all of its rows;
+    (n, None) is the position after all of change n.
+    """
+    version, phone = after
+    rows = _conn().execute(
+        "SELECT phone, data, version FROM customers WHERE version > ? OR (version = ? AND phone > ?)"
+        " ORDER BY version, phone LIMIT ?",
+        (version, version, phone, limit),
+    ).fetchall()
+    if not rows:
+        return after, []
+    return (rows[-1][2], rows[-1][0]), [(phone, json.loads(data)) for phone, data, _ in rows]
+
+
+@metrics.timed(STORAGE_SECONDS)
 def save_customers(customers: dict):
-    path = _customers_path()
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(customers, f, indent=2, ensure_ascii=False)
+    with _transaction() as conn:
+        version = _next_customer_version(conn)
+        conn.executemany(
+            "INSERT OR REPLACE INTO customers (phone, data, version) VALUES (?, ?, ?)",
+            [(phone, _dumps(rec), version) for phone, rec in customers.items()],
+        )
 
 
+@metrics.timed(STORAGE_SECONDS)
 def add_customer(phone: str, record: dict):
-    customers = load_customers()
-    customers[phone] = record
-    save_customers(customers)
+    with _transaction() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO customers (phone, data, version) VALUES (?, ?, ?)",
+            (phone, _dumps(record), _next_customer_version(conn)),
+        )
     return True
 
 
+@metrics.timed(STORAGE_SECONDS)
+def import_customers(customers, checkpoint: dict):
+    """Upsert `customers` ((phone, record) pairs) and save `checkpoint` in the same transaction.
+
+    `checkpoint` holds `source_id`, `name`, `offset`, `rows`, `imported`,
+    `rejected`, `done` and `updated_at`; committing both together means a
+    resumed import never skips or repeats a batch.
+    """
+    with _transaction() as conn:
+        version = _next_customer_version(conn)
+        conn.executemany(
+            "INSERT OR REPLACE INTO customers (phone, data, version) VALUES (?, ?, ?)",
+            [(phone, _dumps(rec), version) for phone, rec in customers],
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO import_checkpoints (source_id, name, offset, rows, imported, rejected, done, updated_at)"
+            " VALUES (:source_id, :name, :offset, :rows, :imported, :rejected, :done, :updated_at)",
+            checkpoint,
+        )
+
+
+def get_import_checkpoint(source_id: str):
+    row = _conn().execute(
+        "SELECT source_id, name, offset, rows, imported, rejected, done, updated_at FROM import_checkpoints WHERE source_id = ?",
+        (source_id,),
+    ).fetchone()
+    if not row:
+        return None
+    keys = ("source_id", "name", "offset", "rows", "imported", "rejected", "done", "updated_at")
+    return dict(zip(keys, row))
+
+
+def delete_import_checkpoint(source_id: str):
+    with _transaction() as conn:
+        conn.execute("DELETE FROM import_checkpoints WHERE source_id = ?", (source_id,))
+
+
+@metrics.timed(STORAGE_SECONDS)
 def get_customer(phone: str):
-    customers = load_customers()
-    return customers.get(phone)
+    row = _conn().execute("SELECT data FROM customers WHERE phone = ?", (phone,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+@metrics.timed(STORAGE_SECONDS)
+def load_guests():
+    rows = _conn().execute("SELECT guest_id, data FROM guests").fetchall()
+    return {gid: json.loads(data) for gid, data in rows}
+
+
+@metrics.timed(STORAGE_SECONDS)
+def save_guests(guests: dict):
+    with _transaction() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO guests (guest_id, data, associated_phone, approved) VALUES (?, ?, ?, ?)",
+            [_guest_row(gid, rec) for gid, rec in guests.items()],
+        )
+
+
+@metrics.timed(STORAGE_SECONDS)
+def put_guest(guest_id: str, record: dict):
+    with _transaction() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO guests (guest_id, data, associated_phone, approved) VALUES (?, ?, ?, ?)",
+            _guest_row(guest_id, record),
+        )
+    return True
+
+
+@metrics.timed(STORAGE_SECONDS)
+def insert_guest(guest_id: str, record: dict):
+    """Store a new guest; returns False (and writes nothing) if `guest_id` is already taken."""
+    try:
+        with _transaction() as conn:
+            conn.execute(
+                "INSERT INTO guests (guest_id, data, associated_phone, approved) VALUES (?, ?, ?, ?)",
+                _guest_row(guest_id, record),
+            )
+    except sqlite3.IntegrityError:
+        return False
+    return True
+
+
+@metrics.timed(STORAGE_SECONDS)
+def get_guest(guest_id: str):
+    row = _conn().execute("SELECT data FROM guests WHERE guest_id = ?", (guest_id,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+@metrics.timed(STORAGE_SECONDS)
+def find_guest_by_phone(phone: str):
+    """Return (guest_id, record) for the guest associated with `phone`, or (None, None).
+
+    Uses the unique `associated_phone` index; `record["approved"]` tells callers whether
+    the phone has already been used for an approved loan.
+    """
+    row = _conn().execute("SELECT guest_id, data FROM guests WHERE associated_phone = ?", (phone,)).fetchone()
+    if not row:
+        return None, None
+    return row[0], json.loads(row[1])
+
+
+@metrics.timed(STORAGE_SECONDS)
+def update_guest(guest_id: str, **fields):
+    """Apply `fields` to a stored guest in one transaction.
+
+    Returns False if the guest is unknown or if the new `associated_phone` already
+    belongs to another guest (enforced by the unique phone index).
+    """
+    try:
+        with _transaction() as conn:
+            row = conn.execute("SELECT data FROM guests WHERE guest_id = ?", (guest_id,)).fetchone()
+            if not row:
+                return False
+            rec = json.loads(row[0])
+            rec.update(fields)
+            _, data, phone, approved = _guest_row(guest_id, rec)
+            conn.execute(
+                "UPDATE guests SET data = ?, associated_phone = ?, approved = ? WHERE guest_id = ?",
+                (data, phone, approved, guest_id),
+            )
+    except sqlite3.IntegrityError:
+        return False
+    return True
+
+
+@metrics.timed(STORAGE_SECONDS)
+def put_letters(rows):
+    """Index rendered letters: `rows` of (letter_id, path, sanction_no, size, created_at), in one transaction."""
+    with _transaction() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO sanction_letters (letter_id, path, sanction_no, size, created_at) VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+
+
+@metrics.timed(STORAGE_SECONDS)
+def get_letter(letter_id: str):
+    """Index row for a sanction letter as a dict (`path` is relative to the letters directory), or None."""
+    row = _conn().execute(
+        "SELECT path, sanction_no, size, created_at FROM sanction_letters WHERE letter_id = ?", (letter_id,)
+    ).fetchone()
+    if not row:
+        return None
+    return {"letter_id": letter_id, "path": row[0], "sanction_no": row[1], "size": row[2], "created_at": row[3]}
+
+
+@metrics.timed(STORAGE_SECONDS)
+def letter_paths_for(letter_ids, batch: int = 500):
+    """{letter_id: path} for those of `letter_ids` that are indexed."""
+    letter_ids = list(letter_ids)
+    found = {}
+    conn = _conn()
+    for i in range(0, len(letter_ids), batch):
+        chunk = letter_ids[i:i + batch]
+        marks = ",".join("?" * len(chunk))
+        found.update(conn.execute(f"SELECT letter_id, path FROM sanction_letters WHERE letter_id IN ({marks})", chunk))
+    return found
+
+
+def expired_letters(before: float, limit: int = 500):
+    """(letter_id, path) of up to `limit` letters created before `before`, oldest first."""
+    return _conn().execute(
+        "SELECT letter_id, path FROM sanction_letters WHERE created_at < ? ORDER BY created_at LIMIT ?", (before, limit)
+    ).fetchall()
+
+
+def letter_paths():
+    """{path: letter_id} for every indexed letter."""
+    return {path: lid for lid, path in _conn().execute("SELECT letter_id, path FROM sanction_letters")}
+
+
+def delete_letters(letter_ids):
+    with _transaction() as conn:
+        conn.executemany("DELETE FROM sanction_letters WHERE letter_id = ?", [(lid,) for lid in letter_ids])
+
+
+@metrics.timed(STORAGE_SECONDS)
+def put_sanction_job(job: dict, keep: int = None):
+    """Save a sanction job's status (`job_id`, `status`, optional `file` / `error`).
+
+    With `keep`, also drop all but the `keep` most recently updated jobs.
+    """
+    with _transaction() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO sanction_jobs (job_id, status, file, error, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (job["job_id"], job["status"], job.get("file"), job.get("error"), time.time()),
+        )
+        if keep is not None:
+            conn.execute(
+                "DELETE FROM sanction_jobs WHERE updated_at < "
+                "(SELECT updated_at FROM sanction_jobs ORDER BY updated_at DESC LIMIT 1 OFFSET ?)",
+                (keep,),
+            )
+
+
+@metrics.timed(STORAGE_SECONDS)
+def get_sanction_job(job_id: str):
+    """Status dict of a sanction job, as `put_sanction_job` saved it, or None."""
+    row = _conn().execute("SELECT status, file, error FROM sanction_jobs WHERE job_id = ?", (job_id,)).fetchone()
+    if not row:
+        return None
+    job = {"job_id": job_id, "status": row[0]}
+    if row[1] is not None:
+        job["file"] = row[1]
+    if row[2] is not None:
+        job["error"] = row[2]
+    return job
+
+
+def delete_sanction_job(job_id: str):
+    with _transaction() as conn:
+        conn.execute("DELETE FROM sanction_jobs WHERE job_id = ?", (job_id,))
+
+
+if __name__ == "__main__":
+    n_customers, n_guests = migrate_json()
+    print(f"Imported {n_customers} customers and {n_guests} guests into {_db_path()}")
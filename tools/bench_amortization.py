@@ -0,0 +1,72 @@
+"""Benchmark EMI and repayment-schedule generation.
+
+Compares a month-by-month Python loop (the obvious implementation) with the
+closed-form NumPy `amortization.schedule`, and the batched `schedules` for loans
+that share a tenure, over 10k loans. Also times the memoized scalar `emi` against
+the original uncached formula. Usage:
+
+    python tools/bench_amortization.py [loans]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import amortization  # noqa: E402
+
+RATE = 12.0
+
+
+def uncached_emi(principal, months, annual_rate):
+    # the original sanction._calc_emi
+    if months <= 0:
+        return 0
+    r = annual_rate / 12.0 / 100.0
+    if r == 0:
+        return principal / months
+    return principal * r * (1 + r) ** months / ((1 + r) ** months - 1)
+
+
+def loop_schedule(principal, months, annual_rate):
+    r = annual_rate / 12.0 / 100.0
+    payment = uncached_emi(principal, months, annual_rate)
+    balance = principal
+    rows = []
+    for month in range(1, months + 1):
+        interest = balance * r
+        balance = balance + interest - payment
+        rows.append((month, payment, interest, payment - interest, max(balance, 0.0)))
+    return rows
+
+
+def timed(label, fn, count):
+    t0 = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - t0
+    print(f"{label:<34} {elapsed * 1000:9.1f} ms  ({count / elapsed:,.0f}/s)")
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    rng = random.Random(0)
+    loans = [(rng.randrange(50_000, 2_000_000, 1000), rng.choice([12, 24, 36, 60, 84])) for _ in range(n)]
+
+    print(f"{n:,} schedules")
+    timed("python month loop", lambda: [loop_schedule(p, m, RATE) for p, m in loans], n)
+    timed("numpy closed form (per loan)", lambda: [amortization.schedule(p, m, RATE) for p, m in loans], n)
+    by_tenure = {}
+    for p, m in loans:
+        by_tenure.setdefault(m, []).append(p)
+    timed("numpy batched by tenure", lambda: [amortization.schedules(ps, m, RATE) for m, ps in by_tenure.items()], n)
+
+    calls = 1_000_000
+    args = [loans[i % n] for i in range(calls)]
+    print(f"\n{calls:,} EMI calls")
+    timed("uncached formula", lambda: [uncached_emi(p, m, RATE) for p, m in args], calls)
+    timed("memoized rate factor", lambda: [amortization.emi(p, m, RATE) for p, m in args], calls)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Compare two benchmark result files written by `loadtest.py` or `bench_micro.py`.
+
+Prints every numeric result whose name says which direction is better (see
+`bench_results.py`) with its relative change, and exits 1 if any got worse by
+more than `--threshold` percent, so it can gate a CI job.
+
+    python tools/bench_compare.py bench_results/micro-old.json bench_results/micro-new.json
+    python tools/bench_compare.py old.json new.json --threshold 10 --filter steps.
+"""
+import argparse
+import json
+import sys
+
+LOWER_IS_BETTER = ("_ms", "_us", "_bytes")
+HIGHER_IS_BETTER = ("_per_s",)
+
+
+def flatten(tree, prefix=""):
+    out = {}
+    for key, value in tree.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            out.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            out[name] = value
+    return out
+
+
+def direction(name):
+    """+1 if higher is better, -1 if lower is better, 0 if the value is informational."""
+    leaf = name.rsplit(".", 1)[-1]
+    if leaf.endswith(HIGHER_IS_BETTER):
+        return 1
+    if leaf.endswith(LOWER_IS_BETTER):
+        return -1
+    return 0
+
+
+def compare(old, new, threshold, name_filter=None):
+    """Rows of (name, old, new, change %, regressed) for metrics present in both runs."""
+    a, b = flatten(old["results"]), flatten(new["results"])
+    rows = []
+    for name in sorted(a.keys() & b.keys()):
+        sign = direction(name)
+        if not sign or (name_filter and name_filter not in name):
+            continue
+        before, after = a[name], b[name]
+        change = (after - before) / before * 100 if before else 0.0
+        rows.append((name, before, after, change, sign * change < -threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=15, help="percent change counted as a regression")
+    parser.add_argument("--filter", help="only compare results whose name contains this")
+    args = parser.parse_args()
+
+    with open(args.old, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+    if old.get("kind") != new.get("kind"):
+        sys.exit(f"cannot compare a {old.get('kind')} run with a {new.get('kind')} run")
+
+    print(f"old: {old['env'].get('git_commit')} {old['env']['timestamp']}")
+    print(f"new: {new['env'].get('git_commit')} {new['env']['timestamp']}\n")
+    rows = compare(old, new, args.threshold, args.filter)
+    width = max((len(r[0]) for r in rows), default=10)
+    for name, before, after, change, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:<{width}}  {before:>12.2f}  {after:>12.2f}  {change:>+8.1f}%{flag}")
+    regressions = sum(r[4] for r in rows)
+    print(f"\n{len(rows)} compared, {regressions} regressed by more than {args.threshold:g}%")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Benchmark phone lookups and memory of the customer directory (`customers.py`).
+
+Seeds a throwaway database with `--customers` customers, then:
+
+- times `customers.load()` and measures the memory the directory holds per
+  customer, next to the same records kept as plain dicts;
+- times lookups of known phones and of unknown phones (a typo repeated, and a
+  fresh phone every call) before (`data.CUSTOMERS` then `storage.get_customer`,
+  as `verify_phone` used to do) and after (the directory with its miss cache).
+
+    python tools/bench_customer_lookup.py --customers 1000000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_results import write_results
+from bench_micro import measure
+
+
+def seed(storage, n):
+    for start in range(0, n, 100000):
+        rows = [
+            (f"8{i:09d}", storage._dumps({"name": f"Customer {i}", "salary": 30000 + i % 50000,
+                                           "preapproved_limit": 100000 + i % 400000, "credit_score": 600 + i % 250}))
+            for i in range(start, min(n, start + 100000))
+        ]
+        with storage._transaction() as conn:
+            conn.executemany("INSERT INTO customers (phone, data) VALUES (?, ?)", rows)
+
+
+def traced(fn):
+    """(result, bytes still allocated by fn's result)"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = fn()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+
+def bench_memory(storage, customers, n):
+    t0 = time.perf_counter()
+    customers.load()
+    load_ms = (time.perf_counter() - t0) * 1000
+    # tracing slows allocation down a lot, so memory is measured on a second load
+    _, directory_bytes = traced(customers.load)
+    dicts, dict_bytes = traced(lambda: dict(storage.iter_customers()))
+    del dicts
+    return {
+        "load_ms": round(load_ms, 1),
+        "directory_per_customer_bytes": round(directory_bytes / n, 1),
+        "dict_per_customer_bytes": round(dict_bytes / n, 1),
+    }
+
+
+def bench_lookups(storage, customers, n, calls):
+    from data import CUSTOMERS
+
+    def before(phone):
+        return CUSTOMERS.get(phone) or storage.get_customer(phone)
+
+    known = f"8{n // 2:09d}"
+    fresh = iter(range(10**9))
+    return {
+        "before.hit": measure(lambda: before(known), calls),
+        "before.miss": measure(lambda: before("5000000000"), calls),
+        "after.hit": measure(lambda: customers.lookup(known), calls),
+        "after.miss_repeated": measure(lambda: customers.lookup("5000000000"), calls),
+        # every call a new unknown phone: one storage probe each, then cached
+        "after.miss_fresh": measure(lambda: customers.lookup(f"4{next(fresh):09d}"), calls),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--customers", type=int, default=200000)
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--json", help="results file (default: bench_results/customers-<time>.json)")
+    parser.add_argument("--no-json", action="store_true", help="print only")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["STORAGE_DB"] = os.path.join(tmp, "bench.db")
+        import storage
+        import customers
+
+        seed(storage, args.customers)
+        memory = bench_memory(storage, customers, args.customers)
+        lookups = bench_lookups(storage, customers, args.customers, args.calls)
+
+    print(f"load: {args.customers:,} customers in {memory['load_ms']:.0f} ms; "
+          f"{memory['directory_per_customer_bytes']:.0f} B/customer (plain dicts: {memory['dict_per_customer_bytes']:.0f} B)")
+    print(f"\n{'case':<24}{'mean us':>10}{'p50 us':>10}{'p99 us':>10}{'calls/s':>12}")
+    for name, s in lookups.items():
+        print(f"{name:<24}{s['mean_us']:>10.2f}{s['p50_us']:>10.2f}{s['p99_us']:>10.2f}{s['calls_per_s']:>12,.0f}")
+    if not args.no_json:
+        print("\nresults:", write_results("customers", vars(args), {"memory": memory, "lookups": lookups}, args.json))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Benchmark `find_guest_by_phone` latency as the guest table grows.
+
+Populates a throwaway database with 1k .. 1M guests and times indexed phone
+lookups (hits and misses) at each size. Usage:
+
+    python tools/bench_guest_lookup.py [max_guests]
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+LOOKUPS = 20_000
+
+
+def _phone(i):
+    return f"7{i:09d}"
+
+
+def populate(storage, start, stop):
+    rows = [
+        storage._guest_row(f"guest-{i}", {"name": f"Guest {i}", "approved": i % 3 == 0, "associated_phone": _phone(i)})
+        for i in range(start, stop)
+    ]
+    with storage._transaction() as conn:
+        conn.executemany(
+            "INSERT INTO guests (guest_id, data, associated_phone, approved) VALUES (?, ?, ?, ?)", rows
+        )
+
+
+def time_lookups(storage, size):
+    rng = random.Random(size)
+    samples = []
+    for _ in range(LOOKUPS):
+        # half hits, half misses (phones beyond the populated range)
+        i = rng.randrange(size) if rng.random() < 0.5 else size + rng.randrange(size)
+        t0 = time.perf_counter()
+        storage.find_guest_by_phone(_phone(i))
+        samples.append(time.perf_counter() - t0)
+    samples.sort()
+    return statistics.mean(samples), samples[len(samples) // 2], samples[int(len(samples) * 0.99)]
+
+
+def main():
+    max_guests = int(sys.argv[1]) if len(sys.argv) > 1 else SIZES[-1]
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["STORAGE_DB"] = os.path.join(tmp, "bench.db")
+        import storage
+
+        populated = 0
+        print(f"{'guests':>10}  {'mean us':>8}  {'p50 us':>8}  {'p99 us':>8}")
+        for size in [s for s in SIZES if s <= max_guests]:
+            populate(storage, populated, size)
+            populated = size
+            mean, p50, p99 = time_lookups(storage, size)
+            print(f"{size:>10,}  {mean * 1e6:>8.1f}  {p50 * 1e6:>8.1f}  {p99 * 1e6:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
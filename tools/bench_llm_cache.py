@@ -0,0 +1,123 @@
+"""Offline check of the LLM reply cache and request coalescing (no OpenAI key needed).
+
+Installs stub clients (`llm.set_clients`) that count upstream calls and sleep
+`--latency-ms` per call, then:
+
+1. fires `--burst` concurrent identical questions and checks they share one call;
+2. replays a POST-step workload of repeated questions over a few decision
+   contexts, reporting hit rate and mean latency with the cache on and off.
+
+    python tools/bench_llm_cache.py --latency-ms 200 --requests 300
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+QUESTIONS = ["what is my EMI?", "What is my emi", "why was I rejected", "how does interest work?", "help"]
+CONTEXTS = [
+    {"last_reason": "Credit score 650 is below the required minimum of 700.", "last_details": {"emi": 8885.0}},
+    {"last_reason": "Requested amount ₹300,000 is within pre-approved limit of ₹500,000.", "last_details": {"emi": 14122.0, "preapproved_limit": 500000}},
+    {"last_reason": "Estimated monthly EMI ₹28,244 exceeds 50% of monthly salary ₹40,000; unaffordable.", "last_details": {"emi": 28244.0}},
+]
+
+
+def _response(messages):
+    text = f"Stub answer to: {messages[-1]['content']}"
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+
+class StubCompletions:
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def create(self, model, messages, **kwargs):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        return _response(messages)
+
+
+class AsyncStubCompletions(StubCompletions):
+    async def create(self, model, messages, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return _response(messages)
+
+
+def stub_client(completions):
+    return SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+
+async def burst(llm, n, latency):
+    stub = AsyncStubCompletions(latency)
+    llm.set_clients(async_client=stub_client(stub))
+    replies = await asyncio.gather(*(llm.agenerate_chat_reply("what is my EMI?", CONTEXTS[0]) for _ in range(n)))
+    assert len(set(replies)) == 1 and replies[0], replies[:3]
+    return stub.calls, llm.cache_stats()
+
+
+def sync_burst(llm, n, latency):
+    stub = StubCompletions(latency)
+    llm.set_clients(client=stub_client(stub))
+    threads = [threading.Thread(target=llm.generate_chat_reply, args=("what is my EMI?", CONTEXTS[0])) for _ in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return stub.calls
+
+
+async def workload(llm, requests, latency, seed=7):
+    stub = AsyncStubCompletions(latency)
+    llm.set_clients(async_client=stub_client(stub))
+    rng = random.Random(seed)
+    latencies = []
+    for _ in range(requests):
+        t0 = time.perf_counter()
+        await llm.agenerate_chat_reply(rng.choice(QUESTIONS), rng.choice(CONTEXTS))
+        latencies.append(time.perf_counter() - t0)
+    return stub.calls, sum(latencies) / len(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency-ms", type=float, default=200, help="stub upstream latency per call")
+    parser.add_argument("--burst", type=int, default=50, help="concurrent identical questions")
+    parser.add_argument("--requests", type=int, default=300, help="questions in the replayed workload")
+    args = parser.parse_args()
+    latency = args.latency_ms / 1000
+
+    import llm
+
+    calls, stats = asyncio.run(burst(llm, args.burst, latency))
+    print(f"async burst: {args.burst} concurrent identical questions -> {calls} upstream call(s), "
+          f"coalesced={stats['coalesced']}")
+    assert calls == 1
+    calls = sync_burst(llm, args.burst, latency)
+    print(f"sync burst:  {args.burst} threads -> {calls} upstream call(s)")
+    assert calls == 1
+
+    before = llm.cache_stats()["hits"]
+    calls, mean = asyncio.run(workload(llm, args.requests, latency))
+    hits = llm.cache_stats()["hits"] - before
+    print(f"cached:   {args.requests} questions -> {calls} upstream calls, hit rate {hits / args.requests:.1%}, "
+          f"mean latency {mean * 1000:.1f}ms")
+    enabled = llm._cache.max_entries
+    llm._cache.max_entries = 0
+    calls, mean = asyncio.run(workload(llm, args.requests, latency))
+    llm._cache.max_entries = enabled
+    print(f"uncached: {args.requests} questions -> {calls} upstream calls, mean latency {mean * 1000:.1f}ms")
+    llm.set_clients()
+
+
+if __name__ == "__main__":
+    main()
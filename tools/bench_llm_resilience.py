@@ -0,0 +1,119 @@
+"""Exercise the resilient LLM client against the fake OpenAI server with injected faults.
+
+Runs scenarios back to back and prints answered/fallback counts and latencies:
+healthy, flaky (30% HTTP 500), slow (beyond the per-attempt timeout), outage
+(breaker opens, later calls fall back at once), recovery (a trial call closes
+the breaker) and a concurrent burst limited by LLM_MAX_CONCURRENCY.
+
+    python tools/bench_llm_resilience.py
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# tight limits so the scenarios finish quickly; the cache would hide repeated questions
+SETTINGS = {
+    "LLM_TIMEOUT": "1",
+    "LLM_DEADLINE": "2",
+    "LLM_RETRIES": "2",
+    "LLM_BACKOFF": "0.05",
+    "LLM_BREAKER_FAILURES": "5",
+    "LLM_BREAKER_RESET": "2",
+    "LLM_MAX_CONCURRENCY": "8",
+    "LLM_CACHE_MAX_ENTRIES": "0",
+}
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def control(fake, **settings):
+    req = urllib.request.Request(
+        f"http://127.0.0.1:{fake.server_port}/control",
+        data=json.dumps(settings).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    urllib.request.urlopen(req).read()
+
+
+async def ask(llm, n, concurrent=False):
+    """Ask `n` questions; returns (answered, fallbacks, latencies in ms)."""
+    latencies = []
+
+    async def one(i):
+        t0 = time.perf_counter()
+        reply = await llm.agenerate_chat_reply(f"question {i}")
+        latencies.append((time.perf_counter() - t0) * 1000)
+        return reply
+
+    if concurrent:
+        replies = await asyncio.gather(*(one(i) for i in range(n)))
+    else:
+        replies = [await one(i) for i in range(n)]
+    answered = sum(1 for r in replies if r)
+    return answered, n - answered, latencies
+
+
+def report(name, fake, result, llm_client):
+    answered, fallbacks, latencies = result
+    breaker = llm_client.breaker.stats()
+    print(f"{name:<10} answered={answered:>3} fallback={fallbacks:>3}  p50={percentile(latencies, 50):7.1f}ms "
+          f"max={max(latencies):7.1f}ms  upstream_requests={fake.settings['requests']:>3}  breaker={breaker['state']}")
+    fake.settings["requests"] = 0
+
+
+async def scenarios(fake, llm, llm_client):
+    control(fake, first_token_ms=50, error_rate=0.0)
+    report("healthy", fake, await ask(llm, 20), llm_client)
+
+    control(fake, error_rate=0.3)
+    report("flaky 30%", fake, await ask(llm, 40), llm_client)
+
+    control(fake, error_rate=0.0, first_token_ms=3000)
+    report("slow 3s", fake, await ask(llm, 3), llm_client)
+
+    control(fake, first_token_ms=50, error_rate=1.0)
+    report("outage", fake, await ask(llm, 40), llm_client)
+
+    control(fake, error_rate=0.0)
+    print(f"{'':<10} breaker open, upstream healthy again; sleeping {llm_client.breaker.reset_timeout:.0f}s for the reset timeout")
+    await asyncio.sleep(llm_client.breaker.reset_timeout)
+    report("recovery", fake, await ask(llm, 10), llm_client)
+
+    control(fake, first_token_ms=300)
+    report("burst x40", fake, await ask(llm, 40, concurrent=True), llm_client)
+
+
+def main():
+    import logging
+
+    import fake_openai_server
+
+    logging.disable(logging.CRITICAL)
+    fake = fake_openai_server.start_in_thread(first_token_ms=50, token_ms=0)
+    os.environ.update(SETTINGS)
+    os.environ["OPENAI_API_KEY"] = "test"
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{fake.server_port}/v1"
+
+    import llm
+    import llm_client
+
+    try:
+        asyncio.run(scenarios(fake, llm, llm_client))
+    finally:
+        fake.shutdown()
+    print("client stats:", llm.client_stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Micro-benchmarks for the hot functions behind one `/chat` turn.
+
+- `evaluate_loan` for an approval and for each rejection rule;
+- `sanction._calc_emi` (memoized rate factor);
+- storage lookups against a throwaway database seeded with `--guests` guests:
+  `get_customer`, `get_guest`, `find_guest_by_phone` (hits and misses);
+- `create_sanction_letter` (one new PDF per call, written to the temporary directory).
+
+Each case reports mean / p50 / p99 per call and calls per second, and the run is
+written as JSON (see `bench_results.py`) for `tools/bench_compare.py`.
+
+    python tools/bench_micro.py
+    python tools/bench_micro.py --only storage --guests 100000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_results import latency_summary, write_results
+
+
+def measure(fn, calls, warmup=100):
+    """Time `calls` calls of `fn()` one by one; returns latency stats in microseconds."""
+    for _ in range(min(warmup, calls)):
+        fn()
+    samples = []
+    t_start = time.perf_counter()
+    for _ in range(calls):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - t_start
+    stats = latency_summary(samples, scale=1e6, unit="us")
+    stats["calls_per_s"] = round(calls / elapsed, 1)
+    return stats
+
+
+def bench_rules(calls):
+    from rules import evaluate_loan
+
+    cases = {
+        "evaluate_loan.approved": (750, 300000, 300000, 50000, 24),
+        "evaluate_loan.low_credit": (650, 100000, 150000, 30000, 12),
+        "evaluate_loan.over_limit": (750, 900000, 300000, 50000, 24),
+        "evaluate_loan.unaffordable": (750, 500000, 300000, 20000, 12),
+    }
+    return {name: measure(lambda a=a: evaluate_loan(*a), calls) for name, a in cases.items()}
+
+
+def bench_emi(calls):
+    from sanction import _calc_emi
+
+    return {
+        "calc_emi.cached": measure(lambda: _calc_emi(300000, 24, 12.0), calls),
+        # cycles through 360 tenures: rate-factor cache lookups across many keys
+        "calc_emi.varied": measure(lambda c=iter(range(10**9)): _calc_emi(300000, 1 + next(c) % 360, 12.0), calls),
+    }
+
+
+def seed_storage(storage, guests):
+    rows = [
+        storage._guest_row(f"guest-{i}", {"name": f"Guest {i}", "approved": i % 3 == 0, "associated_phone": f"7{i:09d}"})
+        for i in range(guests)
+    ]
+    with storage._transaction() as conn:
+        conn.executemany("INSERT INTO guests (guest_id, data, associated_phone, approved) VALUES (?, ?, ?, ?)", rows)
+    storage.add_customer("8000000001", {"name": "Bench Customer", "salary": 50000, "preapproved_limit": 300000, "credit_score": 750})
+
+
+def bench_storage(calls, guests):
+    import storage
+
+    seed_storage(storage, guests)
+    last = guests - 1
+    return {
+        "get_customer.hit": measure(lambda: storage.get_customer("8000000001"), calls),
+        "get_customer.miss": measure(lambda: storage.get_customer("8000000002"), calls),
+        "get_guest.hit": measure(lambda: storage.get_guest(f"guest-{last}"), calls),
+        "find_guest_by_phone.hit": measure(lambda: storage.find_guest_by_phone(f"7{last:09d}"), calls),
+        "find_guest_by_phone.miss": measure(lambda: storage.find_guest_by_phone("6999999999"), calls),
+    }
+
+
+def bench_pdf(calls):
+    import sanction
+
+    counter = iter(range(10**9))
+
+    def render():
+        # a new applicant per call; repeating one would only hit the letter index
+        sanction.create_sanction_letter(
+            name=f"Bench Customer {next(counter)}", amount=300000, tenure=24, salary=50000,
+            preapproved_limit=300000, credit_score=750, annual_rate=12.0,
+        )
+
+    return {"create_sanction_letter": measure(render, calls, warmup=3)}
+
+
+GROUPS = ("rules", "emi", "storage", "pdf")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=20000, help="calls per case (PDF: --pdf-calls)")
+    parser.add_argument("--pdf-calls", type=int, default=50)
+    parser.add_argument("--guests", type=int, default=10000, help="guests seeded for the storage lookups")
+    parser.add_argument("--only", choices=GROUPS, action="append", help="run only these groups (repeatable)")
+    parser.add_argument("--json", help="results file (default: bench_results/micro-<time>.json)")
+    parser.add_argument("--no-json", action="store_true", help="print only")
+    args = parser.parse_args()
+
+    groups = args.only or GROUPS
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["STORAGE_DB"] = os.path.join(tmp, "bench.db")
+        os.environ["GENERATED_DIR"] = os.path.join(tmp, "generated")
+        if "rules" in groups:
+            results.update(bench_rules(args.calls))
+        if "emi" in groups:
+            results.update(bench_emi(args.calls))
+        if "storage" in groups:
+            results.update(bench_storage(args.calls, args.guests))
+        if "pdf" in groups:
+            results.update(bench_pdf(args.pdf_calls))
+
+    print(f"{'case':<30}{'mean us':>10}{'p50 us':>10}{'p99 us':>10}{'calls/s':>12}")
+    for name, s in results.items():
+        print(f"{name:<30}{s['mean_us']:>10.2f}{s['p50_us']:>10.2f}{s['p99_us']:>10.2f}{s['calls_per_s']:>12,.0f}")
+    if not args.no_json:
+        print("\nresults:", write_results("micro", vars(args), results, args.json))
+
+
+if __name__ == "__main__":
+    main()
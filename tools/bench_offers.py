@@ -0,0 +1,163 @@
+"""Check and time the counter-offer engine (`offers.py`).
+
+- correctness: for random applicants, every offered amount is approved by
+  `rules.evaluate_loan` and one `OFFER_STEP` more is not; `shortest_tenure` is
+  the first tenure that approves the requested amount;
+- speed: `max_amounts` / `counter_offer` per call against a grid search that
+  calls `evaluate_loan` for every amount step and tenure, and `max_amounts` over
+  a whole portfolio at once;
+- envelopes: `precompute()` over `--portfolio` synthetic customers in the
+  directory, a cached `envelope()` lookup, and a changed customer getting a new
+  envelope. Runs against a throwaway database.
+
+    python tools/bench_offers.py [--calls 5000] [--portfolio 100000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from bench_micro import measure
+from bench_results import write_results
+
+CASE = (750, 900000, 300000, 40000, 24)  # credit, requested, pre-approved, salary, tenure
+
+
+def applicants(n, seed=0):
+    rng = random.Random(seed)
+    return [
+        (rng.choice([650, 700, 720, 800]), rng.randrange(1, 2_000_000), rng.randrange(0, 1_000_000, 500),
+         rng.choice([0, rng.randrange(5_000, 300_000)]))
+        for _ in range(n)
+    ]
+
+
+def check(n):
+    import offers
+    from rules import evaluate_loan
+
+    problems = 0
+    for credit, requested, pre, salary in applicants(n):
+        for tenure, amount in zip(offers.TENURES, offers.max_amounts(credit, pre, salary).tolist()):
+            if credit < 700:
+                problems += amount != 0
+                continue
+            problems += evaluate_loan(credit, amount, pre, salary, tenure)[0] != "APPROVED"
+            problems += evaluate_loan(credit, amount + offers.STEP, pre, salary, tenure)[0] == "APPROVED"
+        months = offers.shortest_tenure(credit, requested, pre, salary)
+        if months:
+            problems += evaluate_loan(credit, requested, pre, salary, months)[0] != "APPROVED"
+            problems += months > 1 and evaluate_loan(credit, requested, pre, salary, months - 1)[0] == "APPROVED"
+        elif credit >= 700:
+            problems += evaluate_loan(credit, requested, pre, salary, offers.MAX_TENURE)[0] == "APPROVED"
+    return {"applicants": n, "problems": int(problems)}
+
+
+def grid_search(credit, requested, pre, salary, tenure):
+    """Baseline: try every amount step up to the cap for each tenure."""
+    import offers
+    from rules import active_rules, evaluate_loan
+
+    cap = int(active_rules().max_preapproved_multiple * pre)
+    best = {}
+    for months in offers.TENURES:
+        best[months] = 0
+        for amount in range(offers.STEP, cap + 1, offers.STEP):
+            if evaluate_loan(credit, amount, pre, salary, months)[0] == "APPROVED":
+                best[months] = amount
+    return best
+
+
+def bench_envelopes(n, calls):
+    import customers
+    import offers
+
+    customers.load()
+    rng = random.Random(1)
+    synthetic = [
+        (f"7{i:09d}", {"name": f"Customer {i}", "salary": rng.randrange(0, 300_000),
+                       "preapproved_limit": rng.randrange(0, 1_000_000, 1000), "credit_score": rng.randrange(600, 850)})
+        for i in range(n)
+    ]
+    customers.update(synthetic)
+    started = time.perf_counter()
+    count = offers.precompute()
+    precompute_ms = (time.perf_counter() - started) * 1000
+
+    mismatched = 0
+    for phone, record in synthetic[:2000]:
+        expected = offers.max_amounts(record["credit_score"], record["preapproved_limit"], record["salary"]).tolist()
+        mismatched += list(offers.envelope(phone).ceilings) != expected
+    # a changed record must not be served from the old envelope
+    phone, record = synthetic[0]
+    before = offers.envelope(phone)
+    customers.add_customer(phone, {**record, "credit_score": 800, "salary": record["salary"] + 100_000})
+    refreshed = offers.envelope(phone)
+    stale = refreshed is before or refreshed.salary != record["salary"] + 100_000
+
+    phones = [p for p, _ in synthetic]
+    i = iter(range(10**9))
+    # an eligible customer asking for more than the cap, so both paths build the full offer
+    phone, r = next((p, r) for p, r in synthetic[1:] if r["credit_score"] >= 700 and r["salary"] and r["preapproved_limit"])
+    return {
+        "envelope_first_hit": measure(lambda: offers.envelope(phones[next(i) % n]), calls),
+        "envelope_hit": measure(lambda: offers.envelope(phone), calls),
+        "envelope_offer": measure(lambda: offers.envelope(phone).counter_offer(2 * r["preapproved_limit"] + 1, 24), calls),
+        "counter_offer_same": measure(lambda: offers.counter_offer(r["credit_score"], 2 * r["preapproved_limit"] + 1,
+                                                                   r["preapproved_limit"], r["salary"], 24), calls),
+    }, {"customers": count, "precompute_ms": round(precompute_ms, 1), "mismatched": mismatched, "stale_after_update": stale}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=5000)
+    parser.add_argument("--check", type=int, default=3000, help="random applicants to verify")
+    parser.add_argument("--portfolio", type=int, default=100000)
+    parser.add_argument("--json", help="results file (default: bench_results/offers-<time>.json)")
+    parser.add_argument("--no-json", action="store_true", help="print only")
+    args = parser.parse_args()
+
+    import offers
+
+    checked = check(args.check)
+    credit, requested, pre, salary, tenure = CASE
+    results = {
+        "max_amounts": measure(lambda: offers.max_amounts(credit, pre, salary), args.calls),
+        "counter_offer": measure(lambda: offers.counter_offer(credit, requested, pre, salary, tenure), args.calls),
+        "grid_search": measure(lambda: grid_search(credit, requested, pre, salary, tenure), max(args.calls // 100, 10), warmup=2),
+    }
+    rng = np.random.default_rng(0)
+    columns = (rng.integers(600, 850, args.portfolio), rng.integers(0, 1_000_000, args.portfolio),
+               rng.integers(0, 300_000, args.portfolio))
+    started = time.perf_counter()
+    offers.max_amounts(*columns)
+    portfolio_ms = (time.perf_counter() - started) * 1000
+
+    print(f"check: {checked['applicants']} applicants x {len(offers.TENURES)} tenures, {checked['problems']} problems\n")
+    print(f"{'case':<16}{'mean us':>12}{'p50 us':>12}{'p99 us':>12}")
+    for name, s in results.items():
+        print(f"{name:<16}{s['mean_us']:>12.1f}{s['p50_us']:>12.1f}{s['p99_us']:>12.1f}")
+    print(f"\nportfolio: {args.portfolio:,} applicants x {len(offers.TENURES)} tenures in {portfolio_ms:.1f} ms")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["STORAGE_DB"] = os.path.join(tmp, "bench.db")
+        timings, envelopes = bench_envelopes(args.portfolio, args.calls)
+    print(f"\nenvelopes: {envelopes['customers']:,} customers precomputed in {envelopes['precompute_ms']:.0f} ms, "
+          f"{envelopes['mismatched']} mismatched, stale after update: {envelopes['stale_after_update']}")
+    for name, s in timings.items():
+        print(f"{name:<20}{s['mean_us']:>8.1f}{s['p50_us']:>12.1f}{s['p99_us']:>12.1f}")
+    results.update(timings)
+    results.update(check=checked, portfolio_ms=round(portfolio_ms, 2), envelopes=envelopes)
+    if not args.no_json:
+        print("\nresults:", write_results("offers", vars(args), results, args.json))
+    sys.exit(1 if checked["problems"] or envelopes["mismatched"] or envelopes["stale_after_update"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Benchmark the lookup rate limiter (`ratelimit.py`) and check that it holds.
+
+- `take()` per call for the memory and SQLite limiters (session + IP bucket),
+  spread over many keys so no call is refused;
+- one PHONE turn through `master_agent` (an unknown phone) with limiting off,
+  memory and SQLite, i.e. the overhead a real lookup pays;
+- enforcement: one client firing `--burst-calls` random phones back to back gets
+  about `RATE_LIMIT_IP_BURST` answers before the backoff reply.
+
+    python tools/bench_ratelimit.py
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_results import latency_summary, write_results
+
+
+async def ameasure(fn, calls, warmup=100):
+    for _ in range(min(warmup, calls)):
+        await fn()
+    samples = []
+    t_start = time.perf_counter()
+    for _ in range(calls):
+        t0 = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - t_start
+    stats = latency_summary(samples, scale=1e6, unit="us")
+    stats["calls_per_s"] = round(calls / elapsed, 1)
+    return stats
+
+
+def limiters(tmp):
+    import ratelimit
+
+    return {
+        "off": None,
+        "memory": ratelimit.MemoryRateLimiter(),
+        "sqlite": ratelimit.SQLiteRateLimiter(os.path.join(tmp, "ratelimit.db")),
+    }
+
+
+async def bench_take(tmp, calls):
+    results = {}
+    for name, limiter in limiters(tmp).items():
+        if limiter is None:
+            continue
+        n = iter(range(10**9))
+
+        async def take():
+            i = next(n)
+            await limiter.take([(f"s:{i}", 5, 0.1), (f"ip:{i % 50000}", 30, 1.0)])
+
+        results[f"take.{name}"] = await ameasure(take, calls)
+    return results
+
+
+async def bench_phone_step(tmp, calls):
+    import ratelimit
+    from agents import master_agent
+
+    results = {}
+    for name, limiter in limiters(tmp).items():
+        ratelimit.LIMITER = limiter
+        n = iter(range(10**9))
+
+        async def turn():
+            i = next(n)
+            with ratelimit.client(f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}", f"bench-{i}"):
+                await master_agent("5000000000", {"step": "PHONE"})
+
+        results[f"phone_step.{name}"] = await ameasure(turn, calls)
+    return results
+
+
+async def enforcement(tmp, calls):
+    import ratelimit
+    from agents import master_agent
+
+    ratelimit.LIMITER = ratelimit.MemoryRateLimiter()
+    answered = 0
+    for i in range(calls):
+        # a new session each time, as an enumeration script would; only the IP bucket binds
+        with ratelimit.client("203.0.113.9", f"enum-{i}"):
+            reply = await master_agent(f"9{i:09d}", {"step": "PHONE"})
+        answered += not reply.startswith("Too many attempts")
+    return {"attempts": calls, "answered": answered, "ip_burst": ratelimit.IP_BURST}
+
+
+async def run(args, tmp):
+    results = await bench_take(tmp, args.calls)
+    results.update(await bench_phone_step(tmp, args.calls))
+    return results, await enforcement(tmp, args.burst_calls)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=5000)
+    parser.add_argument("--burst-calls", type=int, default=200)
+    parser.add_argument("--json", help="results file (default: bench_results/ratelimit-<time>.json)")
+    parser.add_argument("--no-json", action="store_true", help="print only")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["STORAGE_DB"] = os.path.join(tmp, "bench.db")
+        results, enforced = asyncio.run(run(args, tmp))
+
+    print(f"{'case':<24}{'mean us':>10}{'p50 us':>10}{'p99 us':>10}{'calls/s':>12}")
+    for name, s in results.items():
+        print(f"{name:<24}{s['mean_us']:>10.2f}{s['p50_us']:>10.2f}{s['p99_us']:>10.2f}{s['calls_per_s']:>12,.0f}")
+    print(f"\nenforcement: {enforced['answered']} of {enforced['attempts']} rapid lookups from one IP answered "
+          f"(burst {enforced['ip_burst']:g})")
+    if not args.no_json:
+        print("\nresults:", write_results("ratelimit", vars(args), {**results, "enforcement": enforced}, args.json))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Shared helpers for benchmark scripts that record machine-readable results.
+
+`loadtest.py` and `bench_micro.py` write one JSON file per run to `bench_results/`
+(or `--json PATH`):
+
+    {"kind": "loadtest", "env": {...git commit, python, cpu...}, "args": {...}, "results": {...}}
+
+`bench_compare.py` diffs two such files. Leaf names carry their unit so the
+comparison knows which direction is better: `*_ms` / `*_us` / `*_bytes` are
+lower-is-better, `*_per_s` is higher-is-better, anything else is informational.
+"""
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "bench_results")
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of `samples` (need not be sorted)."""
+    samples = sorted(samples)
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def latency_summary(samples, scale=1000, unit="ms"):
+    """count, mean and p50/p95/p99/max of `samples` (seconds), in `unit`."""
+    ordered = sorted(samples)
+    if not ordered:
+        return {"count": 0}
+    return {
+        "count": len(ordered),
+        f"mean_{unit}": round(sum(ordered) / len(ordered) * scale, 4),
+        f"p50_{unit}": round(percentile(ordered, 50) * scale, 4),
+        f"p95_{unit}": round(percentile(ordered, 95) * scale, 4),
+        f"p99_{unit}": round(percentile(ordered, 99) * scale, 4),
+        f"max_{unit}": round(ordered[-1] * scale, 4),
+    }
+
+
+def rss_bytes():
+    """Resident set size of this process (Linux /proc), else peak RSS from getrusage."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        return 0
+
+
+def deep_size(obj, seen=None):
+    """Approximate bytes held by `obj` and the containers/strings it references."""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(v, seen) for v in obj)
+    return size
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def environment() -> dict:
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def write_results(kind: str, args: dict, results: dict, path=None) -> str:
+    """Write a results file and return its path (default: bench_results/<kind>-<stamp>.json)."""
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{kind}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"kind": kind, "env": environment(), "args": args, "results": results}, f, indent=2)
+        f.write("\n")
+    return path
@@ -0,0 +1,118 @@
+"""Benchmark the compiled rules against the original hand-written evaluate_loan.
+
+`handwritten_evaluate_loan` is the pre-config implementation (updated for the
+amortized EMI), kept here as the baseline. The script first checks both agree on
+decision and reason for a sample of applicants (and that the compiled reason is
+the one `format_reason` gives), exits 1 on any mismatch, then times each over the
+same inputs. Usage:
+
+    python tools/bench_rules.py [calls]
+"""
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from amortization import rate_factor  # noqa: E402
+from rules import DECISIONS, active_rules  # noqa: E402
+
+
+def handwritten_evaluate_loan(credit_score, loan_amount, preapproved_limit, salary, tenure=12):
+    details = {
+        "credit_score": credit_score,
+        "loan_amount": loan_amount,
+        "preapproved_limit": preapproved_limit,
+        "salary": salary,
+        "max_allowed": 2 * preapproved_limit if preapproved_limit else 0,
+        "tenure": tenure,
+        "annual_rate": 12.0,
+    }
+    if credit_score < 700:
+        reason = f"Credit score {credit_score} is below the required minimum of 700."
+        return "REJECTED", reason, details
+    if loan_amount <= preapproved_limit:
+        reason = f"Requested amount ₹{loan_amount:,} is within pre-approved limit of ₹{preapproved_limit:,}."
+        details.update({"emi": loan_amount * rate_factor(12.0, tenure)})
+        return "APPROVED", reason, details
+    if loan_amount <= 2 * preapproved_limit:
+        emi = loan_amount * rate_factor(12.0, tenure)
+        details["emi"] = emi
+        if salary:
+            affordable = emi <= 0.5 * salary
+        else:
+            affordable = False
+        if affordable:
+            reason = f"Estimated monthly EMI ₹{emi:,.0f} is <= 50% of monthly salary ₹{salary:,}; affordable."
+            return "APPROVED", reason, details
+        else:
+            reason = f"Estimated monthly EMI ₹{emi:,.0f} exceeds 50% of monthly salary ₹{salary:,}; unaffordable."
+            return "REJECTED", reason, details
+    reason = (
+        f"Requested amount ₹{loan_amount:,} exceeds the allowable maximum (2x pre-approved limit ₹{2*preapproved_limit:,})."
+    )
+    details["emi"] = loan_amount * rate_factor(12.0, tenure)
+    return "REJECTED", reason, details
+
+
+def applicants(n, seed=0):
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(n):
+        limit = rng.randrange(0, 20) * 50_000
+        rows.append((
+            rng.randrange(550, 850),
+            int(limit * rng.choice([0.5, 1, 1.5, 2, 2.5])) + rng.randrange(2),
+            limit,
+            rng.choice([0, 20_000, 40_000, 60_000]),
+            rng.choice([12, 24, 36]),
+        ))
+    return rows
+
+
+def check_parity(rules, rows):
+    """(row, compiled, expected) for every row where the compiled rules disagree."""
+    mismatches = []
+    for row in rows:
+        decision, reason, details = rules.evaluate(*row)
+        expected = handwritten_evaluate_loan(*row)[:2]
+        if (decision, reason) != expected:
+            mismatches.append((row, (decision, reason), expected))
+            continue
+        code = next(c for c, trace in rules.traces.items() if trace == details["trace"])
+        formatted = rules.format_reason(code, *row[:4], details.get("emi"))
+        if DECISIONS[code] != decision or formatted != reason:
+            mismatches.append((row, (DECISIONS[code], formatted), expected))
+    return mismatches
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    rows = applicants(calls)
+    rules = active_rules()
+    compiled = rules.evaluate
+
+    mismatches = check_parity(rules, rows[:20_000])
+    if mismatches:
+        print(f"{len(mismatches)} mismatches against the hand-written rules:")
+        for row, got, expected in mismatches[:20]:
+            print(f"  {row}: {got!r} != {expected!r}")
+        sys.exit(1)
+
+    def run(fn):
+        for row in rows:
+            fn(*row)
+
+    # interleave the repeats so both functions see the same machine conditions
+    candidates = {"handwritten": handwritten_evaluate_loan, "compiled": compiled}
+    best = dict.fromkeys(candidates, float("inf"))
+    for _ in range(7):
+        for name, fn in candidates.items():
+            best[name] = min(best[name], timeit.timeit(lambda: run(fn), number=1))
+    for name, seconds in best.items():
+        print(f"{name:>12}: {seconds / calls * 1e9:7.0f} ns/call")
+
+
+if __name__ == "__main__":
+    main()
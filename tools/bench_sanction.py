@@ -0,0 +1,164 @@
+"""Check and benchmark the template-stamped sanction letter against plain ReportLab rendering.
+
+1. Parity: for a few applicants the stamped page content, once inflated, must
+   equal what ReportLab draws for the same values, and every cross-reference
+   offset must point at its object.
+2. Letters/second for one letter per call, before (a fresh ReportLab canvas per
+   letter, as `create_sanction_letter` used to do) and after (template).
+3. Bulk mode: `create_sanction_letters` in one process and across `--workers`
+   processes, and regenerating letters that already exist. Files and the
+   letter index go to a temporary directory; "after" includes the index write.
+
+    python tools/bench_sanction.py --letters 2000 --workers 2
+"""
+import argparse
+import io
+import os
+import re
+import sys
+import tempfile
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_results import write_results
+
+APPLICANTS = [
+    dict(name="Rahul Sharma", amount=300000, tenure=24, salary=50000, preapproved_limit=300000, credit_score=750, annual_rate=12.0),
+    dict(name="Guest (Tester) \\ O'Neil", amount=200000, tenure=36, salary=40000, preapproved_limit=240000, credit_score=760, guest_id="guest-1700000000", annual_rate=11.5),
+    dict(name="Legacy Caller", amount=150000, tenure=12),
+]
+
+
+def content_stream(pdf):
+    """The page content stream, inflated if it is deflated."""
+    n = int(re.search(rb"/Contents (\d+) 0 R", pdf).group(1))
+    start = pdf.index(b"\n%d 0 obj\n" % n)
+    data = pdf.index(b"stream\n", start) + len(b"stream\n")
+    stream = pdf[data:pdf.index(b"endstream", data)]
+    return zlib.decompress(stream) if b"/FlateDecode" in pdf[start:data] else stream
+
+
+def check_xref(pdf):
+    startxref = int(pdf.rsplit(b"startxref\n", 1)[1].split()[0])
+    assert pdf.startswith(b"xref\n", startxref), "startxref does not point at the xref table"
+    lines = pdf[startxref:].split(b"trailer", 1)[0].splitlines()[2:]
+    for n, line in enumerate(lines[1:], start=1):
+        offset = int(line[:10])
+        assert pdf.startswith(b"%d 0 obj" % n, offset), f"xref entry {n} points at {pdf[offset:offset + 12]!r}"
+
+
+def reportlab_letter(letter, now, **canvas_kw):
+    """The letter drawn on a fresh ReportLab canvas, the way it was done before the template."""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+    import sanction
+
+    application = {"salary": None, "preapproved_limit": None, "credit_score": None, "guest_id": None, "annual_rate": 12.0, **letter}
+    sanction_no = sanction._sanction_no(sanction.letter_id(**application))
+    v = sanction._display_values(**application, now=now, sanction_no=sanction_no)
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf, pagesize=A4, **canvas_kw)
+    sanction._draw(c, sanction._letter_lines(v))
+    c.save()
+    return buf.getvalue()
+
+
+def parity():
+    import sanction
+
+    now = datetime(2024, 5, 1, 10, 30, 15)
+    for letter in APPLICANTS:
+        stamped = sanction.render_letter(**letter, now=now)
+        expected = reportlab_letter(letter, now, pageCompression=0, invariant=1)
+        assert content_stream(stamped) == content_stream(expected), letter["name"]
+        check_xref(stamped)
+        assert b"D:20240501103015+00'00'" in stamped
+    # non-ASCII names fall back to ReportLab's own text encoding
+    assert sanction.render_letter(**{**APPLICANTS[0], "name": "राहुल शर्मा"}, now=now).startswith(b"%PDF")
+    return len(APPLICANTS)
+
+
+def rate(fn, n):
+    fn()
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return round(n / (time.perf_counter() - t0), 1)
+
+
+def bench_single(n, out_dir):
+    import sanction
+
+    letter = APPLICANTS[0]
+    counter = iter(range(10**9))
+
+    def before():
+        # what create_sanction_letter did per call: a fresh canvas straight to a file
+        now = datetime.utcnow()
+        path = os.path.join(out_dir, f"before_{next(counter)}.pdf")
+        with open(path, "wb") as f:
+            f.write(reportlab_letter(letter, now))
+
+    def after():
+        # a new application each time; the same one would just be looked up in the index
+        sanction._write_letters(out_dir, [dict(letter, name=f"{letter['name']} {next(counter)}")])
+
+    return {"before_letters_per_s": rate(before, n), "after_letters_per_s": rate(after, n)}
+
+
+def bulk(n, workers):
+    import sanction
+
+    def batch(run):
+        return [dict(APPLICANTS[i % 2], name=f"Backfill {run} Applicant {i}") for i in range(n)]
+
+    letters = batch("one")
+    t0 = time.perf_counter()
+    sanction.create_sanction_letters(letters)
+    results = {"one_process_letters_per_s": round(n / (time.perf_counter() - t0), 1)}
+    # the same applications again: index lookups only, nothing is rendered
+    t0 = time.perf_counter()
+    sanction.create_sanction_letters(letters)
+    results["regenerate_letters_per_s"] = round(n / (time.perf_counter() - t0), 1)
+    if workers > 1:
+        letters = batch("pool")
+        chunk = max(1, n // workers)
+        with ProcessPoolExecutor(workers) as pool:
+            list(pool.map(_noop, range(workers)))  # start the workers before timing
+            t0 = time.perf_counter()
+            list(pool.map(sanction.create_sanction_letters, [letters[i:i + chunk] for i in range(0, n, chunk)]))
+        results[f"{workers}_workers_letters_per_s"] = round(n / (time.perf_counter() - t0), 1)
+    return results
+
+
+def _noop(_):
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--letters", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--json", help="results file (default: bench_results/sanction-<time>.json)")
+    parser.add_argument("--no-json", action="store_true", help="print only")
+    args = parser.parse_args()
+
+    print(f"parity: {parity()} applicants match ReportLab output")
+    with tempfile.TemporaryDirectory() as out_dir:
+        os.environ["STORAGE_DB"] = os.path.join(out_dir, "bench.db")
+        os.environ["GENERATED_DIR"] = out_dir
+        single = bench_single(args.letters, out_dir)
+        print(f"single letter: before {single['before_letters_per_s']:.0f}/s, after {single['after_letters_per_s']:.0f}/s "
+              f"({single['after_letters_per_s'] / single['before_letters_per_s']:.1f}x)")
+        many = bulk(args.letters, args.workers)
+        print("bulk:", ", ".join(f"{k.replace('_letters_per_s', '')} {v:.0f}/s" for k, v in many.items()))
+    if not args.no_json:
+        print("\nresults:", write_results("sanction", vars(args), {"single": single, "bulk": many}, args.json))
+
+
+if __name__ == "__main__":
+    main()
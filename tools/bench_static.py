@@ -0,0 +1,150 @@
+"""Check and time static delivery (`static_assets.py`) through the ASGI app.
+
+- correctness: `/` in gzip (and brotli, if installed) decodes to `static/index.html`;
+  a matching If-None-Match gets an empty 304; a sanction letter answers a Range
+  request with 206 and the right bytes, an unsatisfiable one with 416, and a
+  conditional GET with 304;
+- throughput of `GET /` with `--concurrency` requests in flight: the previous
+  handler (reads the file on every request, registered here as `/disk`), the
+  in-memory page uncompressed, gzip, and a revalidation answered 304.
+
+    python tools/bench_static.py [--requests 5000] [--concurrency 32]
+"""
+import argparse
+import asyncio
+import gzip
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+from bench_results import write_results
+
+
+async def check(client, root):
+    import sanction
+    import static_assets
+
+    problems = []
+    with open(os.path.join(root, "static", "index.html"), "rb") as f:
+        page = f.read()
+    plain = await client.get("/", headers={"Accept-Encoding": "identity"})
+    if plain.content != page or "content-encoding" in plain.headers:
+        problems.append("identity body")
+    encodings = ["gzip"] + (["br"] if static_assets.BROTLI_AVAILABLE else [])
+    for encoding in encodings:
+        # httpx decodes the body
+        reply = await client.get("/", headers={"Accept-Encoding": encoding})
+        if reply.headers.get("content-encoding") != encoding or reply.content != page:
+            problems.append(f"{encoding} body")
+    raw = static_assets.get("index.html").variants["gzip"][0]
+    if gzip.decompress(raw) != page:
+        problems.append("gzip variant")
+    for etag in (plain.headers["etag"], f'W/{plain.headers["etag"]}'):
+        cached = await client.get("/", headers={"If-None-Match": etag, "Accept-Encoding": "gzip"})
+        if cached.status_code != 304 or cached.content:
+            problems.append(f"304 for {etag}")
+    if (await client.get("/", headers={"If-None-Match": '"stale"'})).status_code != 200:
+        problems.append("stale etag")
+    if (await client.get("/static/missing.js")).status_code != 404:
+        problems.append("missing asset")
+
+    name = os.path.basename(sanction.create_sanction_letter("Range Check", 200000, 24, 50000, 300000, 780))
+    with open(sanction.letter_file(name), "rb") as f:
+        pdf = f.read()
+    full = await client.get(f"/generated/{name}")
+    part = await client.get(f"/generated/{name}", headers={"Range": "bytes=100-199"})
+    tail = await client.get(f"/generated/{name}", headers={"Range": "bytes=-50"})
+    if full.content != pdf or full.headers.get("accept-ranges") != "bytes":
+        problems.append("pdf body")
+    if part.status_code != 206 or part.content != pdf[100:200] or part.headers["content-range"] != f"bytes 100-199/{len(pdf)}":
+        problems.append("pdf range")
+    if tail.status_code != 206 or tail.content != pdf[-50:]:
+        problems.append("pdf suffix range")
+    if (await client.get(f"/generated/{name}", headers={"Range": f"bytes={len(pdf)}-"})).status_code != 416:
+        problems.append("pdf 416")
+    if (await client.get(f"/generated/{name}", headers={"If-None-Match": full.headers["etag"]})).status_code != 304:
+        problems.append("pdf 304 (etag)")
+    if (await client.get(f"/generated/{name}", headers={"If-Modified-Since": full.headers["last-modified"]})).status_code != 304:
+        problems.append("pdf 304 (date)")
+    return {"page_bytes": len(page), "gzip_bytes": len(raw), "letter_bytes": len(pdf), "problems": problems}
+
+
+async def throughput(client, path, headers, requests, concurrency):
+    """Requests per second for `requests` GETs of `path`, `concurrency` at a time."""
+    remaining = iter(range(requests))
+    size = 0
+
+    async def worker():
+        nonlocal size
+        for _ in remaining:
+            reply = await client.get(path, headers=headers)
+            assert reply.status_code in (200, 304), reply.status_code
+            size = reply.num_bytes_downloaded
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {"req_per_s": round(requests / elapsed, 1), "response_bytes": size}
+
+
+async def run(args):
+    import main
+    from fastapi.responses import HTMLResponse
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    @main.app.get("/disk", response_class=HTMLResponse)
+    def disk_home():
+        # the handler `/` had before: read the file on every request
+        with open(os.path.join(root, "static", "index.html"), "r", encoding="utf-8") as f:
+            return f.read()
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.lifespan(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            checked = await check(client, root)
+            etag = (await client.get("/")).headers["etag"]
+            cases = {
+                "disk": ("/disk", {"Accept-Encoding": "identity"}),
+                "memory": ("/", {"Accept-Encoding": "identity"}),
+                "memory_gzip": ("/", {"Accept-Encoding": "gzip, deflate"}),
+                "not_modified": ("/", {"Accept-Encoding": "gzip", "If-None-Match": etag}),
+            }
+            results = {}
+            for name, (path, headers) in cases.items():
+                await throughput(client, path, headers, min(200, args.requests), args.concurrency)  # warm-up
+                results[name] = await throughput(client, path, headers, args.requests, args.concurrency)
+    return checked, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--json", help="results file (default: bench_results/static-<time>.json)")
+    parser.add_argument("--no-json", action="store_true", help="print only")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.update(STORAGE_DB=os.path.join(tmp, "bench.db"), GENERATED_DIR=os.path.join(tmp, "generated"),
+                          EVENT_LOG="off", WARMUP="0")
+        checked, results = asyncio.run(run(args))
+
+    print(f"check: page {checked['page_bytes']:,} B, gzip {checked['gzip_bytes']:,} B, "
+          f"letter {checked['letter_bytes']:,} B, problems: {', '.join(checked['problems']) or 'none'}\n")
+    print(f"{'GET /':<16}{'req/s':>12}{'bytes':>10}")
+    for name, r in results.items():
+        print(f"{name:<16}{r['req_per_s']:>12.1f}{r['response_bytes']:>10,}")
+    results["check"] = checked
+    if not args.no_json:
+        print("\nresults:", write_results("static", vars(args), results, args.json))
+    sys.exit(1 if checked["problems"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Time to first token: `/chat` vs `/chat/stream` against the fake OpenAI server.
+
+Starts `tools/fake_openai_server.py` and the app (uvicorn on a local port, so the
+response really streams), walks a session to the post-decision chat and asks the
+same question through both endpoints. Usage:
+
+    python tools/bench_stream.py --questions 10 --first-token-ms 300 --token-ms 40
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+QUESTION = "how does the interest work?"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def ask_plain(client, sid):
+    t0 = time.perf_counter()
+    resp = client.post("/chat", json={"message": QUESTION, "session_id": sid})
+    resp.raise_for_status()
+    # nothing can be shown until the whole reply has arrived
+    elapsed = time.perf_counter() - t0
+    return elapsed, elapsed
+
+
+def ask_stream(client, sid):
+    t0 = time.perf_counter()
+    first = None
+    event = None
+    with client.stream("POST", "/chat/stream", json={"message": QUESTION, "session_id": sid}) as resp:
+        resp.raise_for_status()
+        for line in resp.iter_lines():
+            if line.startswith("event: "):
+                event = line[7:]
+            elif line.startswith("data: ") and event == "token" and first is None:
+                if json.loads(line[6:])["text"]:
+                    first = time.perf_counter() - t0
+    return first, time.perf_counter() - t0
+
+
+def report(name, samples):
+    ttft = [s[0] * 1000 for s in samples]
+    total = [s[1] * 1000 for s in samples]
+    print(f"{name:<13} ttft p50={percentile(ttft, 50):7.1f}ms p95={percentile(ttft, 95):7.1f}ms   "
+          f"total p50={percentile(total, 50):7.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--first-token-ms", type=float, default=300)
+    parser.add_argument("--token-ms", type=float, default=40)
+    args = parser.parse_args()
+
+    import fake_openai_server
+
+    fake = fake_openai_server.start_in_thread(first_token_ms=args.first_token_ms, token_ms=args.token_ms)
+    os.environ["OPENAI_API_KEY"] = "test"
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{fake.server_port}/v1"
+    # every question must reach the fake server, not the reply cache
+    os.environ["LLM_CACHE_MAX_ENTRIES"] = "0"
+    os.environ.setdefault("STORAGE_DB", os.path.join(tempfile.mkdtemp(), "bench_stream.db"))
+
+    import httpx
+    import uvicorn
+    import main as app_main
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app_main.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=60) as client:
+            sid = "bench-stream"
+            # a rejection keeps the demo free of sanction letters and lands in POST mode
+            for message in ("", "9999999999", "100000", "12"):
+                client.post("/chat", json={"message": message, "session_id": sid}).raise_for_status()
+            plain = [ask_plain(client, sid) for _ in range(args.questions)]
+            streamed = [ask_stream(client, sid) for _ in range(args.questions)]
+    finally:
+        server.should_exit = True
+        fake.shutdown()
+
+    print(f"fake LLM: first token {args.first_token_ms:.0f}ms, then {args.token_ms:.0f}ms/token; "
+          f"{args.questions} questions per endpoint")
+    report("/chat", plain)
+    report("/chat/stream", streamed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Parity check and benchmark for the vectorized underwriting engine.
+
+Generates random portfolios, checks that `rules_batch.evaluate_loans` agrees with
+the scalar `rules.evaluate_loan` row by row (decision, amortized EMI and reason), then times
+both at 1M rows. Any mismatch is printed and the script exits 1, with or without `python -O`.
+Usage:
+
+    python tools/bench_underwriting_batch.py [rows]
+    python tools/bench_underwriting_batch.py --check-only
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rules import evaluate_loan, DECISIONS  # noqa: E402
+from rules_batch import evaluate_loans  # noqa: E402
+
+
+def portfolio(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    preapproved = rng.integers(0, 20, rows) * 50_000
+    return (
+        rng.integers(550, 850, rows),
+        # amounts around the 1x / 2x limits so every branch is exercised
+        (preapproved * rng.choice([0.5, 1, 1.5, 2, 2.5], rows)).astype(np.int64) + rng.integers(0, 2, rows),
+        preapproved,
+        rng.choice([0, 20_000, 40_000, 60_000, 100_000], rows),
+        rng.choice([6, 12, 24, 36, 60], rows),
+    )
+
+
+def check_parity(columns):
+    """(rows checked, [(row, field, scalar value, batch value)] for every mismatch)."""
+    result = evaluate_loans(*columns[:4], tenure=columns[4])
+    mismatches = []
+    for i, row in enumerate(zip(*(c.tolist() for c in columns))):
+        decision, reason, details = evaluate_loan(*row)
+        if DECISIONS[result.codes[i]] != decision:
+            mismatches.append((row, "decision", decision, DECISIONS[result.codes[i]]))
+        if result.reasons[i] != reason:
+            mismatches.append((row, "reason", reason, result.reasons[i]))
+        if "emi" in details and not np.isclose(result.emi[i], details["emi"], rtol=1e-12):
+            mismatches.append((row, "emi", details["emi"], float(result.emi[i])))
+    return len(result), mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("rows", nargs="?", type=int, default=1_000_000, help="rows to time")
+    parser.add_argument("--check-only", action="store_true", help="run the parity check only")
+    args = parser.parse_args()
+    rows = args.rows
+
+    checked, mismatches = check_parity(portfolio(100_000, seed=1))
+    if mismatches:
+        print(f"parity: {len(mismatches):,} mismatches in {checked:,} rows (row, field, scalar, batch):")
+        for mismatch in mismatches[:20]:
+            print(f"  {mismatch}")
+        sys.exit(1)
+    print(f"parity: {checked:,} rows match the scalar evaluate_loan")
+    if args.check_only:
+        return
+
+    columns = portfolio(rows)
+    t0 = time.perf_counter()
+    result = evaluate_loans(*columns[:4], tenure=columns[4])
+    vec = time.perf_counter() - t0
+
+    lists = [c.tolist() for c in columns]
+    t0 = time.perf_counter()
+    for row in zip(*lists):
+        evaluate_loan(*row)
+    scalar = time.perf_counter() - t0
+
+    approved = int(result.approved.sum())
+    print(f"rows={rows:,} approved={approved:,}")
+    print(f"vectorized: {vec * 1000:.1f} ms ({rows / vec / 1e6:.1f} M rows/s)")
+    print(f"scalar:     {scalar * 1000:.1f} ms ({rows / scalar / 1e6:.2f} M rows/s)")
+    print(f"speedup:    {scalar / vec:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""A local stand-in for the OpenAI chat completions API, for testing without a key.
+
+Serves `POST /v1/chat/completions` in the OpenAI wire format, both plain and
+`stream: true` (server-sent `chat.completion.chunk` events ending in `[DONE]`).
+The reply is a fixed sentence sent one word per chunk, with a configurable delay
+before the first token and between tokens. Faults can be injected: a fraction of
+requests answered with an error status (`--error-rate`, `--error-status`) and
+extra random latency (`--jitter-ms`). Point the app at it with:
+
+    python tools/fake_openai_server.py --port 8100 --first-token-ms 300 --token-ms 40
+    OPENAI_API_KEY=test OPENAI_BASE_URL=http://127.0.0.1:8100/v1 uvicorn main:app
+
+`POST /control` with a JSON object updates the settings of a running server
+(e.g. `{"error_rate": 1.0}` for an outage) and `GET /control` returns them with
+the request count.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLY = (
+    "Your EMI is the fixed monthly amount that repays the loan with interest over the tenure. "
+    "A longer tenure lowers the EMI but increases the total interest you pay. "
+    "Type 'schedule' to see your month-by-month payments."
+)
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    server_version = "FakeOpenAI/1.0"
+    protocol_version = "HTTP/1.1"
+    # headers and body go out in separate writes; don't let delayed ACKs add ~40ms
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except (BrokenPipeError, ConnectionResetError):
+            # the client gave up (timeouts are part of the fault injection)
+            pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/control":
+            self._send_json(200, self.server.settings)
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        settings = self.server.settings
+        if self.path.rstrip("/") == "/control":
+            settings.update({k: v for k, v in request.items() if k in settings and k != "requests"})
+            self._send_json(200, settings)
+            return
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+        model = request.get("model", "fake")
+        settings["requests"] += 1
+        words = REPLY.split(" ")
+        time.sleep((settings["first_token_ms"] + random.uniform(0, settings["jitter_ms"])) / 1000)
+        if random.random() < settings["error_rate"]:
+            status = settings["error_status"]
+            self._send_json(status, {"error": {"message": f"injected error {status}", "type": "server_error"}})
+            return
+
+        if not request.get("stream"):
+            time.sleep(settings["token_ms"] * (len(words) - 1) / 1000)
+            self._send_json(200, {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": REPLY}, "finish_reason": "stop"}],
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for i, word in enumerate(words):
+            if i:
+                time.sleep(settings["token_ms"] / 1000)
+            chunk = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word}, "finish_reason": None}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+
+def make_server(port=0, first_token_ms=300, token_ms=40, error_rate=0.0, error_status=500, jitter_ms=0):
+    """Create (but don't start) the server; port 0 picks a free port (see `server.server_port`)."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeOpenAIHandler)
+    server.daemon_threads = True
+    server.settings = {
+        "first_token_ms": first_token_ms,
+        "token_ms": token_ms,
+        "error_rate": error_rate,
+        "error_status": error_status,
+        "jitter_ms": jitter_ms,
+        "requests": 0,
+    }
+    return server
+
+
+def start_in_thread(**kwargs):
+    """Start a server on a background thread and return it; call `shutdown()` when done."""
+    server = make_server(**kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--first-token-ms", type=float, default=300, help="delay before the first token")
+    parser.add_argument("--token-ms", type=float, default=40, help="delay between tokens")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=500, help="HTTP status of injected failures")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="extra random latency before the first token")
+    args = parser.parse_args()
+    server = make_server(args.port, args.first_token_ms, args.token_ms, args.error_rate, args.error_status, args.jitter_ms)
+    print(f"fake OpenAI API on http://127.0.0.1:{server.server_port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
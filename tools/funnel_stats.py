@@ -0,0 +1,98 @@
+"""Funnel statistics from the conversation event log (`eventlog.py`).
+
+Streams the events once, keeping a few fields per session, and reports how many
+conversations reached each step, PHONE -> APPROVED conversion, where the ones
+that did not finish stopped, and how often each step rejected its input.
+
+    python tools/funnel_stats.py                 # ./events
+    python tools/funnel_stats.py events/ /var/log/loanbot/events-000012.log.gz --json funnel.json
+"""
+import argparse
+import json
+import os
+import sys
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import eventlog
+
+FUNNEL = ["START", "PHONE", "LOAN_AMOUNT", "TENURE", "APPROVED"]
+GUEST_FUNNEL = ["GUEST_NAME", "GUEST_SALARY", "GUEST_CREDIT_SCORE", "ASSOC_PHONE"]
+
+
+def funnel(paths):
+    # session id -> [steps reached, last step, decision]
+    sessions = {}
+    invalid = Counter()
+    events = 0
+    for event in eventlog.read_events(paths):
+        events += 1
+        state = sessions.get(event["s"])
+        if state is None:
+            state = sessions[event["s"]] = [set(), None, None]
+        step = event["step"]
+        state[0].add(step)
+        if event.get("ok") == 0:
+            invalid[step] += 1
+        to = event.get("to")
+        if to:
+            state[0].add(to)
+        state[1] = to or step
+        if event.get("decision"):
+            state[2] = event["decision"]
+            state[0].add(event["decision"])
+
+    reached = Counter()
+    last = Counter()
+    decisions = Counter()
+    for steps, last_step, decision in sessions.values():
+        reached.update(steps)
+        if decision:
+            decisions[decision] += 1
+        else:
+            last[last_step] += 1
+    phone = reached["PHONE"]
+    return {
+        "events": events,
+        "sessions": len(sessions),
+        "funnel": {step: reached[step] for step in FUNNEL},
+        "guest": {step: reached[step] for step in GUEST_FUNNEL},
+        "decisions": dict(decisions),
+        "phone_to_approved": round(reached["APPROVED"] / phone, 4) if phone else None,
+        "dropped_at": dict(last.most_common()),
+        "invalid_inputs": dict(invalid.most_common()),
+    }
+
+
+def report(stats):
+    print(f"{stats['events']:,} events, {stats['sessions']:,} conversations\n")
+    top = stats["funnel"]["START"] or stats["sessions"] or 1
+    for name, counts in (("funnel", stats["funnel"]), ("guest onboarding", stats["guest"])):
+        print(name)
+        for step, n in counts.items():
+            print(f"  {step:<20}{n:>10,}{n / top:>9.1%}")
+    conversion = stats["phone_to_approved"]
+    print(f"\nPHONE -> APPROVED: {conversion:.1%}" if conversion is not None else "\nPHONE -> APPROVED: n/a")
+    print("decisions: " + (", ".join(f"{k} {v:,}" for k, v in stats["decisions"].items()) or "none"))
+    for title, counts in (("no decision, last step", stats["dropped_at"]), ("invalid inputs", stats["invalid_inputs"])):
+        print(f"\n{title}" + ("" if counts else ": none"))
+        for step, n in counts.items():
+            print(f"  {step:<20}{n:>10,}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="*", help=f"log directories or segment files (default: {eventlog.LOG_DIR})")
+    parser.add_argument("--json", help="also write the statistics to this file")
+    args = parser.parse_args()
+
+    stats = funnel(args.paths or [eventlog.LOG_DIR])
+    report(stats)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(stats, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Import pre-approved customers from a CSV or JSONL file (optionally gzipped).
+
+Streams the file in batches into the customer store (see `importer.py`),
+printing progress and throughput. Interrupt it at any point and run the same
+command again to resume after the last committed batch.
+
+    python tools/import_customers.py drop.csv
+    python tools/import_customers.py drop.jsonl.gz --rejects rejects.jsonl --batch 10000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="default: from the file extension")
+    parser.add_argument("--batch", type=int, help="rows per transaction (default IMPORT_BATCH_ROWS or 5000)")
+    parser.add_argument("--rejects", help="write rejected rows here, one JSON object per line")
+    parser.add_argument("--restart", action="store_true", help="ignore an earlier checkpoint for this file")
+    args = parser.parse_args()
+
+    import importer
+
+    last = [0.0]
+
+    def progress(stats):
+        now = time.monotonic()
+        if now - last[0] < 1 and not stats["done"]:
+            return
+        last[0] = now
+        print(f"{stats['rows']:>12,} rows  {stats['imported']:>12,} imported  {stats['rejected']:>8,} rejected  "
+              f"{stats['offset'] / 1e6:>10.1f} MB read  {stats['rows_per_s']:>10,.0f} rows/s", file=sys.stderr)
+
+    rejects = open(args.rejects, "a", encoding="utf-8") if args.rejects else None
+    try:
+        result = importer.import_file(args.path, fmt=args.format, batch_rows=args.batch, progress=progress,
+                                      rejects=rejects, restart=args.restart)
+    except importer.ImportFormatError as e:
+        sys.exit(str(e))
+    finally:
+        if rejects:
+            rejects.close()
+    if result.get("already_done"):
+        print(f"{args.path} was already imported (use --restart to import it again)")
+        return
+    how = "resumed: " if result["resumed"] else ""
+    print(f"{how}{result['imported']:,} customers imported, {result['rejected']:,} rejected "
+          f"of {result['rows']:,} rows in {result['elapsed_s']:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
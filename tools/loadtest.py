@@ -0,0 +1,234 @@
+"""Drive simulated conversations through `/chat` and report throughput and per-step latency.
+
+The conversation mix covers every path through the flow: each customer in
+`data.CUSTOMERS` applying for their pre-approved limit (approval with a sanction
+PDF, or rejection), guest onboarding that is approved or rejected, then `why`,
+`schedule` and free-form POST questions answered by a stubbed LLM.
+
+By default the app is loaded in-process (httpx ASGI transport) against a throwaway
+database, with stub LLM clients sleeping `--llm-ms` per call; this mode also
+samples the size of `SESSIONS` after every round and waits for queued sanction
+letters to finish. Pass `--url` to target a running server instead (its own LLM
+settings apply). Results are printed and written as JSON (see `bench_results.py`);
+compare two runs with `tools/bench_compare.py`.
+
+    python tools/loadtest.py --sessions 50 --rounds 40        # 2,000 conversations
+    python tools/loadtest.py --url http://127.0.0.1:8000 --sessions 200
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_results import deep_size, latency_summary, rss_bytes, write_results
+
+POST_QUESTIONS = ["what is my emi", "how does interest work", "can I prepay", "what documents do I need"]
+
+
+def registered_script(phone, customer, n):
+    return [
+        ("START", ""),
+        ("PHONE", phone),
+        ("LOAN_AMOUNT", str(customer["preapproved_limit"])),
+        ("TENURE", "24"),
+        ("WHY", "why"),
+        ("POST", "schedule"),
+        ("POST", POST_QUESTIONS[n % len(POST_QUESTIONS)]),
+    ]
+
+
+def guest_script(credit_score, n):
+    return [
+        ("START", ""),
+        ("PHONE", "guest"),
+        ("GUEST_NAME", f"Load Tester {n}"),
+        ("GUEST_SALARY", "40000"),
+        ("GUEST_CREDIT_SCORE", str(credit_score)),
+        ("LOAN_AMOUNT", "200000"),
+        ("TENURE", "24"),
+        ("WHY", "why"),
+        ("POST", POST_QUESTIONS[n % len(POST_QUESTIONS)]),
+    ]
+
+
+def conversation(n):
+    """The n-th scripted conversation: registered customers first, then approved and rejected guests."""
+    from data import CUSTOMERS
+
+    kinds = [("registered", phone) for phone in CUSTOMERS] + [("guest", 760), ("guest", 600)]
+    kind, arg = kinds[n % len(kinds)]
+    if kind == "registered":
+        return kind, registered_script(arg, CUSTOMERS[arg], n)
+    return kind, guest_script(arg, n)
+
+
+class StubCompletions:
+    """Async stand-in for `client.chat.completions` that sleeps `latency` seconds per call."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+
+    async def create(self, model, messages, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        text = f"Stub answer to: {messages[-1]['content']}"
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+
+async def run_session(client, sid, kind, script, turns, outcomes):
+    for step, message in script:
+        t0 = time.perf_counter()
+        resp = await client.post("/chat", json={"message": message, "session_id": sid})
+        resp.raise_for_status()
+        turns[step].append(time.perf_counter() - t0)
+        if step == "TENURE":
+            data = resp.json()
+            approved = bool(data.get("sanction_job") or data.get("file"))
+            outcomes[f"{kind}_{'approved' if approved else 'rejected'}"] += 1
+
+
+def session_memory(store):
+    sample = {"sessions": len(store), "rss_bytes": rss_bytes()}
+    data = getattr(store, "_data", None)
+    if data is not None:
+        # in-memory store: bytes held by the session dicts themselves
+        sample["session_bytes"] = deep_size(data)
+    return sample
+
+
+async def wait_for_sanctions(timeout):
+    import sanction_queue
+
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < timeout:
+        pending = [j for j in sanction_queue.JOBS.values() if j["status"] in ("queued", "running")]
+        if not pending:
+            break
+        await asyncio.sleep(0.1)
+    statuses = Counter(j["status"] for j in sanction_queue.JOBS.values())
+    return {"jobs": dict(statuses), "drain_ms": round((time.perf_counter() - t0) * 1000, 1)}
+
+
+async def drive(client, args, store=None):
+    turns = defaultdict(list)
+    outcomes = Counter()
+    memory = [dict(conversations=0, **session_memory(store))] if store is not None else []
+    n = 0
+    t0 = time.perf_counter()
+    for rnd in range(args.rounds):
+        batch = []
+        for i in range(args.sessions):
+            kind, script = conversation(n)
+            batch.append(run_session(client, f"load-{rnd}-{i}", kind, script, turns, outcomes))
+            n += 1
+        await asyncio.gather(*batch)
+        if store is not None:
+            memory.append(dict(conversations=n, **session_memory(store)))
+    elapsed = time.perf_counter() - t0
+
+    all_turns = [s for samples in turns.values() for s in samples]
+    results = {
+        "conversations": n,
+        "requests": len(all_turns),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_req_per_s": round(len(all_turns) / elapsed, 1),
+        "conversations_per_s": round(n / elapsed, 1),
+        "latency": latency_summary(all_turns),
+        "steps": {step: latency_summary(samples) for step, samples in sorted(turns.items())},
+        "outcomes": dict(outcomes),
+    }
+    if memory:
+        first, last = memory[0], memory[-1]
+        growth = {
+            "sessions_added": last["sessions"] - first["sessions"],
+            "rss_growth_bytes": last["rss_bytes"] - first["rss_bytes"],
+        }
+        if "session_bytes" in last:
+            growth["session_store_growth_bytes"] = last["session_bytes"] - first["session_bytes"]
+            if growth["sessions_added"]:
+                growth["per_session_bytes"] = round(growth["session_store_growth_bytes"] / growth["sessions_added"], 1)
+        results["memory"] = {"growth": growth, "samples": memory}
+    return results
+
+
+async def run(args):
+    import httpx
+
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=60) as client:
+            return await drive(client, args)
+
+    import llm
+    import main
+
+    stub = StubCompletions(args.llm_ms / 1000)
+    llm.set_clients(async_client=SimpleNamespace(chat=SimpleNamespace(completions=stub)))
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.lifespan(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=60) as client:
+            # measure the warm app, not the background warm-up (see tools/startup_time.py for cold start)
+            while (await client.get("/ready")).json()["status"] != "warm":
+                await asyncio.sleep(0.05)
+            results = await drive(client, args, main.SESSIONS)
+        results["sanction"] = await wait_for_sanctions(args.drain_timeout)
+    results["llm"] = {"upstream_calls": stub.calls, "cache": llm.cache_stats()}
+    return results
+
+
+def report(results):
+    lat = results["latency"]
+    print(f"conversations={results['conversations']} requests={results['requests']} elapsed={results['elapsed_s']:.2f}s")
+    print(f"throughput={results['throughput_req_per_s']:.1f} req/s ({results['conversations_per_s']:.1f} conversations/s)")
+    print(f"p50={lat['p50_ms']:.1f}ms p95={lat['p95_ms']:.1f}ms p99={lat['p99_ms']:.1f}ms")
+    print(f"\n{'step':<20}{'turns':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for step, s in results["steps"].items():
+        print(f"{step:<20}{s['count']:>8}{s['p50_ms']:>10.2f}{s['p95_ms']:>10.2f}{s['p99_ms']:>10.2f}")
+    print("\noutcomes:", ", ".join(f"{k}={v}" for k, v in sorted(results["outcomes"].items())))
+    if "memory" in results:
+        g = results["memory"]["growth"]
+        line = f"memory: +{g['sessions_added']} sessions, rss +{g['rss_growth_bytes'] / 1e6:.1f} MB"
+        if "per_session_bytes" in g:
+            line += f", session store +{g['session_store_growth_bytes'] / 1e6:.2f} MB ({g['per_session_bytes']:.0f} B/session)"
+        print(line)
+    if "sanction" in results:
+        print(f"sanction letters: {results['sanction']['jobs']} (drained in {results['sanction']['drain_ms']:.0f} ms)")
+    if "llm" in results:
+        cache = results["llm"]["cache"]
+        print(f"llm: {results['llm']['upstream_calls']} upstream calls, cache hit rate {cache['hit_rate']:.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="base URL of a running server (default: in-process app)")
+    parser.add_argument("--sessions", type=int, default=50, help="concurrent conversations per round")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--llm-ms", type=float, default=20, help="stub LLM latency per call (in-process only)")
+    parser.add_argument("--drain-timeout", type=float, default=120, help="seconds to wait for queued sanction letters")
+    parser.add_argument("--rate-limit", action="store_true",
+                        help="keep lookup rate limiting on (in-process only; every session shares one client IP)")
+    parser.add_argument("--json", help="results file (default: bench_results/loadtest-<time>.json)")
+    parser.add_argument("--no-json", action="store_true", help="print only")
+    args = parser.parse_args()
+
+    if not args.url:
+        # keep load-test data out of the real database
+        tmp = tempfile.mkdtemp()
+        os.environ.setdefault("STORAGE_DB", os.path.join(tmp, "loadtest.db"))
+        os.environ.setdefault("EVENT_LOG_DIR", os.path.join(tmp, "events"))
+        if not args.rate_limit:
+            os.environ.setdefault("RATE_LIMIT_BACKEND", "off")
+    results = asyncio.run(run(args))
+    report(results)
+    if not args.no_json:
+        print("\nresults:", write_results("loadtest", vars(args), results, args.json))
+
+
+if __name__ == "__main__":
+    main()
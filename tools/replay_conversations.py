@@ -0,0 +1,92 @@
+"""Replay the conversation corpus through `master_agent` and compare with the recorded replies.
+
+`tools/conversations.jsonl` holds one scripted conversation per line; each turn
+records the message, the expected reply and the step the session moves to.
+Conversations run in order against a throwaway database, so later ones can rely
+on earlier ones (e.g. a phone that was already used for an approved loan).
+`{guest_id}` in a message stands for the most recent guest id the bot handed
+out; guest ids in replies are compared as `guest-<id>`.
+
+    python tools/replay_conversations.py            # exit status 1 on any mismatch
+    python tools/replay_conversations.py --record   # rewrite expectations from the current code
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+CORPUS = os.path.join(ROOT, "tools", "conversations.jsonl")
+GUEST_ID = re.compile(r"guest-[0-9A-Za-z]+")
+
+
+def load_corpus(path=CORPUS):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+async def replay(corpus, record=False):
+    from agents import master_agent
+    import sanction_queue
+
+    last_guest_id = None
+    failures = 0
+    turns = 0
+    try:
+        for conversation in corpus:
+            session = {"step": "START"}
+            for turn in conversation["turns"]:
+                message = turn["message"]
+                if last_guest_id:
+                    message = message.replace("{guest_id}", last_guest_id)
+                reply = await master_agent(message, session)
+                ids = [g for g in GUEST_ID.findall(reply) if g != "guest-does-not-exist"]
+                if ids:
+                    last_guest_id = ids[-1]
+                actual = {"reply": GUEST_ID.sub("guest-<id>", reply), "step": session.get("step")}
+                turns += 1
+                if record:
+                    turn.update(actual)
+                    continue
+                expected = {"reply": turn.get("reply"), "step": turn.get("step")}
+                if actual != expected:
+                    failures += 1
+                    print(f"MISMATCH {conversation['name']} message={turn['message']!r}")
+                    print(f"  expected: {expected}")
+                    print(f"  actual:   {actual}")
+    finally:
+        await sanction_queue.shutdown()
+    return turns, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--record", action="store_true", help="rewrite the expected replies from the current code")
+    parser.add_argument("--corpus", default=CORPUS)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    # fresh database and generated/ folder; rule-based POST replies only
+    workdir = tempfile.mkdtemp()
+    os.makedirs(os.path.join(workdir, "generated"))
+    os.environ["STORAGE_DB"] = os.path.join(workdir, "replay.db")
+    os.environ.pop("OPENAI_API_KEY", None)
+    os.chdir(workdir)
+
+    turns, failures = asyncio.run(replay(corpus, record=args.record))
+    if args.record:
+        with open(args.corpus, "w", encoding="utf-8") as f:
+            for conversation in corpus:
+                f.write(json.dumps(conversation, ensure_ascii=False) + "\n")
+        print(f"recorded {turns} turns in {len(corpus)} conversations")
+        return
+    print(f"{len(corpus)} conversations, {turns} turns, {failures} mismatches")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
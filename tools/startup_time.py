@@ -0,0 +1,122 @@
+"""Measure cold start: import-time breakdown of `main` and time to first response.
+
+Every run is a fresh interpreter (as on a new container or serverless instance):
+
+- import time: `python -X importtime -c "import main"`, summed per top-level
+  package, heaviest first;
+- cold start: a child process imports `main`, runs the app's startup (lifespan)
+  and answers `GET /` and a first `/chat` turn through the ASGI transport, then
+  polls `GET /ready` until it reports warm. Times are from interpreter start;
+  the median of `--runs` is shown.
+
+    python tools/startup_time.py [--runs 5] [--top 12]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_results import write_results
+
+# runs in the child; prints one JSON line of milestones (ms since the interpreter started)
+CHILD = r"""
+import asyncio, json, os, sys, time
+t0 = float(sys.argv[1])
+ms = lambda: round((time.time() - t0) * 1000, 1)
+out = {"interpreter": ms()}
+import httpx
+out["httpx"] = ms()
+import main
+out["import_main"] = ms()
+
+async def run():
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.lifespan(main.app):
+        out["startup"] = ms()
+        async with httpx.AsyncClient(transport=transport, base_url="http://cold") as client:
+            assert (await client.get("/")).status_code == 200
+            out["first_response"] = ms()
+            reply = await client.post("/chat", json={"message": "", "session_id": "cold"})
+            assert reply.status_code == 200
+            out["first_chat"] = ms()
+            if "/ready" in {getattr(r, "path", None) for r in main.app.routes}:
+                for _ in range(600):
+                    ready = (await client.get("/ready")).json()
+                    if ready.get("status") == "warm":
+                        out["warm"] = ms()
+                        break
+                    await asyncio.sleep(0.01)
+
+asyncio.run(run())
+print(json.dumps(out))
+"""
+
+
+def import_breakdown(env):
+    """{top-level package: cumulative ms} for `import main`, and the total."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=ROOT, env=env,
+                          capture_output=True, text=True, check=True)
+    packages = defaultdict(float)
+    total = 0.0
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue  # header line
+        depth = (len(name) - len(name.lstrip())) // 2
+        name = name.strip()
+        us = int(cumulative)
+        if name == "main":
+            total = us / 1000
+        elif depth <= 2:
+            # the first (outermost) import of a package carries its whole cost
+            top = name.split(".")[0]
+            packages[top] = max(packages[top], us / 1000)
+    return total, dict(packages)
+
+
+def cold_start(env):
+    import time
+
+    proc = subprocess.run([sys.executable, "-c", CHILD, repr(time.time())], cwd=ROOT, env=env,
+                          capture_output=True, text=True, check=True)
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=12, help="packages to list in the import breakdown")
+    parser.add_argument("--json", help="results file (default: bench_results/startup-<time>.json)")
+    parser.add_argument("--no-json", action="store_true", help="print only")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # throwaway state, and no event log replay, so only code loading is measured
+        env = {**os.environ, "STORAGE_DB": os.path.join(tmp, "startup.db"), "EVENT_LOG": "off",
+               "GENERATED_DIR": os.path.join(tmp, "generated"), "PYTHONDONTWRITEBYTECODE": "1"}
+        import_total, packages = import_breakdown(env)
+        runs = [cold_start(env) for _ in range(args.runs)]
+
+    print(f"import main: {import_total:.0f} ms")
+    for name, ms in sorted(packages.items(), key=lambda kv: -kv[1])[:args.top]:
+        print(f"  {name:<24}{ms:>8.0f} ms")
+    milestones = {key: statistics.median(r[key] for r in runs) for key in runs[0] if all(key in r for r in runs)}
+    print(f"\ncold start, median of {args.runs} (ms since interpreter start)")
+    for key, ms in milestones.items():
+        print(f"  {key:<24}{ms:>8.0f}")
+    if not args.no_json:
+        results = {"import_main_ms": import_total, "packages_ms": packages, "cold_start_ms": milestones, "runs": runs}
+        print("\nresults:", write_results("startup", vars(args), results, args.json))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Run many guest onboarding flows in parallel processes and check nothing is lost.
+
+Each of `--workers` processes plays a uvicorn worker: it drives `--flows`
+concurrent conversations through `master_agent` (guest sign-up, then a second
+session that brings the guest id back and associates a unique phone), all
+against one throwaway SQLite database. Afterwards every flow must have its own
+guest id and its stored record, with the phone attached.
+
+`--same-worker-id` gives every process the same `WORKER_ID`, so ids do collide
+and the store has to refuse the overwrite (`storage.insert_guest`) and retry.
+The run also checks that one process hands out strictly increasing ids and
+reports how many it makes per second.
+
+    python tools/stress_guests.py --workers 4 --flows 200
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import re
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+GUEST_ID = re.compile(r"guest-[0-9A-Za-z]+")
+
+
+async def onboard(worker, n):
+    from agents import master_agent
+
+    name = f"Stress {worker}-{n}"
+    session = {"step": "START"}
+    reply = ""
+    for message in ("", "guest", name, "40000", "760"):
+        reply = await master_agent(message, session)
+    guest_id = GUEST_ID.findall(reply)[-1]
+    # come back later with the guest id and attach a phone
+    phone = f"6{worker:03d}{n:06d}"
+    session = {"step": "START"}
+    for message in ("", guest_id, phone):
+        reply = await master_agent(message, session)
+    return guest_id, name, phone, session.get("step")
+
+
+def run_worker(worker, flows):
+    async def main():
+        return await asyncio.gather(*(onboard(worker, n) for n in range(flows)))
+
+    return asyncio.run(main())
+
+
+def id_rate(count):
+    import ids
+
+    previous = ""
+    t0 = time.perf_counter()
+    for _ in range(count):
+        current = ids.new_id()
+        if current <= previous:
+            raise AssertionError(f"id {current} is not after {previous}")
+        previous = current
+    return count / (time.perf_counter() - t0)
+
+
+def check(results):
+    import storage
+
+    stored = storage.load_guests()
+    problems = []
+    seen = {}
+    for guest_id, name, phone, step in results:
+        if guest_id in seen:
+            problems.append(f"{guest_id} handed to {seen[guest_id]} and {name}")
+        seen[guest_id] = name
+        record = stored.get(guest_id)
+        if not record or record.get("name") != name:
+            problems.append(f"{guest_id}: record for {name} lost (found {record and record.get('name')!r})")
+        elif record.get("associated_phone") != phone or step != "LOAN_AMOUNT":
+            problems.append(f"{guest_id}: phone {phone} not associated (step {step})")
+    if len(stored) != len(results):
+        problems.append(f"{len(results)} flows but {len(stored)} stored guests")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4, help="processes, each with its own id generator")
+    parser.add_argument("--flows", type=int, default=200, help="concurrent onboarding flows per process")
+    parser.add_argument("--same-worker-id", action="store_true", help="force id collisions between processes")
+    parser.add_argument("--ids", type=int, default=200000, help="ids generated for the ordering / rate check")
+    args = parser.parse_args()
+
+    os.environ["STORAGE_DB"] = os.path.join(tempfile.mkdtemp(), "stress.db")
+    if args.same_worker_id:
+        os.environ["WORKER_ID"] = "7"
+
+    print(f"ids: {args.ids} strictly increasing, {id_rate(args.ids):,.0f}/s")
+    import storage
+
+    storage.load_guests()  # create the database before the workers race to
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(args.workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [pool.submit(run_worker, w, args.flows) for w in range(args.workers)]
+        results = [r for f in futures for r in f.result()]
+    elapsed = time.perf_counter() - t0
+    print(f"onboarding: {len(results)} flows in {elapsed:.2f}s ({len(results) / elapsed:.0f} flows/s)")
+
+    problems = check(results)
+    for problem in problems[:20]:
+        print("LOST", problem)
+    print(f"{len(problems)} problems")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
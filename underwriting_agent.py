@@ -1,6 +1,10 @@
+import metrics
 from rules import evaluate_loan
 
+UNDERWRITING_SECONDS = metrics.histogram("loanbot_underwriting_seconds", "Time spent running underwriting rules.", ("op",))
 
-def assess(credit_score, loan_amount, preapproved_limit, salary):
+
+@metrics.timed(UNDERWRITING_SECONDS)
+def assess(credit_score, loan_amount, preapproved_limit, salary, tenure=12):
     """Run underwriting rules and return (decision, reason, details)."""
-    return evaluate_loan(credit_score, loan_amount, preapproved_limit, salary)
+    return evaluate_loan(credit_score, loan_amount, preapproved_limit, salary, tenure)
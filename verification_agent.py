@@ -1,17 +1,19 @@
-from data import CUSTOMERS
-from storage import get_customer, add_customer
+import logging
+
+import customers
+from ids import new_id
+import storage
+
+logger = logging.getLogger(__name__)
+
+GUEST_ID_ATTEMPTS = 5
+
 
 def verify_phone(phone):
     """Return customer dict if phone exists, else None."""
-    # check built-in customers first
-    c = CUSTOMERS.get(phone)
-    if c:
-        return c
-    # then check persisted customers
-    pc = get_customer(phone)
-    if pc:
-        return pc
-    return None
+    # built-in and persisted customers, from the in-memory directory
+    customer = customers.lookup(phone)
+    return customer.to_dict() if customer else None
 
 
 def mask_customer(customer: dict):
@@ -24,28 +26,12 @@ def mask_customer(customer: dict):
 
 
 def persist_guest(guest: dict):
-    """Append a guest profile to `guests.json` and return an assigned guest_id.
+    """Store a guest profile and return its new guest_id, or None if it could not be stored.
 
     Guest dict should include at least `name`, `salary`, `credit_score`.
     """
-    import json
-    import os
     from datetime import datetime
 
-    guests_file = os.path.join(os.path.dirname(__file__), "guests.json")
-
-    # Load existing guests
-    try:
-        if os.path.exists(guests_file):
-            with open(guests_file, "r", encoding="utf-8") as f:
-                guests = json.load(f)
-        else:
-            guests = {}
-    except Exception:
-        guests = {}
-
-    # create an id and set defaults
-    guest_id = f"guest-{int(datetime.utcnow().timestamp())}"
     guest_record = {
         "name": guest.get("name"),
         "salary": guest.get("salary"),
@@ -55,86 +41,50 @@ def persist_guest(guest: dict):
         "approved": False,
         "associated_phone": None,
     }
-    guests[guest_id] = guest_record
-
-    # write back
-    try:
-        with open(guests_file, "w", encoding="utf-8") as f:
-            json.dump(guests, f, indent=2, ensure_ascii=False)
-    except Exception:
-        # best-effort persistence, ignore on failure
-        pass
 
-    return guest_id
-
-
-def _guests_file_path():
-    import os
-
-    return os.path.join(os.path.dirname(__file__), "guests.json")
+    # ids are unique per worker (see ids.py); a taken id means two workers share
+    # a worker id, so draw another rather than overwrite the other guest
+    for _ in range(GUEST_ID_ATTEMPTS):
+        guest_id = new_id("guest-")
+        try:
+            if storage.insert_guest(guest_id, guest_record):
+                return guest_id
+        except Exception:
+            logger.exception("could not store guest %s", guest_id)
+            return None
+    logger.error("no free guest id after %d attempts", GUEST_ID_ATTEMPTS)
+    return None
 
 
 def load_guests():
-    import json, os
-
-    guests_file = _guests_file_path()
-    try:
-        if os.path.exists(guests_file):
-            with open(guests_file, "r", encoding="utf-8") as f:
-                return json.load(f)
-    except Exception:
-        pass
-    return {}
+    return storage.load_guests()
 
 
 def save_guests(guests: dict):
-    import json
-    with open(_guests_file_path(), "w", encoding="utf-8") as f:
-        json.dump(guests, f, indent=2, ensure_ascii=False)
+    storage.save_guests(guests)
 
 
 def get_guest(guest_id: str):
-    guests = load_guests()
-    return guests.get(guest_id)
+    return storage.get_guest(guest_id)
 
 
 def find_guest_by_phone(phone: str):
-    guests = load_guests()
-    for gid, record in guests.items():
-        if record.get("associated_phone") == phone:
-            return gid, record
-    return None, None
+    return storage.find_guest_by_phone(phone)
 
 
 def associate_guest_phone(guest_id: str, phone: str):
-    guests = load_guests()
-    rec = guests.get(guest_id)
-    if not rec:
-        return False
-    # ensure no other guest has this phone
-    other_id, _ = find_guest_by_phone(phone)
-    if other_id and other_id != guest_id:
-        return False
-    rec["associated_phone"] = phone
-    guests[guest_id] = rec
+    # the unique phone index rejects a phone that already belongs to another guest
     try:
-        save_guests(guests)
+        return storage.update_guest(guest_id, associated_phone=phone)
     except Exception:
-        pass
-    return True
+        return False
 
 
 def mark_guest_approved(guest_id: str, phone: str = None):
-    guests = load_guests()
-    rec = guests.get(guest_id)
-    if not rec:
-        return False
-    rec["approved"] = True
+    fields = {"approved": True}
     if phone:
-        rec["associated_phone"] = phone
-    guests[guest_id] = rec
+        fields["associated_phone"] = phone
     try:
-        save_guests(guests)
+        return storage.update_guest(guest_id, **fields)
     except Exception:
-        pass
-    return True
+        return False